@@ -15,8 +15,11 @@ image = modal.Image.debian_slim(python_version="3.11").pip_install(
     "httpx>=0.28.0",
     "pydantic>=2.10.0",
     "openai>=1.50.0",
-    "google-api-python-client>=2.100.0"
-).add_local_dir("handlers", remote_path="/root/handlers")
+    "google-api-python-client>=2.100.0",
+    "numpy>=1.26.0"
+).add_local_dir("handlers", remote_path="/root/handlers")\
+ .add_local_dir("../shared", remote_path="/root/shared")\
+ .add_local_file("templates.py", remote_path="/root/templates.py")
 
 app = modal.App(name="softfawer-bots", image=image)
 
@@ -26,6 +29,9 @@ deepseek_secret = modal.Secret.from_name("deepseek-secret")
 softfawer_secret = modal.Secret.from_name("softfawer-secrets")
 secrets = [firestore_secret, deepseek_secret, softfawer_secret]
 
+# Durable spool for the outbound send queue (survives container restarts)
+outbound_spool = modal.Volume.from_name("softfawer-outbound-spool", create_if_missing=True)
+
 # --- Models ---
 class IncomingEvent(BaseModel):
     """Incoming message event from WhatsApp Gateway"""
@@ -61,31 +67,51 @@ def get_firestore_client():
     credentials = service_account.Credentials.from_service_account_info(creds_info)
     return firestore.Client(credentials=credentials, project=creds_info.get("project_id"))
 
-def check_permission(db, tenant_id: str, service_type: str) -> bool:
-    """Verify tenant has purchased/enabled this bot type."""
+def load_tenant(db, tenant_id: str) -> Optional[Dict[str, Any]]:
+    """Tenant document, or None if missing or unreadable."""
     try:
         tenant_doc = db.collection("tenants").document(tenant_id).get()
-        if not tenant_doc.exists:
-            return False
-            
-        data = tenant_doc.to_dict()
-        purchased = data.get("purchased_bots", [])
-        
-        if service_type == "rules": # Basic bot is free
-            return True
-            
-        return service_type in purchased
+        return tenant_doc.to_dict() if tenant_doc.exists else None
     except Exception as e:
-        print(f"Permission check error: {e}")
+        print(f"Tenant load error: {e}")
+        return None
+
+def check_permission(tenant: Optional[Dict[str, Any]], service_type: str) -> bool:
+    """Verify tenant has purchased/enabled this bot type."""
+    if tenant is None:
         return False
+        
+    purchased = tenant.get("purchased_bots", [])
+    
+    if service_type == "rules": # Basic bot is free
+        return True
+        
+    return service_type in purchased
 
 # --- Router Endpoint ---
+# Inputs served concurrently per container. The autoscaler aims for the work
+# scheduler's capacity (WORK_SCHEDULER_CAPACITY); bursts above it wait in the
+# scheduler instead of each holding a container of its own. Both stay above
+# LLM_CONCURRENCY (8), so LLM calls contend for admission per tenant.
+HANDLER_TARGET_INPUTS = 16
+HANDLER_MAX_INPUTS = 32
+
 @app.function(secrets=secrets, timeout=60)
+@modal.concurrent(max_inputs=HANDLER_MAX_INPUTS, target_inputs=HANDLER_TARGET_INPUTS)
 @modal.fastapi_endpoint(method="POST")
 async def handle_event(event: IncomingEvent) -> BotResponse:
     import sys
     sys.path.insert(0, "/root") # Ensure imports work in Modal
     
+    from handlers.work_scheduler import get_scheduler, Tier
+    from handlers.analytics import get_aggregator
+    from handlers.debounce import debounce_window, get_debouncer
+    from handlers import runtime_metrics
+    
+    db = None
+    service_type = "unknown"
+    outcome = "error"
+    turn = None
     try:
         db = get_firestore_client()
         
@@ -95,51 +121,100 @@ async def handle_event(event: IncomingEvent) -> BotResponse:
         service_doc = service_ref.get()
         
         if not service_doc.exists:
+            outcome = "not_found"
             return BotResponse(
                 success=False, tenantId=event.tenantId, serviceId=event.serviceId, to=event.from_,
                 error=f"Service {event.serviceId} not found"
             )
-            
+        
         service_config = service_doc.to_dict()
         service_type = service_config.get("type", "rules")
         
-        # 2. Marketplace Permission Check
-        if not check_permission(db, event.tenantId, service_type):
-            return BotResponse(
-                success=False, tenantId=event.tenantId, serviceId=event.serviceId, to=event.from_,
-                reply_text="⛔ Bot no activo en su plan.",
-                error="Access Denied"
-            )
+        # Optional per-sender debounce: rapid-fire messages become one turn,
+        # whichever container receives them (the burst lives in Firestore),
+        # and a sender's turns reply in order. Waits outside the scheduler so
+        # quiet periods don't hold capacity.
+        window = debounce_window(service_config)
+        if window:
+            turn_key = (event.tenantId, event.serviceId, event.from_)
+            turn = await get_debouncer().submit(db, turn_key, event, window)
+            if turn is None:
+                outcome = "merged"
+                return BotResponse(
+                    success=True, tenantId=event.tenantId, serviceId=event.serviceId, to=event.from_,
+                    meta={"debounced": True, "merged": True}
+                )
+            if len(turn.events) > 1:
+                last = turn.events[-1]
+                event = event.model_copy(update={"text": turn.text, "timestamp": last["timestamp"], "messageId": last["messageId"]})
+        
+        # One slot per event: caps concurrent dispatch per container and
+        # releases waiters fairly; bulk jobs size themselves to this load
+        async with get_scheduler().slot(Tier.INTERACTIVE) as queue_wait:
+            # 2. Marketplace Permission Check
+            tenant = load_tenant(db, event.tenantId)
+            if not check_permission(tenant, service_type):
+                outcome = "denied"
+                return BotResponse(
+                    success=False, tenantId=event.tenantId, serviceId=event.serviceId, to=event.from_,
+                    reply_text="⛔ Bot no activo en su plan.",
+                    error="Access Denied"
+                )
+            
+            # Tenant-wide LLM policy, plan and documents version, read by the LLM handlers
+            service_config["tenant_llm"] = tenant.get("llm") or {}
+            service_config["tenant_plan"] = tenant.get("plan")
+            service_config["tenant_documents_version"] = tenant.get("documents_version")
+            
+            # 3. Dispatch Logic
+            if service_type == "ai":
+                from handlers.ai_bot_handler import handle_ai_bot
+                result = await handle_ai_bot(event, service_config, db)
+            
+            elif service_type == "rules":
+                from handlers.rules_bot_handler import handle_rule_bot
+                result = await handle_rule_bot(event, service_config, db)
+            
+            elif service_type == "deepseek":
+                from handlers.deepseek_handler import handle_deepseek_bot
+                result = await handle_deepseek_bot(event, service_config, db)
             
-        # 3. Dispatch Logic
-        if service_type == "ai":
-            from handlers.ai_bot_handler import handle_ai_bot
-            result = await handle_ai_bot(event, service_config, db)
+            elif service_type == "scheduling":
+                from handlers.scheduling_bot import handle_scheduling_bot
+                result = await handle_scheduling_bot(event, service_config, db)
             
-        elif service_type == "rules":
-            from handlers.rules_bot_handler import handle_rule_bot
-            result = await handle_rule_bot(event, service_config, db)
+            elif service_type == "faq":
+                from handlers.faq_bot import handle_faq_bot
+                result = await handle_faq_bot(event, service_config, db)
             
-        elif service_type == "deepseek":
-            from handlers.deepseek_handler import handle_deepseek_bot
-            result = await handle_deepseek_bot(event, service_config, db)
+            elif service_type == "lead":
+                from handlers.lead_bot import handle_lead_bot
+                result = await handle_lead_bot(event, service_config, db)
             
-        # ... Add other types (scheduling, faq, etc) as needed ...
+            elif service_type == "notification":
+                from handlers.notification_bot import handle_notification_bot
+                result = await handle_notification_bot(event, service_config, db)
         
-        else:
-             return BotResponse(
-                success=False, tenantId=event.tenantId, serviceId=event.serviceId, to=event.from_,
-                error=f"Unknown type: {service_type}"
-            )
+            else:
+                 outcome = "unknown_type"
+                 return BotResponse(
+                    success=False, tenantId=event.tenantId, serviceId=event.serviceId, to=event.from_,
+                    error=f"Unknown type: {service_type}"
+                )
             
-        return BotResponse(
-            success=True,
-            reply_text=result.get("reply_text"),
-            tenantId=event.tenantId,
-            serviceId=event.serviceId,
-            to=event.from_,
-            meta=result.get("meta")
-        )
+            outcome = "ok"
+            return BotResponse(
+                success=True,
+                reply_text=result.get("reply_text"),
+                tenantId=event.tenantId,
+                serviceId=event.serviceId,
+                to=event.from_,
+                meta={
+                    **(result.get("meta") or {}),
+                    "queue_wait_ms": round(queue_wait * 1000, 1),
+                    **({"merged_messages": len(turn.events)} if turn and len(turn.events) > 1 else {})
+                }
+            )
 
     except Exception as e:
         import traceback
@@ -147,8 +222,153 @@ async def handle_event(event: IncomingEvent) -> BotResponse:
             success=False, tenantId=event.tenantId, serviceId=event.serviceId, to=event.from_,
             error=f"{str(e)}\n{traceback.format_exc()}"
         )
+    finally:
+        if turn is not None:
+            # The sender's next turn may run now
+            try:
+                await get_debouncer().release(db, turn_key, turn)
+            except Exception as e:
+                print(f"Turn release error: {e}")
+        # Counted in memory; written to rollups at most every flush interval
+        aggregator = get_aggregator()
+        aggregator.record_message(event.tenantId, service_type, outcome)
+        if db is not None:
+            try:
+                aggregator.maybe_flush(db)
+            except Exception as e:
+                print(f"Analytics flush error: {e}")
+            try:
+                runtime_metrics.maybe_publish(db, "interactive")
+            except Exception as e:
+                print(f"Runtime metrics error: {e}")
+
+# --- Scheduled Jobs ---
+@app.function(
+    secrets=secrets, timeout=300, schedule=modal.Period(minutes=1),
+    volumes={"/spool": outbound_spool}
+)
+async def dispatch_reminders():
+    """Spool 24h and 1h appointment reminders that are due in the reminder index."""
+    import os
+    import sys
+    sys.path.insert(0, "/root")
+    os.environ.setdefault("OUTBOUND_SPOOL_DIR", "/spool/outbound")
+    from handlers.reminder_dispatcher import run_reminder_tick
+    from handlers.runtime_metrics import bulk_governor
+    
+    db = get_firestore_client()
+    # Each page is committed to the volume before its index entries are deleted
+    stats = await run_reminder_tick(db, persist=outbound_spool.commit, governor=bulk_governor(db))
+    print(f"Reminders: {stats}")
+
+@app.function(secrets=secrets, timeout=3600)
+def backfill_reminders():
+    """One-time: index reminders of appointments booked before the reminder index existed."""
+    import sys
+    sys.path.insert(0, "/root")
+    from handlers.reminder_index import backfill_reminder_index
+    
+    db = get_firestore_client()
+    # Resumes from its checkpoint if interrupted; a no-op once done
+    stats = backfill_reminder_index(db)
+    print(f"Reminder backfill: {stats}")
+    return stats
+
+# The only sender of spooled messages: one container at a time, re-started
+# on schedule, handing unsent claims back to pending before it exits
+OUTBOUND_RUN_SECONDS = 540
+
+def _sync_spool():
+    outbound_spool.commit()
+    outbound_spool.reload()
+
+@app.function(
+    secrets=secrets, timeout=900, schedule=modal.Period(minutes=10), max_containers=1,
+    volumes={"/spool": outbound_spool}
+)
+async def deliver_outbound():
+    """Paced delivery of spooled outbound messages through the gateway."""
+    import os
+    import sys
+    from functools import partial
+    sys.path.insert(0, "/root")
+    os.environ.setdefault("OUTBOUND_SPOOL_DIR", "/spool/outbound")
+    from handlers.analytics import get_aggregator
+    from handlers.outbound_queue import get_outbound_queue
+    from handlers.reminder_dispatcher import mark_failed, mark_sent
+    from handlers.runtime_metrics import bulk_governor, maybe_publish, publish
+    
+    db = get_firestore_client()
+    queue = get_outbound_queue()
+    queue.on_delivered = partial(mark_sent, db)
+    queue.on_dead = partial(mark_failed, db)
+    queue.governor = bulk_governor(db)
+    
+    def sync():
+        _sync_spool()
+        # Spool depth and per-sender backlog, visible on the status endpoint
+        try:
+            maybe_publish(db, "outbound", lambda: {"outbound": queue.metrics()})
+        except Exception as e:
+            print(f"Runtime metrics error: {e}")
+    
+    stats = await queue.run(OUTBOUND_RUN_SECONDS, sync=sync)
+    get_aggregator().flush(db)
+    publish(db, "outbound", {"outbound": stats})
+    print(f"Outbound: {stats}")
+
+@app.function(secrets=secrets, timeout=900, schedule=modal.Period(hours=1))
+def sweep_conversations():
+    """Compact or delete conversation state whose flows have expired."""
+    import sys
+    sys.path.insert(0, "/root")
+    from handlers.conversation_state import sweep_expired
+    
+    db = get_firestore_client()
+    stats = sweep_expired(db)
+    print(f"Conversation sweep: {stats}")
+
+@app.function(secrets=secrets, timeout=900, schedule=modal.Period(minutes=10))
+async def rollup_platform_metrics():
+    """Merge daily counters of recently active tenants into platform-wide totals."""
+    import sys
+    sys.path.insert(0, "/root")
+    from handlers.platform_rollup import run_platform_rollup
+    from handlers.runtime_metrics import bulk_governor
+    
+    db = get_firestore_client()
+    stats = await run_platform_rollup(db, governor=bulk_governor(db))
+    print(f"Platform rollup: {stats}")
+
+@app.function(secrets=secrets, timeout=1800)
+def rescore_tenant_leads(tenant_id: str, service_id: Optional[str] = None):
+    """Re-score a tenant's leads after its lead_scoring weights change."""
+    import sys
+    sys.path.insert(0, "/root")
+    from handlers.lead_rescoring import rescore_leads
+    from handlers.runtime_metrics import bulk_governor
+    
+    db = get_firestore_client()
+    stats = rescore_leads(db, tenant_id, service_id, governor=bulk_governor(db))
+    print(f"Lead re-score {tenant_id}: {stats}")
+    return stats
 
 @app.function(secrets=secrets)
 @modal.fastapi_endpoint(method="GET")
 async def health():
     return {"status": "ok", "version": "3.0.0"}
+
+@app.function(secrets=secrets)
+@modal.fastapi_endpoint(method="GET")
+async def status():
+    """Scheduler state of every container that published in the last minutes."""
+    import sys
+    sys.path.insert(0, "/root")
+    from handlers.runtime_metrics import interactive_load, read_live
+    
+    db = get_firestore_client()
+    containers = read_live(db)
+    return {
+        "interactive_load": round(interactive_load([c for c in containers if c.get("role") == "interactive"]), 3),
+        "containers": containers
+    }
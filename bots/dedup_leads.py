@@ -0,0 +1,41 @@
+"""
+Deduplicate Leads
+One-off backfill of the lead identity index; collapses existing duplicates.
+
+Usage:
+    python dedup_leads.py demo
+    python dedup_leads.py demo --country-code 57
+"""
+
+import argparse
+import json
+from google.cloud import firestore
+from google.oauth2 import service_account
+
+from handlers.lead_identity import DEFAULT_COUNTRY_CODE, backfill_identities
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate tenant leads")
+    parser.add_argument("tenant_id")
+    parser.add_argument("--country-code", default=DEFAULT_COUNTRY_CODE,
+                        help="Country code for numbers stored without one")
+    args = parser.parse_args()
+
+    # Load credentials locally
+    with open("../firebase-service-account.json", "r") as f:
+        creds_info = json.load(f)
+
+    credentials = service_account.Credentials.from_service_account_info(creds_info)
+    db = firestore.Client(credentials=credentials, project=creds_info.get("project_id"))
+
+    print(f"Deduplicating leads of {args.tenant_id}...")
+    stats = backfill_identities(db, args.tenant_id, args.country_code)
+
+    print(f"✓ Scanned {stats['scanned']} leads")
+    print(f"  Duplicate groups: {stats['groups']}, removed: {stats['removed']}")
+    print(f"  Identity entries: {stats['identities']}")
+
+
+if __name__ == "__main__":
+    main()
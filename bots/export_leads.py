@@ -0,0 +1,62 @@
+"""
+Export Leads for CRM Sync
+Streams a tenant's leads as NDJSON or CSV, optionally since the last sync.
+
+Usage:
+    python export_leads.py demo leads.ndjson --sync hubspot
+    python export_leads.py demo hot.csv --format csv --priority HOT --since 2026-01-01
+"""
+
+import argparse
+import json
+import sys
+from google.cloud import firestore
+from google.oauth2 import service_account
+
+from handlers.lead_export import export_leads
+from handlers.runtime_metrics import bulk_governor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export tenant leads")
+    parser.add_argument("tenant_id")
+    parser.add_argument("output", help="Output file path, or '-' for stdout")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--sync", help="Incremental sync name; resumes from its checkpoint")
+    parser.add_argument("--since", help="completed_at (updated_at with --sync) >= this ISO date")
+    parser.add_argument("--until", help="completed_at (updated_at with --sync) < this ISO date")
+    parser.add_argument("--priority", choices=["HOT", "WARM", "COLD"])
+    parser.add_argument("--status")
+    args = parser.parse_args()
+
+    # Load credentials locally
+    with open("../firebase-service-account.json", "r") as f:
+        creds_info = json.load(f)
+
+    credentials = service_account.Credentials.from_service_account_info(creds_info)
+    db = firestore.Client(credentials=credentials, project=creds_info.get("project_id"))
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        result = export_leads(
+            db, args.tenant_id, out,
+            fmt=args.format,
+            sync_name=args.sync,
+            # Reads production leads: slow down while live conversations are busy
+            governor=bulk_governor(db),
+            since=args.since,
+            until=args.until,
+            priority=args.priority,
+            status=args.status
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"✓ Exported {result['exported']} leads", file=sys.stderr)
+    if result["checkpoint"]:
+        print(f"  Checkpoint: {result['checkpoint']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Analytics Rollups
+In-process metric aggregation flushed to sharded counters and hourly rollups
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import os
+import random
+import time
+
+
+# Shards per counter document; each flush increments one random shard, so
+# concurrent containers rarely write the same document
+COUNTER_SHARDS = int(os.environ.get("ANALYTICS_COUNTER_SHARDS", "8"))
+
+FLUSH_INTERVAL_SECONDS = float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", "15"))
+
+HOUR_FORMAT = "%Y%m%d%H"
+
+ALL_TIME = "all_time"
+
+
+def nest_counts(counts: Dict[str, int], wrap: Any = None) -> Dict[str, Any]:
+    """{"a.b": 1} -> {"a": {"b": wrap(1)}} so merge-sets update nested fields"""
+    nested: Dict[str, Any] = {}
+    for path, value in counts.items():
+        node = nested
+        *parents, leaf = path.split(".")
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = wrap(value) if wrap else value
+    return nested
+
+
+def _add_nested(total: Dict[str, Any], part: Dict[str, Any]) -> None:
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _add_nested(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+
+
+def _counters_ref(db: Any, tenant_id: str, name: str) -> Any:
+    return db.collection("tenants").document(tenant_id)\
+             .collection("analytics_counters").document(name)
+
+
+class MetricsAggregator:
+    """
+    Buffers counts per (tenant, hour) in memory.
+
+    Nothing touches Firestore on the request path; `flush` turns the buffer
+    into one increment per tenant-hour rollup doc plus one per sharded
+    counter (daily and all-time), however many events were recorded.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL_SECONDS, shards: int = COUNTER_SHARDS):
+        self.flush_interval = flush_interval
+        self.shards = shards
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._last_flush = time.monotonic()
+
+    def incr(self, tenant_id: str, field: str, value: int = 1, at: Optional[datetime] = None) -> None:
+        """Add to a dotted counter field (e.g. "leads.priority.HOT")"""
+        if not tenant_id or not value:
+            return
+        hour = (at or datetime.utcnow()).strftime(HOUR_FORMAT)
+        bucket = self._counts.setdefault((tenant_id, hour), {})
+        bucket[field] = bucket.get(field, 0) + value
+
+    def record_message(self, tenant_id: str, handler: str, outcome: str) -> None:
+        """One handled inbound message"""
+        self.incr(tenant_id, "messages.total")
+        self.incr(tenant_id, f"messages.handler.{handler}")
+        self.incr(tenant_id, f"messages.outcome.{outcome}")
+
+    def pending(self) -> int:
+        return len(self._counts)
+
+    def flush(self, db: Any) -> int:
+        """
+        Write buffered counts and clear the buffer.
+
+        Returns:
+            Number of tenant-hour buckets written
+        """
+        from google.cloud import firestore
+
+        counts, self._counts = self._counts, {}
+        self._last_flush = time.monotonic()
+        if not counts:
+            return 0
+
+        now = datetime.utcnow()
+        batch = db.batch()
+        writes = 0
+        for (tenant_id, hour), fields in counts.items():
+            increments = nest_counts(fields, firestore.Increment)
+            hourly_ref = db.collection("tenants").document(tenant_id)\
+                           .collection("analytics_hourly").document(hour)
+            batch.set(hourly_ref, {"hour": hour, "updated_at": now, **increments}, merge=True)
+
+            shard = str(random.randrange(self.shards))
+            for name in (hour[:8], ALL_TIME):
+                shard_ref = _counters_ref(db, tenant_id, name).collection("shards").document(shard)
+                batch.set(shard_ref, {"updated_at": now, **increments}, merge=True)
+
+            writes += 3
+            if writes >= 450:
+                batch.commit()
+                batch = db.batch()
+                writes = 0
+
+        # Lets the platform rollup visit only tenants active since its watermark,
+        # and only the days they wrote to (late flushes can touch past days)
+        days_by_tenant: Dict[str, set] = {}
+        for tenant_id, hour in counts:
+            days_by_tenant.setdefault(tenant_id, set()).add(hour[:8])
+        for tenant_id, days in days_by_tenant.items():
+            batch.set(db.collection("analytics_activity").document(tenant_id), {
+                "tenant_id": tenant_id,
+                "updated_at": now,
+                "days": {day: now for day in days}
+            }, merge=True)
+            writes += 1
+            if writes >= 450:
+                batch.commit()
+                batch = db.batch()
+                writes = 0
+
+        if writes:
+            batch.commit()
+        return len(counts)
+
+    def maybe_flush(self, db: Any) -> int:
+        """Flush if the interval has elapsed since the last flush"""
+        if time.monotonic() - self._last_flush < self.flush_interval:
+            return 0
+        return self.flush(db)
+
+
+_AGGREGATOR: Optional[MetricsAggregator] = None
+
+
+def get_aggregator() -> MetricsAggregator:
+    """Process-wide aggregator fed by handle_event and the handlers"""
+    global _AGGREGATOR
+    if _AGGREGATOR is None:
+        _AGGREGATOR = MetricsAggregator()
+    return _AGGREGATOR
+
+
+def read_counter(db: Any, tenant_id: str, name: str = ALL_TIME) -> Dict[str, Any]:
+    """
+    Sum a sharded counter.
+
+    Args:
+        db: Firestore client
+        tenant_id: Tenant ID
+        name: "all_time" or a day as YYYYMMDD
+
+    Returns:
+        Nested counts, e.g. {"messages": {"total": 120, "handler": {...}}}
+    """
+    totals: Dict[str, Any] = {}
+    for shard in _counters_ref(db, tenant_id, name).collection("shards").stream():
+        data = shard.to_dict()
+        data.pop("updated_at", None)
+        _add_nested(totals, data)
+    return totals
+
+
+def read_hourly(db: Any, tenant_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Hourly rollup docs in [start, end), oldest first"""
+    docs = db.collection("tenants").document(tenant_id)\
+             .collection("analytics_hourly")\
+             .where("hour", ">=", start.strftime(HOUR_FORMAT))\
+             .where("hour", "<", end.strftime(HOUR_FORMAT))\
+             .order_by("hour").stream()
+    return [doc.to_dict() for doc in docs]
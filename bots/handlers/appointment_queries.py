@@ -0,0 +1,123 @@
+"""
+Appointment Queries
+Indexed, cursor-paginated appointment listing shared by the bots and the dashboard
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+import base64
+import json
+import time
+
+
+PAGE_SIZE = 5
+
+# Small per-sender cache for "mis citas"; bookings and cancellations invalidate it
+CACHE_TTL_SECONDS = 120
+CACHE_MAX_ENTRIES = 1000
+
+# (tenant_id, phone, cursor) -> (cached_at, (items, next_cursor))
+_SENDER_CACHE: "OrderedDict[Tuple[str, str, Optional[str]], Tuple[float, Any]]" = OrderedDict()
+
+
+def encode_cursor(appointment: Dict[str, Any]) -> str:
+    """Opaque cursor from the last appointment of a page"""
+    raw = json.dumps([appointment.get("date"), appointment.get("time"), appointment["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Cursor values keyed by the query's order_by fields"""
+    date, time_str, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return {"date": date, "time": time_str, "__name__": doc_id}
+
+
+def list_appointments(
+    db: Any,
+    tenant_id: str,
+    phone: Optional[str] = None,
+    status: Optional[str] = "confirmed",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+    cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    List appointments ordered by date and time, one page at a time.
+
+    Served by the composite indexes in firestore.indexes.json:
+    (phone, status, date, time) for a customer's list and
+    (status, date, time) for the dashboard.
+
+    Args:
+        db: Firestore client
+        tenant_id: Tenant ID
+        phone: Only this customer's appointments (None for the whole tenant)
+        status: Appointment status filter (None for any)
+        date_from: Inclusive 'YYYY-MM-DD' lower bound
+        date_to: Inclusive 'YYYY-MM-DD' upper bound
+        limit: Page size
+        cursor: Cursor returned by the previous page
+
+    Returns:
+        Tuple of (appointments, next_cursor); next_cursor is None on the last page
+    """
+    query = db.collection("tenants").document(tenant_id).collection("appointments")
+
+    if phone:
+        query = query.where("phone", "==", phone)
+    if status:
+        query = query.where("status", "==", status)
+    if date_from:
+        query = query.where("date", ">=", date_from)
+    if date_to:
+        query = query.where("date", "<=", date_to)
+
+    query = query.order_by("date").order_by("time").order_by("__name__")
+    if cursor:
+        query = query.start_after(decode_cursor(cursor))
+
+    # One extra row tells us whether another page exists
+    docs = list(query.limit(limit + 1).stream())
+
+    items = []
+    for doc in docs[:limit]:
+        apt = doc.to_dict()
+        apt["id"] = doc.id
+        items.append(apt)
+
+    next_cursor = encode_cursor(items[-1]) if len(docs) > limit else None
+    return items, next_cursor
+
+
+def list_upcoming_for_sender(
+    db: Any,
+    tenant_id: str,
+    phone: str,
+    cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """A customer's confirmed appointments from today on, cached per sender"""
+    key = (tenant_id, phone, cursor)
+    cached = _SENDER_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < CACHE_TTL_SECONDS:
+        return cached[1]
+
+    result = list_appointments(
+        db, tenant_id,
+        phone=phone,
+        date_from=datetime.now().strftime("%Y-%m-%d"),
+        cursor=cursor
+    )
+
+    _SENDER_CACHE[key] = (time.monotonic(), result)
+    _SENDER_CACHE.move_to_end(key)
+    while len(_SENDER_CACHE) > CACHE_MAX_ENTRIES:
+        _SENDER_CACHE.popitem(last=False)
+    return result
+
+
+def invalidate_sender(tenant_id: str, phone: str) -> None:
+    """Drop cached pages for a customer after a booking or cancellation"""
+    for key in [k for k in _SENDER_CACHE if k[0] == tenant_id and k[1] == phone]:
+        _SENDER_CACHE.pop(key, None)
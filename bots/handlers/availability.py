@@ -0,0 +1,216 @@
+"""
+Availability Engine
+Per-staff slot bitmaps built from a single appointments query per date
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import time
+
+
+DEFAULT_SLOT_MINUTES = 30
+DEFAULT_HOURS = ["09:00", "18:00"]
+DEFAULT_STAFF = "General"
+
+# Seconds a day's bitmaps stay cached in this container. Bookings made here
+# invalidate immediately; the TTL bounds staleness from other containers.
+CACHE_TTL_SECONDS = 60
+
+WEEKDAY_KEYS = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+
+# (tenant_id, date, slot_minutes) -> (loaded_at, {staff: busy_bitmap})
+_DAY_CACHE: Dict[Tuple[str, str, int], Tuple[float, Dict[str, int]]] = {}
+
+
+def _to_minutes(hhmm: str) -> int:
+    """Convert 'HH:MM' to minutes since midnight"""
+    hour, minute = hhmm.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+def _to_hhmm(minutes: int) -> str:
+    """Convert minutes since midnight to 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _span_mask(start_slot: int, length: int) -> int:
+    """Bitmask covering `length` slots starting at `start_slot`"""
+    return ((1 << length) - 1) << start_slot
+
+
+def get_slot_minutes(settings: Dict[str, Any]) -> int:
+    """Slot granularity configured for the business"""
+    return int(settings.get("slot_minutes", DEFAULT_SLOT_MINUTES))
+
+
+def get_staff(settings: Dict[str, Any]) -> List[str]:
+    """Bookable resources (staff, rooms, chairs...) for the business"""
+    return settings.get("staff") or [DEFAULT_STAFF]
+
+
+def service_duration(settings: Dict[str, Any], service: Optional[str]) -> int:
+    """Duration in minutes for a service, falling back to one slot"""
+    durations = settings.get("service_durations", {})
+    default = settings.get("default_duration_min", get_slot_minutes(settings))
+    return int(durations.get(service, default))
+
+
+def get_business_hours(settings: Dict[str, Any], date: datetime) -> Optional[List[str]]:
+    """
+    Opening hours for a date as ['HH:MM', 'HH:MM'], or None when closed.
+
+    `settings.business_hours` maps Spanish weekday names to an [open, close]
+    pair. Days missing from the map are closed; without the map the business
+    is open DEFAULT_HOURS every day.
+    """
+    hours = settings.get("business_hours")
+    if hours is None:
+        return DEFAULT_HOURS
+    return hours.get(WEEKDAY_KEYS[date.weekday()]) or None
+
+
+class DayAvailability:
+    """Open hours and per-staff busy bitmaps for a single date"""
+
+    def __init__(self, slot_minutes: int, open_mask: int, busy: Dict[str, int]):
+        self.slot_minutes = slot_minutes
+        self.open_mask = open_mask
+        self.busy = busy
+
+    def _slots_for(self, duration_min: int) -> int:
+        return max(1, -(-duration_min // self.slot_minutes))
+
+    def _slot_index(self, time_str: str) -> Optional[int]:
+        minutes = _to_minutes(time_str)
+        if minutes % self.slot_minutes:
+            return None
+        return minutes // self.slot_minutes
+
+    def _is_free(self, bitmap: int, need: int) -> bool:
+        return (self.open_mask & need) == need and not (bitmap & need)
+
+    def find_staff(self, time_str: str, duration_min: int) -> Optional[str]:
+        """First staff member free for the whole duration starting at time_str"""
+        index = self._slot_index(time_str)
+        if index is None:
+            return None
+        need = _span_mask(index, self._slots_for(duration_min))
+        for staff, bitmap in self.busy.items():
+            if self._is_free(bitmap, need):
+                return staff
+        return None
+
+    def free_starts(self, duration_min: int, not_before: Optional[datetime] = None) -> List[str]:
+        """Start times where at least one staff member can take the service"""
+        length = self._slots_for(duration_min)
+        per_day = 24 * 60 // self.slot_minutes
+        first = 0
+        if not_before is not None:
+            first = -(-(not_before.hour * 60 + not_before.minute) // self.slot_minutes)
+
+        slots = []
+        for index in range(first, per_day - length + 1):
+            need = _span_mask(index, length)
+            if (self.open_mask & need) != need:
+                continue
+            if any(not (bitmap & need) for bitmap in self.busy.values()):
+                slots.append(_to_hhmm(index * self.slot_minutes))
+        return slots
+
+    def mark_busy(self, staff: str, time_str: str, duration_min: int) -> None:
+        """Reserve a span in the local bitmap (e.g. right after booking)"""
+        index = self._slot_index(time_str)
+        if index is None or staff not in self.busy:
+            return
+        self.busy[staff] |= _span_mask(index, self._slots_for(duration_min))
+
+
+def _load_busy_bitmaps(
+    db: Any,
+    tenant_id: str,
+    date_str: str,
+    slot_minutes: int,
+    staff_list: List[str],
+    default_duration: int
+) -> Dict[str, int]:
+    """Build busy bitmaps from the day's appointments with one query"""
+    busy = {staff: 0 for staff in staff_list}
+
+    query = db.collection("tenants").document(tenant_id)\
+              .collection("appointments")\
+              .where("date", "==", date_str)\
+              .select(["time", "duration_min", "staff", "status"])
+
+    for doc in query.stream():
+        apt = doc.to_dict()
+        if apt.get("status") == "cancelled" or not apt.get("time"):
+            continue
+
+        minutes = _to_minutes(apt["time"])
+        length = max(1, -(-int(apt.get("duration_min", default_duration)) // slot_minutes))
+        span = _span_mask(minutes // slot_minutes, length)
+
+        staff = apt.get("staff")
+        if staff not in busy:
+            # Legacy appointments have no staff: occupy the first free one
+            staff = next((s for s, b in busy.items() if not b & span), staff_list[0])
+        busy[staff] |= span
+
+    return busy
+
+
+def get_day_availability(
+    db: Any,
+    tenant_id: str,
+    date: datetime,
+    settings: Dict[str, Any]
+) -> DayAvailability:
+    """
+    Availability for a tenant and date, served from the per-container cache.
+
+    Args:
+        db: Firestore client
+        tenant_id: Tenant ID
+        date: Day to evaluate
+        settings: Service settings (business_hours, staff, slot_minutes, ...)
+
+    Returns:
+        DayAvailability for that date
+    """
+    slot_minutes = get_slot_minutes(settings)
+    staff_list = get_staff(settings)
+    date_str = date.strftime("%Y-%m-%d")
+
+    open_mask = 0
+    hours = get_business_hours(settings, date)
+    if hours:
+        start = _to_minutes(hours[0]) // slot_minutes
+        end = _to_minutes(hours[1]) // slot_minutes
+        if end > start:
+            open_mask = _span_mask(start, end - start)
+
+    if not open_mask:
+        return DayAvailability(slot_minutes, 0, {staff: 0 for staff in staff_list})
+
+    key = (tenant_id, date_str, slot_minutes)
+    cached = _DAY_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < CACHE_TTL_SECONDS:
+        busy = dict(cached[1])
+    else:
+        busy = _load_busy_bitmaps(
+            db, tenant_id, date_str, slot_minutes, staff_list,
+            settings.get("default_duration_min", slot_minutes)
+        )
+        _DAY_CACHE[key] = (time.monotonic(), dict(busy))
+
+    # Staff added to settings after the cache was filled start empty
+    for staff in staff_list:
+        busy.setdefault(staff, 0)
+
+    return DayAvailability(slot_minutes, open_mask, {s: busy[s] for s in staff_list})
+
+
+def invalidate_day(tenant_id: str, date_str: str) -> None:
+    """Drop cached bitmaps for a tenant's date after a booking or cancellation"""
+    for key in [k for k in _DAY_CACHE if k[0] == tenant_id and k[1] == date_str]:
+        _DAY_CACHE.pop(key, None)
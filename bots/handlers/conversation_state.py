@@ -0,0 +1,294 @@
+"""
+Conversation State
+Per-service conversation state with TTL, lazy expiry and bulk garbage collection
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+import threading
+
+
+class Flow:
+    """Bot flows that keep conversation state; values match service types"""
+    LEAD = "lead"
+    SCHEDULING = "scheduling"
+    FAQ = "faq"
+    NOTIFICATION = "notification"
+    RULES = "rules"
+
+
+# How long an untouched flow keeps its state
+FLOW_TTLS = {
+    Flow.LEAD: timedelta(hours=24),
+    Flow.SCHEDULING: timedelta(hours=2),
+    Flow.FAQ: timedelta(hours=1),
+    # Reminders go out up to 24h ahead; the customer may answer late
+    Flow.NOTIFICATION: timedelta(hours=72),
+    Flow.RULES: timedelta(hours=24),
+}
+
+# Fields owned by each flow; anything else (escalated, last_lead_id, ...)
+# is kept until the whole document is removed
+FLOW_FIELDS = {
+    Flow.LEAD: ["lead_state", "lead_data"],
+    Flow.SCHEDULING: ["scheduling_state", "pending_appointment", "appointments_cursor"],
+    Flow.FAQ: ["awaiting_feedback", "last_question"],
+    Flow.NOTIFICATION: ["pending_notification_action", "notification_context"],
+    Flow.RULES: ["state", "data"],
+}
+
+# Bookkeeping that does not keep a document alive on its own
+META_FIELDS = {"expires", "expires_at", "updated_at", "last_updated"}
+
+# Flow-independent fields of the old shared document and the flow that wrote them
+LEGACY_FIELD_OWNERS = {
+    "escalated": Flow.FAQ,
+    "escalated_at": Flow.FAQ,
+    "last_lead_id": Flow.LEAD,
+}
+
+# Subcollection of conversations/{phone} holding one document per service
+STATE_COLLECTION = "service_state"
+
+PAGE_SIZE = 500
+
+# Attempts for bulk writes that fail for reasons other than a precondition
+WRITE_ATTEMPTS = 5
+
+
+def conversation_ref(db: Any, tenant_id: str, phone: str, service_id: str) -> Any:
+    """
+    State document of one service's conversation with a customer.
+
+    tenants/{t}/conversations/{phone}/service_state/{serviceId}: each bot
+    reads and writes only its own slice, so flows never contend on, or pay
+    to read, each other's state.
+    """
+    return db.collection("tenants").document(tenant_id)\
+             .collection("conversations").document(phone)\
+             .collection(STATE_COLLECTION).document(service_id)
+
+
+def expiry_fields(flow: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Fields to merge into a write so the flow's state expires after its TTL"""
+    expires_at = (now or datetime.utcnow()) + FLOW_TTLS[flow]
+    return {"expires": {flow: expires_at}, "expires_at": expires_at}
+
+
+def _naive(ts: Any) -> Optional[datetime]:
+    # Firestore returns tz-aware timestamps; we write naive UTC
+    return ts.replace(tzinfo=None) if ts is not None else None
+
+
+def expired_flows(data: Dict[str, Any], now: datetime) -> List[str]:
+    return [
+        flow for flow, expires_at in (data.get("expires") or {}).items()
+        if flow in FLOW_FIELDS and _naive(expires_at) <= now
+    ]
+
+
+def load_state(conv_ref: Any, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Read a conversation with expired flows' fields removed.
+
+    The stored document is left as is; the sweeper compacts it later.
+    """
+    conv_doc = conv_ref.get()
+    if not conv_doc.exists:
+        return {}
+    data = conv_doc.to_dict()
+    for flow in expired_flows(data, now or datetime.utcnow()):
+        for field in FLOW_FIELDS[flow]:
+            data.pop(field, None)
+    return data
+
+
+def save_state(conv_ref: Any, flow: str, data: Dict[str, Any]) -> None:
+    """Merge a flow's state into the conversation and push back its expiry"""
+    conv_ref.set({**data, **expiry_fields(flow)}, merge=True)
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate Firestore storage size of a value, in bytes"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return 8
+
+
+def _skip_rejected(stats: Dict[str, int], code: int, counter: str):
+    """BulkWriter error handler: count writes rejected with `code` instead of retrying them"""
+    def on_error(failure) -> bool:
+        if failure.code == code:
+            stats[counter] += 1
+            return False
+        return failure.attempts < WRITE_ATTEMPTS
+    return on_error
+
+
+def sweep_expired(db: Any, now: Optional[datetime] = None, page_size: int = PAGE_SIZE) -> Dict[str, int]:
+    """
+    Compact or delete conversations whose flow state has expired.
+
+    Expired flows' fields are removed; a document left with nothing but
+    bookkeeping is deleted. All writes go through one bulk writer, each
+    conditioned on the document's update time when it was read, so a
+    conversation the customer touched meanwhile is left alone (counted
+    as skipped) and picked up by a later sweep if it expires again.
+    Deletions, compactions and bytes are counted once their write succeeds;
+    writes that fail for other reasons are counted as failed.
+
+    Returns:
+        Dict with scanned, compacted, deleted, skipped and failed documents
+        and reclaimed bytes
+    """
+    from google.cloud import firestore
+    from google.rpc import code_pb2
+
+    now = now or datetime.utcnow()
+    query = db.collection_group(STATE_COLLECTION)\
+              .where("expires_at", "<=", now)\
+              .order_by("expires_at")\
+              .order_by("__name__")
+    stats = {"scanned": 0, "compacted": 0, "deleted": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    # Document path -> (counter, bytes) of writes not yet acknowledged
+    pending: Dict[str, Tuple[str, int]] = {}
+    lock = threading.Lock()
+
+    def on_result(reference, result, bulk_writer) -> None:
+        with lock:
+            counter, size = pending.pop(reference.path)
+            stats[counter] += 1
+            stats["bytes"] += size
+
+    writer = db.bulk_writer()
+    writer.on_write_result(on_result)
+    writer.on_write_error(_skip_rejected(stats, code_pb2.FAILED_PRECONDITION, "skipped"))
+    cursor = None
+
+    while True:
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(page_size).stream())
+
+        for doc in docs:
+            data = doc.to_dict()
+            unchanged = db.write_option(last_update_time=doc.update_time)
+            expired = expired_flows(data, now)
+            removed = {field for flow in expired for field in FLOW_FIELDS[flow] if field in data}
+            remaining_expiry = {
+                flow: _naive(ts) for flow, ts in (data.get("expires") or {}).items() if flow not in expired
+            }
+            kept = set(data) - removed - META_FIELDS
+
+            if not kept and not remaining_expiry:
+                with lock:
+                    pending[doc.reference.path] = ("deleted", estimate_size(doc.reference.path) + 32 + estimate_size(data))
+                writer.delete(doc.reference, option=unchanged)
+                continue
+
+            update = {field: firestore.DELETE_FIELD for field in removed}
+            update.update({f"expires.{flow}": firestore.DELETE_FIELD for flow in expired})
+            update["expires_at"] = min(remaining_expiry.values()) if remaining_expiry else firestore.DELETE_FIELD
+            with lock:
+                pending[doc.reference.path] = ("compacted", sum(estimate_size(f) + estimate_size(data[f]) for f in removed))
+            writer.update(doc.reference, update, option=unchanged)
+
+        stats["scanned"] += len(docs)
+        if len(docs) < page_size:
+            break
+        cursor = docs[-1]
+
+    writer.close()
+    # Never acknowledged: skipped (already counted) or out of retries
+    stats["failed"] = len(pending) - stats["skipped"]
+    return stats
+
+
+def _flow_of(field: str) -> Optional[str]:
+    for flow, fields in FLOW_FIELDS.items():
+        if field in fields:
+            return flow
+    return LEGACY_FIELD_OWNERS.get(field)
+
+
+def split_conversations(db: Any, tenant_id: str, page_size: int = PAGE_SIZE) -> Dict[str, int]:
+    """
+    Move a tenant's shared conversations/{phone} documents into per-service slices.
+
+    Each field goes to the slice of every active service whose type owns it
+    (usually one), with a fresh expiry for its flow. Slices are only created:
+    one that live traffic already wrote holds newer state than the legacy
+    document and is kept as is. The old document is deleted; its
+    service_state subcollection is unaffected. Fields no service owns
+    (bookkeeping) are dropped.
+
+    Returns:
+        Dict with scanned and migrated documents, slices written and kept,
+        and bytes before/after
+    """
+    from google.rpc import code_pb2
+
+    tenant_ref = db.collection("tenants").document(tenant_id)
+    services_by_type: Dict[str, List[str]] = {}
+    for doc in tenant_ref.collection("services").stream():
+        config = doc.to_dict()
+        if config.get("active", True):
+            services_by_type.setdefault(config.get("type", "rules"), []).append(doc.id)
+
+    query = tenant_ref.collection("conversations").order_by("__name__")
+    now = datetime.utcnow()
+    stats = {"scanned": 0, "migrated": 0, "slices": 0, "kept": 0, "bytes_before": 0, "bytes_after": 0}
+    writer = db.bulk_writer()
+    # A slice created by live traffic between our read and write also wins
+    writer.on_write_error(_skip_rejected(stats, code_pb2.ALREADY_EXISTS, "kept"))
+    cursor = None
+
+    while True:
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(page_size).stream())
+
+        # One batched read of the slices this page could write
+        slice_refs = [
+            conversation_ref(db, tenant_id, doc.id, service_id)
+            for doc in docs for service_ids in services_by_type.values() for service_id in service_ids
+        ]
+        existing = {snap.reference.path for snap in db.get_all(slice_refs) if snap.exists} if slice_refs else set()
+
+        for doc in docs:
+            data = doc.to_dict()
+            if not data:
+                continue  # Already split; only the subcollection remains
+            stats["bytes_before"] += estimate_size(data)
+
+            by_flow: Dict[str, Dict[str, Any]] = {}
+            for field, value in data.items():
+                flow = _flow_of(field)
+                if flow:
+                    by_flow.setdefault(flow, {})[field] = value
+
+            for flow, fields in by_flow.items():
+                for service_id in services_by_type.get(flow, []):
+                    slice_ref = conversation_ref(db, tenant_id, doc.id, service_id)
+                    if slice_ref.path in existing:
+                        stats["kept"] += 1
+                        continue
+                    slice_data = {**fields, **expiry_fields(flow, now), "updated_at": now}
+                    writer.create(slice_ref, slice_data)
+                    stats["slices"] += 1
+                    stats["bytes_after"] += estimate_size(slice_data)
+
+            writer.delete(doc.reference)
+            stats["migrated"] += 1
+
+        stats["scanned"] += len(docs)
+        if len(docs) < page_size:
+            break
+        cursor = docs[-1]
+
+    writer.close()
+    return stats
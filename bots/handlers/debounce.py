@@ -0,0 +1,277 @@
+"""
+Message Debouncer
+Merges rapid-fire messages from one sender into a single turn
+"""
+
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from dataclasses import dataclass
+import asyncio
+import os
+import time
+import uuid
+
+
+# Default quiet period after a sender's last message; 0 disables debouncing.
+# Services override it with settings.debounce_ms.
+DEFAULT_WINDOW_MS = int(os.environ.get("BOT_DEBOUNCE_MS", "0"))
+
+# A burst is closed after this long even if the sender keeps typing
+MAX_WINDOW_MS = int(os.environ.get("BOT_DEBOUNCE_MAX_MS", "5000"))
+
+BURST_COLLECTION = "debounce"
+
+# Per-sender turn order (next/serving sequence numbers), next to the bursts
+TURN_COLLECTION = "turns"
+
+# A turn that has been serving this long (handle_event's timeout) is presumed
+# dead, and the sender's next turn goes ahead without it
+TURN_LEASE_SECONDS = 60.0
+TURN_POLL_SECONDS = 0.25
+
+
+def debounce_window(service_config: Dict[str, Any]) -> float:
+    """Debounce window for a service, in seconds (0 = off)"""
+    ms = service_config.get("settings", {}).get("debounce_ms", DEFAULT_WINDOW_MS)
+    return max(0, min(ms, MAX_WINDOW_MS)) / 1000
+
+
+@dataclass
+class Turn:
+    """Messages merged into one turn, as dicts with text, timestamp and messageId"""
+    events: List[Dict[str, Any]]
+    seq: Optional[int] = None
+
+    @property
+    def text(self) -> str:
+        return "\n".join(event["text"] for event in self.events)
+
+
+def _event_dict(event: Any) -> Dict[str, Any]:
+    return {"text": event.text, "timestamp": event.timestamp, "messageId": event.messageId}
+
+
+def close_at(burst: Dict[str, Any], window: float, max_window: float) -> float:
+    """When a burst closes: `window` after its last message, at most `max_window` after it opened"""
+    return min(burst["last_at"] + window, burst["opened_at"] + max_window)
+
+
+def add_event(
+    burst: Optional[Dict[str, Any]],
+    event: Dict[str, Any],
+    now: float,
+    window: float,
+    max_window: float
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Add a message to the sender's burst document.
+
+    Returns:
+        (burst, leads) where leads is True if the message opened a new burst
+        and its request must wait for it to close
+    """
+    if burst is not None and now < close_at(burst, window, max_window):
+        return {**burst, "events": burst["events"] + [event], "last_at": now}, False
+    # A leader deletes its burst when it takes the turn, so one still here past
+    # its close time was never answered (its request is slow or died): carry it
+    carried = burst["events"] if burst is not None else []
+    return {
+        "burst_id": uuid.uuid4().hex,
+        "events": carried + [event],
+        "opened_at": now,
+        "last_at": now
+    }, True
+
+
+def take_turn(turns: Optional[Dict[str, Any]], now: float) -> Tuple[Dict[str, Any], int]:
+    """
+    Give a closed burst the sender's next sequence number.
+
+    Returns:
+        (turns, seq); the turn may run once serving_seq reaches seq
+    """
+    turns = turns or {"next_seq": 0, "serving_seq": 0, "serving_at": now}
+    seq = turns["next_seq"]
+    turns = {**turns, "next_seq": seq + 1}
+    if turns["serving_seq"] == seq:
+        # Nothing in front: it starts serving now
+        turns["serving_at"] = now
+    return turns, seq
+
+
+def turn_ready(turns: Dict[str, Any], seq: int, now: float, lease: float) -> Tuple[Dict[str, Any], bool]:
+    """
+    Whether turn `seq` may run; skips a serving turn whose lease expired.
+
+    Returns:
+        (turns, ready)
+    """
+    if turns["serving_seq"] >= seq:
+        return turns, True
+    if now - turns["serving_at"] >= lease:
+        turns = {**turns, "serving_seq": turns["serving_seq"] + 1, "serving_at": now}
+        return turns, turns["serving_seq"] >= seq
+    return turns, False
+
+
+def finish_turn(turns: Dict[str, Any], seq: int, now: float) -> Dict[str, Any]:
+    """Let the turn after `seq` run"""
+    return {**turns, "serving_seq": max(turns["serving_seq"], seq + 1), "serving_at": now}
+
+
+class MessageDebouncer:
+    """
+    Per-sender debounce across containers.
+
+    Each sender's open burst is one Firestore document under
+    tenants/{tenant}/conversations/{phone}/debounce/{service}, updated in a
+    transaction, so messages merge whichever container serves them. The
+    first message of a burst waits until the sender has been quiet for the
+    window (capped at MAX_WINDOW_MS); messages arriving meanwhile join it
+    and return at once. The leader then deletes the document and processes
+    the burst as one turn. A burst still open after its close time has no
+    live leader, and the sender's next message carries it into a new one.
+
+    Turns of one sender run in order: closing a burst takes the sender's
+    next sequence number in the same transaction, and its leader waits until
+    the previous turn has been released (or its lease expired) before
+    returning the turn. The router releases it once the reply is built.
+    """
+
+    def __init__(
+        self,
+        max_window: float = MAX_WINDOW_MS / 1000,
+        lease: float = TURN_LEASE_SECONDS,
+        poll: float = TURN_POLL_SECONDS
+    ):
+        self.max_window = max_window
+        self.lease = lease
+        self.poll = poll
+        self.stats = {"turns": 0, "merged": 0, "waited": 0}
+
+    def _ref(self, db: Any, key: Tuple[str, str, str]) -> Any:
+        tenant_id, service_id, phone = key
+        return db.collection("tenants").document(tenant_id)\
+                 .collection("conversations").document(phone)\
+                 .collection(BURST_COLLECTION).document(service_id)
+
+    def _turns_ref(self, db: Any, key: Tuple[str, str, str]) -> Any:
+        tenant_id, service_id, phone = key
+        return db.collection("tenants").document(tenant_id)\
+                 .collection("conversations").document(phone)\
+                 .collection(TURN_COLLECTION).document(service_id)
+
+    def _transact(self, db: Any, refs: List[Any], change: Callable[[List[Any]], Tuple[List[Any], Any]]) -> Any:
+        """
+        Apply `change` to documents in one Firestore transaction.
+
+        change(docs) gets each ref's dict (None if missing) and returns
+        (docs, result); a returned None deletes the document and the same
+        object as read leaves it untouched.
+        """
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def _run(transaction) -> Any:
+            snaps = [ref.get(transaction=transaction) for ref in refs]
+            docs = [snap.to_dict() if snap.exists else None for snap in snaps]
+            updated, result = change(docs)
+            for ref, old, new in zip(refs, docs, updated):
+                if new is old:
+                    continue
+                if new is None:
+                    transaction.delete(ref)
+                else:
+                    transaction.set(ref, new)
+            return result
+
+        return _run(db.transaction())
+
+    def _join(self, db: Any, key: Tuple[str, str, str], event: Dict[str, Any], window: float) -> Tuple[Dict[str, Any], bool]:
+        def change(docs):
+            burst, leads = add_event(docs[0], event, time.time(), window, self.max_window)
+            return [burst], (burst, leads)
+
+        return self._transact(db, [self._ref(db, key)], change)
+
+    def _close(
+        self, db: Any, key: Tuple[str, str, str], burst_id: str, window: float
+    ) -> Tuple[Optional[List[Dict[str, Any]]], Optional[int], float]:
+        """
+        Returns (events, seq, 0) once the burst is closed, deleted and given
+        its turn number, else (None, None, seconds to wait)
+        """
+        def change(docs):
+            burst, turns = docs
+            if burst is None or burst["burst_id"] != burst_id:
+                # Carried into a newer burst; its leader answers
+                return docs, ([], None, 0.0)
+            now = time.time()
+            wait = close_at(burst, window, self.max_window) - now
+            if wait > 0:
+                return docs, (None, None, wait)
+            turns, seq = take_turn(turns, now)
+            return [None, turns], (burst["events"], seq, 0.0)
+
+        return self._transact(db, [self._ref(db, key), self._turns_ref(db, key)], change)
+
+    def _ready(self, db: Any, key: Tuple[str, str, str], seq: int) -> bool:
+        def change(docs):
+            turns, ready = turn_ready(docs[0], seq, time.time(), self.lease)
+            return [turns], ready
+
+        return self._transact(db, [self._turns_ref(db, key)], change)
+
+    def _finish(self, db: Any, key: Tuple[str, str, str], seq: int) -> None:
+        def change(docs):
+            return [finish_turn(docs[0], seq, time.time())], None
+
+        self._transact(db, [self._turns_ref(db, key)], change)
+
+    async def submit(self, db: Any, key: Tuple[str, str, str], event: Any, window: float) -> Optional[Turn]:
+        """
+        Add a message to its sender's burst.
+
+        Returns:
+            The merged turn for the message that opened the burst, once the
+            sender's previous turn is done, or None if the message joined a
+            burst whose turn is handled by another request
+        """
+        burst, leads = await asyncio.to_thread(self._join, db, key, _event_dict(event), window)
+        if not leads:
+            self.stats["merged"] += 1
+            return None
+
+        wait = window
+        while True:
+            await asyncio.sleep(wait)
+            events, seq, wait = await asyncio.to_thread(self._close, db, key, burst["burst_id"], window)
+            if events is not None:
+                break
+        if not events:
+            return None
+
+        # The sender's previous turn replies first
+        if not await asyncio.to_thread(self._ready, db, key, seq):
+            self.stats["waited"] += 1
+            while not await asyncio.to_thread(self._ready, db, key, seq):
+                await asyncio.sleep(self.poll)
+
+        self.stats["turns"] += 1
+        # Gateways stamp whole seconds; the stable sort keeps arrival order within one
+        return Turn(sorted(events, key=lambda e: e.get("timestamp") or 0), seq)
+
+    async def release(self, db: Any, key: Tuple[str, str, str], turn: Turn) -> None:
+        """Let the sender's next turn run; call once the turn's reply is built"""
+        if turn.seq is not None:
+            await asyncio.to_thread(self._finish, db, key, turn.seq)
+
+
+_DEBOUNCER: Optional[MessageDebouncer] = None
+
+
+def get_debouncer() -> MessageDebouncer:
+    """Process-wide debouncer used by the router"""
+    global _DEBOUNCER
+    if _DEBOUNCER is None:
+        _DEBOUNCER = MessageDebouncer()
+    return _DEBOUNCER
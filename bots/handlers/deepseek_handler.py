@@ -7,6 +7,13 @@ from typing import Dict, Any, List
 import json
 import logging
 
+from templates import Templates
+from .analytics import get_aggregator
+from .llm_admission import AdmissionRejected, get_llm_admission, tenant_quota
+from .llm_router import ProviderError, get_provider_router, tenant_providers
+from .load_shedder import get_load_shedder
+from .model_router import get_model_router
+
 # System prompt for the AI
 SYSTEM_PROMPT = """
 Eres Sofía, una asistente virtual inteligente y amable para agendar citas.
@@ -35,27 +42,33 @@ Se breve, cordial y profesional. Habla español latinoamericano.
 
 async def handle_deepseek_bot(event: Any, config: Dict[str, Any], db: Any) -> Dict[str, Any]:
     """
-    Process message using DeepSeek via Modal Secrets.
+    Process message using DeepSeek on Ark, hedged/failed over to OpenAI
+    when the tenant allows it.
     """
-    import os
-    from openai import OpenAI
+    text = getattr(event, "text", None) or getattr(event, "message", None) or str(event)
     
-    # Extract message details
-    # Modal event structure depends on the Router, usually passed as dict or Pydantic model
-    # Assuming 'text' is accessible directly or via .message
-    if hasattr(event, "message"):
-        text = event.message
-    else:
-        text = str(event) # Fallback
-
-    api_key = os.environ.get("DEEPSEEK_API_KEY")
-    if not api_key:
-        return {"reply": "Error: DeepSeek API Key not configured in Modal."}
-
-    client = OpenAI(
-        api_key=api_key, 
-        base_url="https://ark.ap-southeast.bytepluses.com/api/v3"
+    allowed = tenant_providers(config)
+    route = get_model_router().choose(
+        config.get("tenant_llm"),
+        default_model="deepseek-v3-2-251201",
+        allowed=allowed,
+        service_model=config.get("settings", {}).get("model")
     )
+    if route is None:
+        print(f"No LLM route for tenant {getattr(event, 'tenantId', '')}: no allowed provider is configured")
+        return {
+            "reply_text": "Lo siento, tuve un problema procesando tu mensaje.",
+            "meta": {"handler": "deepseek", "intent": "chat", "degraded": True, "reason": "no_llm_route"}
+        }
+
+    # Under LLM saturation answer from a template right away
+    shedder = get_load_shedder()
+    if shedder.should_shed():
+        get_aggregator().incr(getattr(event, "tenantId", ""), "llm.shed")
+        return {
+            "reply_text": Templates.LLM_BUSY,
+            "meta": {"handler": "deepseek", "intent": "chat", "degraded": True, "reason": "load_shed", "shed_reason": shedder.reason}
+        }
 
     try:
         messages = [
@@ -63,26 +76,51 @@ async def handle_deepseek_bot(event: Any, config: Dict[str, Any], db: Any) -> Di
             {"role": "user", "content": f"Usuario: {text}"}
         ]
 
-        response = client.chat.completions.create(
-            model="deepseek-v3-2-251201",
-            messages=messages,
-            response_format={"type": "json_object"},
-            temperature=0.7,
-            max_tokens=500
-        )
+        tenant_id = getattr(event, "tenantId", "")
+        async with get_llm_admission().slot(tenant_id, **tenant_quota(config)):
+            completion = await get_provider_router().complete(
+                messages,
+                preferred=route.providers(),
+                allowed=allowed,
+                models=route.provider_models(),
+                tenant_id=tenant_id,
+                response_format={"type": "json_object"},
+                temperature=0.7,
+                max_tokens=500
+            )
 
-        content = response.choices[0].message.content
-        
         try:
-            data = json.loads(content)
+            data = json.loads(completion.content)
         except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            # Not the JSON object we asked for: treat it as a plain reply
             data = {
-                "reply": content,
+                "reply": completion.content,
                 "intent": "chat"
             }
             
-        return data
+        return {
+            "reply_text": data.get("reply"),
+            "meta": {
+                "handler": "deepseek",
+                "intent": data.get("intent"),
+                "data": data.get("data"),
+                "provider": completion.provider,
+                "model": completion.model,
+                "hedged": completion.hedged,
+                "failover": completion.failover,
+                "model_routing": route.to_meta()
+            }
+        }
+
+    except AdmissionRejected as e:
+        print(f"DeepSeek busy: {e}")
+        return {
+            "reply_text": Templates.LLM_BUSY,
+            "meta": {"handler": "deepseek", "intent": "chat", "degraded": True, "reason": "llm_quota"}
+        }
 
-    except Exception as e:
+    except ProviderError as e:
         print(f"DeepSeek Error: {e}")
-        return {"reply": "Lo siento, tuve un problema procesando tu mensaje."}
+        return {"reply_text": "Lo siento, tuve un problema procesando tu mensaje."}
@@ -0,0 +1,80 @@
+"""
+Document Retrieval
+Tenant documents in Firestore, indexed with the shared BM25 ranking
+"""
+
+from typing import Dict, Any, List, Tuple
+from datetime import datetime
+import hashlib
+
+from shared.bm25 import TOP_K, TOKEN_BUDGET, BM25Index, build_index
+
+
+DOCUMENTS_COLLECTION = "documents"
+
+# Cached indexes; one per tenant (and per service context)
+_INDEX_CACHE: Dict[Tuple[str, str], Tuple[Any, BM25Index]] = {}
+_INDEX_CACHE_MAX = 256
+
+
+def load_documents(db: Any, tenant_id: str) -> List[Dict[str, Any]]:
+    docs = db.collection("tenants").document(tenant_id).collection(DOCUMENTS_COLLECTION).stream()
+    return [doc.to_dict() for doc in docs]
+
+
+def get_index(db: Any, tenant_id: str, version: Any, extra_context: str = "") -> BM25Index:
+    """
+    Tenant index, rebuilt only when the documents or the service context change.
+
+    Documents live in tenants/{t}/documents and are versioned by
+    tenants/{t}.documents_version (bumped by save_document), so a cached
+    index is reused without reading them.
+    """
+    context_hash = hashlib.sha1(extra_context.encode("utf-8")).hexdigest()[:12]
+    key = (tenant_id, context_hash)
+    cached = _INDEX_CACHE.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    documents = load_documents(db, tenant_id) if version else []
+    index = build_index(documents, extra_context)
+    if len(_INDEX_CACHE) >= _INDEX_CACHE_MAX:
+        _INDEX_CACHE.clear()
+    _INDEX_CACHE[key] = (version, index)
+    return index
+
+
+def save_document(db: Any, tenant_id: str, doc_id: str, title: str, content: str) -> None:
+    """Store a tenant document and bump the version so containers rebuild their index"""
+    from google.cloud import firestore
+
+    tenant_ref = db.collection("tenants").document(tenant_id)
+    batch = db.batch()
+    batch.set(tenant_ref.collection(DOCUMENTS_COLLECTION).document(doc_id), {
+        "title": title,
+        "content": content,
+        "updated_at": datetime.utcnow()
+    })
+    batch.set(tenant_ref, {"documents_version": firestore.Increment(1)}, merge=True)
+    batch.commit()
+
+
+def retrieve_context(
+    db: Any,
+    tenant_id: str,
+    question: str,
+    service_config: Dict[str, Any],
+    base_context: str
+) -> str:
+    """
+    Business context for one question: the chunks of the service context
+    and tenant documents most relevant to it, within the token budget.
+    """
+    settings = service_config.get("settings", {})
+    index = get_index(db, tenant_id, service_config.get("tenant_documents_version"), base_context)
+    chunks = index.context_for(
+        question,
+        top_k=settings.get("context_top_k", TOP_K),
+        token_budget=settings.get("context_token_budget", TOKEN_BUDGET)
+    )
+    return "\n\n".join(chunks)
@@ -4,10 +4,21 @@ AI-powered question answering with optional OpenAI integration
 Falls back to keyword matching when OpenAI is not configured
 """
 
-from typing import Dict, Any, Optional, List
+from typing import Awaitable, Callable, Dict, Any, Optional, List, Tuple
 from datetime import datetime
+import asyncio
 import re
 
+from .analytics import get_aggregator
+from .conversation_state import Flow, conversation_ref, load_state, save_state
+from .doc_retrieval import retrieve_context
+from .intent_classifier import Intent, IntentMatch, classify, normalize, record_decision
+from .llm_admission import AdmissionRejected, get_llm_admission, tenant_quota
+from .llm_router import Completion, ProviderError, get_provider_router, tenant_providers
+from .load_shedder import get_load_shedder
+from .model_router import ModelDecision, get_model_router
+from .single_flight import get_single_flight, request_key
+
 
 # Knowledge base structure for fallback
 DEFAULT_KNOWLEDGE = {
@@ -38,70 +49,187 @@ DEFAULT_KNOWLEDGE = {
 }
 
 
-def find_best_match(text: str, knowledge_base: Dict) -> Optional[Dict]:
-    """Find best matching answer from knowledge base"""
+# Knowledge-base confidence at which the LLM call is skipped (settings.kb_confidence_threshold)
+KB_CONFIDENCE_THRESHOLD = 0.6
+
+# Longest wait for the LLM when the knowledge base is not confident (settings.llm_deadline_seconds)
+LLM_DEADLINE_SECONDS = 10.0
+
+
+def score_match(text: str, knowledge_base: Dict) -> Tuple[Optional[Dict], float]:
+    """
+    Best knowledge-base entry and how confident the match is.
+    
+    Confidence grows with the keywords hit (1 -> 0.5, 2 -> 0.67, 3 -> 0.75)
+    and shrinks with the runner-up's hits; a tie scores 0.
+    """
     text_lower = text.lower()
     
     best_match = None
     best_score = 0
+    runner_up = 0
     
     for topic, data in knowledge_base.items():
         keywords = data.get("keywords", [])
         score = sum(1 for kw in keywords if kw in text_lower)
         
         if score > best_score:
+            runner_up = best_score
             best_score = score
             best_match = data
+        elif score > runner_up:
+            runner_up = score
     
-    return best_match if best_score > 0 else None
+    if best_score == 0:
+        return None, 0.0
+    return best_match, best_score / (best_score + 1) * (best_score - runner_up) / best_score
+
+
+def find_best_match(text: str, knowledge_base: Dict) -> Optional[Dict]:
+    """Find best matching answer from knowledge base"""
+    return score_match(text, knowledge_base)[0]
 
 
-async def call_openai(
+async def call_llm(
     question: str,
     context: str,
-    api_key: str,
-    model: str = "gpt-4o-mini"
-) -> Optional[str]:
-    """Call OpenAI API for intelligent response"""
-    try:
-        import httpx
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": model,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": (
-                                "Eres un asistente de atencion al cliente amable y profesional. "
-                                "Responde de forma concisa en espanol. "
-                                "Si no sabes algo, sugiere contactar a un agente humano.\n\n"
-                                f"Contexto del negocio:\n{context}"
-                            )
-                        },
-                        {"role": "user", "content": question}
-                    ],
-                    "max_tokens": 300,
-                    "temperature": 0.7
-                },
-                timeout=30.0
+    route: ModelDecision,
+    tenant_id: Optional[str] = None,
+    allowed_providers: Optional[List[str]] = None,
+    quota: Optional[Dict[str, Any]] = None,
+    timeout: float = 30.0
+) -> Optional[Completion]:
+    """
+    Ask the LLM for an answer on the routed model, hedged/failed over to the
+    best model of the other allowed providers.
+    
+    Runs under the tenant's LLM concurrency quota; returns None (so the
+    caller falls back to the knowledge base) if no slot frees up in time.
+    
+    Identical concurrent requests (same model and messages) share one call;
+    coalesced callers wait at most until that call's timeout.
+    """
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "Eres un asistente de atencion al cliente amable y profesional. "
+                "Responde de forma concisa en espanol. "
+                "Si no sabes algo, sugiere contactar a un agente humano.\n\n"
+                f"Contexto del negocio:\n{context}"
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
-            else:
-                return None
-                
-    except Exception as e:
-        print(f"OpenAI error: {e}")
+        },
+        {"role": "user", "content": question}
+    ]
+    params = {"max_tokens": 300, "temperature": 0.7}
+    
+    async def request() -> Optional[Completion]:
+        try:
+            async with get_llm_admission().slot(tenant_id or "", **(quota or {})):
+                return await get_provider_router().complete(
+                    messages,
+                    preferred=route.providers(),
+                    allowed=allowed_providers,
+                    models=route.provider_models(),
+                    tenant_id=tenant_id,
+                    timeout=timeout,
+                    **params
+                )
+        except AdmissionRejected as e:
+            print(f"LLM busy: {e}")
+            return None
+        except ProviderError as e:
+            print(f"LLM error: {e}")
+            return None
+    
+    key = request_key(route.model, messages, allowed=allowed_providers, **params)
+    try:
+        result, coalesced = await get_single_flight().do(key, request, timeout=timeout)
+    except asyncio.TimeoutError:
+        if tenant_id:
+            get_aggregator().incr(tenant_id, "llm.timeouts")
         return None
+    
+    if tenant_id and coalesced:
+        get_aggregator().incr(tenant_id, "llm.coalesced")
+    
+    return result
+
+
+async def answer_question(
+    text: str,
+    knowledge_base: Dict,
+    ask_llm: Optional[Callable[[], Awaitable[Optional[Completion]]]],
+    threshold: float = KB_CONFIDENCE_THRESHOLD,
+    deadline: float = LLM_DEADLINE_SECONDS,
+    unavailable: str = "no_llm"
+) -> Tuple[Optional[str], str, str, Optional[Completion], float]:
+    """
+    Answer from the knowledge base when it is confident, otherwise from the LLM.
+    
+    The LLM (context retrieval and the call) only runs when the match is not
+    confident, and is waited for at most `deadline` seconds; without an LLM
+    answer any knowledge-base match is used as the fallback.
+    
+    Args:
+        ask_llm: Coroutine function returning a completion, or None when the
+            LLM is not available (outcome `unavailable`)
+    
+    Returns:
+        (answer or None, source, outcome, completion, kb confidence)
+    """
+    match, confidence = score_match(text, knowledge_base)
+    if match and confidence >= threshold:
+        return match["answer"], "knowledge_base", "kb_confident", None, confidence
+    
+    completion = None
+    if ask_llm is None:
+        outcome = unavailable
+    else:
+        try:
+            completion = await asyncio.wait_for(ask_llm(), deadline)
+            outcome = "llm" if completion else "llm_failed"
+        except asyncio.TimeoutError:
+            outcome = "llm_deadline"
+    
+    if completion:
+        return completion.content, completion.provider, outcome, completion, confidence
+    if match:
+        return match["answer"], "knowledge_base", outcome, None, confidence
+    return None, "fallback", outcome, None, confidence
+
+
+def local_reply(intent: IntentMatch, text: str, knowledge_base: Dict, business_name: str) -> Optional[str]:
+    """Canned answer for a locally classified message, or None to fall through"""
+    topics = list(knowledge_base.keys())
+    topics_list = "\n".join(f"{i+1}. {t.title()}" for i, t in enumerate(topics))
+    
+    if intent.reply:
+        return intent.reply
+    if intent.intent == Intent.GREETING:
+        return (
+            f"Hola! Soy el asistente de {business_name}.\n\n"
+            f"Puedo ayudarte con:\n{topics_list}\n\n"
+            "Escribe tu pregunta o el numero del tema."
+        )
+    if intent.intent == Intent.MENU:
+        return f"Temas disponibles:\n{topics_list}\n\nEscribe el numero del tema o tu pregunta."
+    if intent.intent == Intent.MENU_CHOICE:
+        idx = int(normalize(text)) - 1
+        if 0 <= idx < len(topics):
+            return knowledge_base[topics[idx]]["answer"]
+        if not topics:
+            return None
+        return f"Elige un numero entre 1 y {len(topics)}:\n{topics_list}"
+    if intent.intent == Intent.THANKS:
+        return "De nada! Algo mas en lo que pueda ayudarte?"
+    if intent.intent == Intent.GOODBYE:
+        return "Gracias por contactarnos! Si necesitas algo mas, escribe 'hola'."
+    if intent.intent == Intent.CONFIRM:
+        return "Perfecto! Escribe tu pregunta cuando quieras."
+    if intent.intent == Intent.DENY:
+        return "Entendido. Si necesitas algo mas, aqui estoy."
+    return None
 
 
 async def handle_faq_bot(
@@ -113,7 +241,7 @@ async def handle_faq_bot(
     Handle FAQ bot conversations.
     
     Features:
-    - OpenAI integration (when API key is configured)
+    - LLM answers (OpenAI, hedged/failed over to Ark) when a provider is configured
     - Fallback to keyword-based matching
     - Custom knowledge base from Firestore
     - Escalation to human agents
@@ -126,28 +254,28 @@ async def handle_faq_bot(
     Returns:
         Dict with reply_text and meta
     """
-    import os
-    
     text = event.text.strip()
     text_lower = text.lower()
     settings = service_config.get("settings", {})
     business_name = settings.get("business_name", "Nuestro Negocio")
     
     # Get conversation state for context
-    conv_ref = db.collection("tenants").document(event.tenantId)\
-                  .collection("conversations").document(event.from_)
-    conv_doc = conv_ref.get()
-    conv_data = conv_doc.to_dict() if conv_doc.exists else {}
+    conv_ref = conversation_ref(db, event.tenantId, event.from_, event.serviceId)
+    conv_data = load_state(conv_ref)
+    
+    # Local pre-classification; only open-ended questions reach the model
+    intent = classify(text, settings)
+    record_decision(event.tenantId, intent)
     
     # Check for escalation request
-    if any(kw in text_lower for kw in ["agente", "humano", "persona", "hablar con"]):
+    if intent and intent.intent == Intent.ESCALATE:
         hours = settings.get("support_hours", "Lunes a Viernes 9:00 - 18:00")
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.FAQ, {
             "escalated": True,
             "escalated_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": (
@@ -164,7 +292,7 @@ async def handle_faq_bot(
     
     # Check for feedback from previous answer
     if conv_data.get("awaiting_feedback"):
-        conv_ref.set({"awaiting_feedback": False, "updated_at": datetime.utcnow()}, merge=True)
+        save_state(conv_ref, Flow.FAQ, {"awaiting_feedback": False, "updated_at": datetime.utcnow()})
         
         if text_lower in ["1", "si", "yes"]:
             return {
@@ -183,32 +311,67 @@ async def handle_faq_bot(
     # Get custom knowledge base or use default
     knowledge_base = settings.get("knowledge_base", DEFAULT_KNOWLEDGE)
     
+    if intent:
+        reply = local_reply(intent, text, knowledge_base, business_name)
+        if reply:
+            return {
+                "reply_text": reply,
+                "meta": {
+                    "handler": "faq_bot",
+                    "action": "local_intent",
+                    "intent": intent.intent,
+                    "source": "local"
+                }
+            }
+    
     # Build context for AI
     business_context = settings.get("business_context", f"{business_name} - Empresa de servicios")
     
-    # Try OpenAI if configured
-    openai_key = os.environ.get("OPENAI_API_KEY")
-    ai_enabled = settings.get("ai_enabled", True) and openai_key
+    # Try the LLM if a provider is configured and allowed for this tenant
+    allowed_providers = tenant_providers(service_config)
+    route = None
+    if settings.get("ai_enabled", True):
+        route = get_model_router().choose(
+            service_config.get("tenant_llm"),
+            default_model="gpt-4o-mini",
+            allowed=allowed_providers,
+            service_model=settings.get("model")
+        )
     
-    answer = None
-    source = "fallback"
+    # Under LLM saturation answer from the knowledge base right away
+    shedder = get_load_shedder()
+    degraded = route is not None and shedder.should_shed()
+    if degraded:
+        get_aggregator().incr(event.tenantId, "llm.shed")
     
-    if ai_enabled:
-        answer = await call_openai(
+    async def ask_llm() -> Optional[Completion]:
+        # Only the parts of the business context and tenant documents relevant to the question
+        try:
+            context = await asyncio.to_thread(
+                retrieve_context, db, event.tenantId, text, service_config, business_context
+            )
+        except Exception as e:
+            print(f"Context retrieval error: {e}")
+            context = business_context
+        return await call_llm(
             question=text,
-            context=business_context,
-            api_key=openai_key,
-            model=settings.get("model", "gpt-4o-mini")
+            context=context,
+            route=route,
+            tenant_id=event.tenantId,
+            allowed_providers=allowed_providers,
+            quota=tenant_quota(service_config)
         )
-        if answer:
-            source = "openai"
     
-    # Fallback to keyword matching
-    if not answer:
-        match = find_best_match(text, knowledge_base)
-        if match:
-            answer = match["answer"]
-            source = "knowledge_base"
+    answer, source, outcome, completion, confidence = await answer_question(
+        text,
+        knowledge_base,
+        ask_llm if route and not degraded else None,
+        threshold=settings.get("kb_confidence_threshold", KB_CONFIDENCE_THRESHOLD),
+        deadline=settings.get("llm_deadline_seconds", LLM_DEADLINE_SECONDS),
+        unavailable="degraded" if degraded else "no_llm"
+    )
+    
+    get_aggregator().incr(event.tenantId, f"faq.outcome.{outcome}")
     
     # No match found
     if not answer:
@@ -224,16 +387,19 @@ async def handle_faq_bot(
             "meta": {
                 "handler": "faq_bot",
                 "action": "no_match",
-                "source": "none"
+                "source": "none",
+                "outcome": outcome,
+                **({"model_routing": route.to_meta()} if route else {}),
+                **({"degraded": True, "shed_reason": shedder.reason} if degraded else {})
             }
         }
     
     # Save that we're awaiting feedback
-    conv_ref.set({
+    save_state(conv_ref, Flow.FAQ, {
         "awaiting_feedback": True,
         "last_question": text,
         "updated_at": datetime.utcnow()
-    }, merge=True)
+    })
     
     return {
         "reply_text": (
@@ -246,6 +412,11 @@ async def handle_faq_bot(
             "handler": "faq_bot",
             "action": "answer",
             "source": source,
-            "ai_used": source == "openai"
+            "outcome": outcome,
+            "kb_confidence": round(confidence, 2),
+            "ai_used": completion is not None,
+            **({"hedged": completion.hedged, "failover": completion.failover, "model": completion.model} if completion else {}),
+            **({"model_routing": route.to_meta()} if route else {}),
+            **({"degraded": True, "shed_reason": shedder.reason} if degraded else {})
         }
     }
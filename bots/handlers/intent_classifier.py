@@ -0,0 +1,36 @@
+"""
+Intent Pre-classifier
+Deterministic local answers for greetings, menu picks, confirmations and escalations
+"""
+
+from typing import Dict, Any, Optional
+import re
+
+from shared.intent_rules import Intent, IntentMatch, normalize
+from shared.intent_rules import classify as classify_text
+from .analytics import get_aggregator
+
+# Intent, IntentMatch and normalize are re-exported for the bot handlers
+__all__ = ["Intent", "IntentMatch", "classify", "normalize", "record_decision"]
+
+
+def classify(text: str, settings: Optional[Dict[str, Any]] = None) -> Optional[IntentMatch]:
+    """
+    Classify a message with the shared rules plus the service's
+    settings.intent_patterns.
+
+    Returns:
+        The match, or None if the message needs the model
+    """
+    return classify_text(text, (settings or {}).get("intent_patterns"))
+
+
+def record_decision(tenant_id: str, match: Optional[IntentMatch]) -> None:
+    """Count local hits vs model calls; hit rate = 1 - intents.llm / intents.total"""
+    aggregator = get_aggregator()
+    aggregator.incr(tenant_id, "intents.total")
+    if match is None:
+        aggregator.incr(tenant_id, "intents.llm")
+    else:
+        # Tenant intent names become field names
+        aggregator.incr(tenant_id, "intents.local." + re.sub(r"[^\w-]", "_", match.intent))
@@ -7,6 +7,10 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 import re
 
+from .lead_identity import DEFAULT_COUNTRY_CODE, upsert_lead
+from .analytics import get_aggregator
+from .conversation_state import Flow, conversation_ref, load_state, save_state
+
 
 class LeadState:
     """Conversation states for lead qualification flow"""
@@ -63,12 +67,10 @@ def validate_phone(phone: str) -> bool:
     return bool(re.match(pattern, cleaned))
 
 
-def calculate_lead_score(lead_data: Dict[str, Any]) -> int:
-    """Calculate lead score (0-100) based on qualification data"""
-    score = 0
-    
-    # Industry score (some industries are higher value)
-    industry_scores = {
+# Default scoring table; tenants override any part of it with
+# settings.lead_scoring on their lead service
+DEFAULT_LEAD_SCORING = {
+    "industry": {
         "Salud y Bienestar": 25,
         "Servicios Profesionales": 25,
         "Tecnologia": 20,
@@ -76,41 +78,61 @@ def calculate_lead_score(lead_data: Dict[str, Any]) -> int:
         "Educacion": 15,
         "Gastronomia": 10,
         "Otro": 5
-    }
-    score += industry_scores.get(lead_data.get("industry", ""), 5)
-    
-    # Company size score
-    size_scores = {
+    },
+    "company_size": {
         "1-10 empleados": 10,
         "11-50 empleados": 20,
         "51-200 empleados": 25,
         "Mas de 200 empleados": 30
-    }
-    score += size_scores.get(lead_data.get("company_size", ""), 10)
-    
-    # Budget score
-    budget_scores = {
+    },
+    "budget": {
         "Menos de $100/mes": 5,
         "$100 - $500/mes": 15,
         "$500 - $2000/mes": 25,
         "Mas de $2000/mes": 35
-    }
-    score += budget_scores.get(lead_data.get("budget", ""), 5)
-    
+    },
+    # Score for missing or unrecognized answers
+    "fallback": {"industry": 5, "company_size": 10, "budget": 5},
     # Contact info bonus
-    if lead_data.get("email"):
-        score += 5
-    if lead_data.get("phone"):
-        score += 5
+    "contact_bonus": {"email": 5, "phone": 5},
+    "max_score": 100,
+    "priority_thresholds": {"HOT": 75, "WARM": 50}
+}
+
+SCORED_FIELDS = ["industry", "company_size", "budget"]
+
+
+def get_scoring_table(settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Tenant scoring table: settings.lead_scoring merged over the defaults"""
+    overrides = (settings or {}).get("lead_scoring") or {}
+    table = {}
+    for key, default in DEFAULT_LEAD_SCORING.items():
+        value = overrides.get(key, default)
+        table[key] = {**default, **value} if isinstance(default, dict) else value
+    return table
+
+
+def calculate_lead_score(lead_data: Dict[str, Any], table: Optional[Dict[str, Any]] = None) -> int:
+    """Calculate lead score (0-100) based on qualification data"""
+    table = table or DEFAULT_LEAD_SCORING
+    score = 0
+    
+    for field in SCORED_FIELDS:
+        score += table[field].get(lead_data.get(field, ""), table["fallback"][field])
+    
+    for field, bonus in table["contact_bonus"].items():
+        if lead_data.get(field):
+            score += bonus
     
-    return min(score, 100)
+    return min(score, table["max_score"])
 
 
-def get_lead_priority(score: int) -> str:
+def get_lead_priority(score: int, table: Optional[Dict[str, Any]] = None) -> str:
     """Get priority label based on score"""
-    if score >= 75:
+    thresholds = (table or DEFAULT_LEAD_SCORING)["priority_thresholds"]
+    if score >= thresholds["HOT"]:
         return "HOT"
-    elif score >= 50:
+    elif score >= thresholds["WARM"]:
         return "WARM"
     else:
         return "COLD"
@@ -145,21 +167,18 @@ async def handle_lead_bot(
     business_name = settings.get("business_name", "Nuestro Negocio")
     
     # Get or create conversation state
-    conv_ref = db.collection("tenants").document(event.tenantId)\
-                  .collection("conversations").document(event.from_)
-    conv_doc = conv_ref.get()
-    
-    conv_data = conv_doc.to_dict() if conv_doc.exists else {}
+    conv_ref = conversation_ref(db, event.tenantId, event.from_, event.serviceId)
+    conv_data = load_state(conv_ref)
     state = conv_data.get("lead_state", LeadState.IDLE)
     lead_data = conv_data.get("lead_data", {})
     
     # Handle reset commands
     if text_lower in ["cancelar", "reiniciar", "salir"]:
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.IDLE,
             "lead_data": {},
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": "Proceso cancelado. Escribe 'hola' para empezar de nuevo.",
@@ -171,11 +190,11 @@ async def handle_lead_bot(
         # Start lead qualification
         lead_data = {"started_at": datetime.utcnow().isoformat()}
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.ASK_INDUSTRY,
             "lead_data": lead_data,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         industry_list = "\n".join(f"{i+1}. {ind}" for i, ind in enumerate(INDUSTRIES))
         
@@ -201,11 +220,11 @@ async def handle_lead_bot(
             matched = next((ind for ind in INDUSTRIES if text_lower in ind.lower()), INDUSTRIES[-1])
             lead_data["industry"] = matched
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.ASK_SIZE,
             "lead_data": lead_data,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         size_list = "\n".join(f"{i+1}. {s}" for i, s in enumerate(COMPANY_SIZES))
         
@@ -227,11 +246,11 @@ async def handle_lead_bot(
         except ValueError:
             lead_data["company_size"] = COMPANY_SIZES[0]
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.ASK_BUDGET,
             "lead_data": lead_data,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         budget_list = "\n".join(f"{i+1}. {b}" for i, b in enumerate(BUDGETS))
         
@@ -253,11 +272,11 @@ async def handle_lead_bot(
         except ValueError:
             lead_data["budget"] = BUDGETS[0]
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.ASK_NAME,
             "lead_data": lead_data,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": "Genial! Como te llamas?",
@@ -267,11 +286,11 @@ async def handle_lead_bot(
     elif state == LeadState.ASK_NAME:
         lead_data["name"] = text.strip().title()
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.ASK_EMAIL,
             "lead_data": lead_data,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": (
@@ -293,11 +312,11 @@ async def handle_lead_bot(
         
         lead_data["email"] = text.strip().lower()
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.ASK_PHONE,
             "lead_data": lead_data,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": (
@@ -323,25 +342,30 @@ async def handle_lead_bot(
             }
         
         # Calculate lead score
-        lead_data["score"] = calculate_lead_score(lead_data)
-        lead_data["priority"] = get_lead_priority(lead_data["score"])
+        scoring = get_scoring_table(settings)
+        lead_data["score"] = calculate_lead_score(lead_data, scoring)
+        lead_data["priority"] = get_lead_priority(lead_data["score"], scoring)
         lead_data["completed_at"] = datetime.utcnow().isoformat()
         lead_data["whatsapp"] = event.from_
         lead_data["status"] = "new"
         
-        # Save lead to Firestore
-        leads_ref = db.collection("tenants").document(event.tenantId)\
-                      .collection("leads")
-        doc_ref = leads_ref.add(lead_data)
-        lead_id = doc_ref[1].id
+        # Save lead to Firestore, merging repeat visitors into their existing lead
+        lead_id, created = upsert_lead(
+            db, event.tenantId, lead_data,
+            settings.get("phone_country_code", DEFAULT_COUNTRY_CODE)
+        )
+        
+        aggregator = get_aggregator()
+        aggregator.incr(event.tenantId, "leads.new" if created else "leads.merged")
+        aggregator.incr(event.tenantId, f"leads.priority.{lead_data['priority']}")
         
         # Update conversation state
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.COMPLETED,
             "lead_data": {},
             "last_lead_id": lead_id,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": (
@@ -358,6 +382,7 @@ async def handle_lead_bot(
                 "handler": "lead_bot",
                 "state": "completed",
                 "lead_id": lead_id,
+                "lead_merged": not created,
                 "lead_score": lead_data["score"],
                 "lead_priority": lead_data["priority"]
             }
@@ -365,11 +390,11 @@ async def handle_lead_bot(
     
     elif state == LeadState.COMPLETED:
         # Reset for new conversation
-        conv_ref.set({
+        save_state(conv_ref, Flow.LEAD, {
             "lead_state": LeadState.IDLE,
             "lead_data": {},
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": "Ya registramos tu informacion anteriormente. Un asesor te contactara pronto!",
@@ -0,0 +1,174 @@
+"""
+Lead Export
+Constant-memory NDJSON/CSV streaming of completed leads for CRM sync
+"""
+
+from typing import Dict, Any, Iterator, List, Optional, TextIO
+from datetime import datetime
+import csv
+import io
+import json
+
+from .work_scheduler import BulkGovernor
+
+PAGE_SIZE = 500
+
+CSV_FIELDS = [
+    "id", "name", "email", "phone", "whatsapp", "industry", "company_size",
+    "budget", "score", "priority", "status", "completed_at"
+]
+
+
+def iter_leads(
+    db: Any,
+    tenant_id: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    priority: Optional[str] = None,
+    status: Optional[str] = None,
+    after: Optional[Dict[str, str]] = None,
+    page_size: int = PAGE_SIZE,
+    governor: Optional[BulkGovernor] = None,
+    key: str = "completed_at"
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield a tenant's leads ordered by `key`, one page in memory at a time.
+
+    Args:
+        db: Firestore client
+        tenant_id: Tenant ID
+        since: Inclusive ISO lower bound on `key`
+        until: Exclusive ISO upper bound on `key`
+        priority: HOT / WARM / COLD filter
+        status: Lead status filter (e.g. "new")
+        after: Resume strictly after {key, "id"} (sync checkpoint)
+        page_size: Documents fetched per query
+        governor: Paces page reads to interactive load
+        key: ISO timestamp field to order by: completed_at, or updated_at
+            to also pick up leads changed since they were completed
+
+    Yields:
+        Lead dicts with their document "id"
+    """
+    query = db.collection("tenants").document(tenant_id).collection("leads")
+
+    if priority:
+        query = query.where("priority", "==", priority)
+    if status:
+        query = query.where("status", "==", status)
+    if since:
+        query = query.where(key, ">=", since)
+    if until:
+        query = query.where(key, "<", until)
+
+    query = query.order_by(key).order_by("__name__")
+    cursor: Any = {key: after[key], "__name__": after["id"]} if after else None
+
+    while True:
+        if governor is not None:
+            governor.pace()
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(page_size).stream())
+
+        for doc in docs:
+            lead = doc.to_dict()
+            lead["id"] = doc.id
+            yield lead
+
+        if len(docs) < page_size:
+            return
+        cursor = docs[-1]
+
+
+def to_ndjson(leads: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """One JSON document per line"""
+    for lead in leads:
+        yield json.dumps(lead, ensure_ascii=False, default=str) + "\n"
+
+
+def to_csv(leads: Iterator[Dict[str, Any]], fields: List[str] = CSV_FIELDS) -> Iterator[str]:
+    """CSV header followed by one row per lead"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for lead in leads:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(lead)
+        yield buffer.getvalue()
+
+
+def export_leads(
+    db: Any,
+    tenant_id: str,
+    out: TextIO,
+    fmt: str = "ndjson",
+    sync_name: Optional[str] = None,
+    governor: Optional[BulkGovernor] = None,
+    **filters
+) -> Dict[str, Any]:
+    """
+    Write leads to `out`, optionally continuing from the last sync.
+
+    With `sync_name`, leads are ordered by updated_at and only those written
+    after the checkpoint stored in tenants/{id}/sync_checkpoints/{sync_name}
+    are exported, so re-scored and merged leads are sent again. The
+    checkpoint is advanced to the last exported lead once the write ends.
+    Leads never written since updated_at was introduced have no such field
+    and only appear in full exports (no `sync_name`) until they change.
+
+    Args:
+        db: Firestore client
+        tenant_id: Tenant ID
+        out: Writable text stream
+        fmt: "ndjson" or "csv"
+        sync_name: Incremental sync identifier (e.g. "hubspot")
+        governor: Paces page reads to interactive load (see iter_leads)
+        **filters: since, until, priority, status (see iter_leads); since
+            and until bound updated_at when syncing
+
+    Returns:
+        Dict with exported count and the new checkpoint
+    """
+    ckpt_ref = None
+    after = None
+    key = "completed_at"
+    if sync_name:
+        key = "updated_at"
+        ckpt_ref = db.collection("tenants").document(tenant_id)\
+                     .collection("sync_checkpoints").document(sync_name)
+        ckpt_doc = ckpt_ref.get()
+        if ckpt_doc.exists:
+            after = ckpt_doc.to_dict().get("last_lead")
+        if after and key not in after:
+            # Checkpoint from completed_at keyed syncs; a lead's updated_at is never
+            # earlier than its completed_at, so nothing after it is skipped
+            after = {key: after.get("completed_at"), "id": after["id"]}
+
+    last = {}
+    count = 0
+
+    def tracked() -> Iterator[Dict[str, Any]]:
+        nonlocal count
+        for lead in iter_leads(db, tenant_id, after=after, governor=governor, key=key, **filters):
+            last[key] = lead.get(key)
+            last["id"] = lead["id"]
+            count += 1
+            yield lead
+
+    lines = to_csv(tracked()) if fmt == "csv" else to_ndjson(tracked())
+    for line in lines:
+        out.write(line)
+
+    checkpoint = dict(last) if last else after
+    if ckpt_ref is not None and last:
+        ckpt_ref.set({
+            "last_lead": checkpoint,
+            "last_count": count,
+            "synced_at": datetime.utcnow()
+        })
+
+    return {"exported": count, "checkpoint": checkpoint}
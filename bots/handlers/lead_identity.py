@@ -0,0 +1,245 @@
+"""
+Lead Identity Index
+Per-tenant deduplication of leads by normalized phone and email
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import re
+
+
+DEFAULT_COUNTRY_CODE = "52"
+
+PAGE_SIZE = 1000
+
+# Kept from the existing lead when a repeat submission is merged in
+PRESERVED_FIELDS = {"status", "first_completed_at", "submissions"}
+
+
+def normalize_phone(raw: Optional[str], country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """
+    E.164 form of a typed number or WhatsApp sender ID.
+
+    Numbers without a country code get `country_code`; Mexican mobile
+    numbers in WhatsApp's legacy +521 form are folded into +52.
+    """
+    if not raw:
+        return None
+    raw = raw.split("@")[0].strip()
+    digits = re.sub(r"\D", "", raw)
+    if raw.startswith("00"):
+        digits = digits[2:]
+    elif not raw.startswith("+") and len(digits) == 10:
+        digits = country_code + digits
+    if digits.startswith("521") and len(digits) == 13:
+        digits = "52" + digits[3:]
+    if not 8 <= len(digits) <= 15:
+        return None
+    return f"+{digits}"
+
+
+def normalize_email(raw: Optional[str]) -> Optional[str]:
+    return raw.strip().lower() if raw and raw.strip() else None
+
+
+def identity_keys(lead: Dict[str, Any], country_code: str = DEFAULT_COUNTRY_CODE) -> List[str]:
+    """Index document IDs identifying a lead, phone first"""
+    keys = []
+    for field in ("phone", "whatsapp"):
+        phone = normalize_phone(lead.get(field), country_code)
+        if phone and f"phone:{phone}" not in keys:
+            keys.append(f"phone:{phone}")
+    email = normalize_email(lead.get("email"))
+    if email:
+        keys.append(f"email:{email}")
+    return keys
+
+
+def merge_lead(existing: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
+    """Newer non-empty answers win; status and first submission are kept"""
+    merged = dict(existing)
+    for field, value in incoming.items():
+        if value in (None, "") or field in PRESERVED_FIELDS:
+            continue
+        merged[field] = value
+    merged["first_completed_at"] = existing.get("first_completed_at") or existing.get("completed_at")
+    merged["submissions"] = existing.get("submissions", 1) + incoming.get("submissions", 1)
+    return merged
+
+
+def _identities_ref(db: Any, tenant_id: str) -> Any:
+    return db.collection("tenants").document(tenant_id).collection("lead_identities")
+
+
+def find_lead(db: Any, tenant_id: str, lead: Dict[str, Any], country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """ID of the existing lead sharing a phone or email, if any"""
+    refs = [_identities_ref(db, tenant_id).document(key) for key in identity_keys(lead, country_code)]
+    for snap in db.get_all(refs):
+        if snap.exists:
+            return snap.to_dict().get("lead_id")
+    return None
+
+
+def upsert_lead(
+    db: Any,
+    tenant_id: str,
+    lead: Dict[str, Any],
+    country_code: str = DEFAULT_COUNTRY_CODE
+) -> Tuple[str, bool]:
+    """
+    Create a lead, or merge it into the lead already known by phone or email.
+
+    The identity lookups, the lead write and the index entries happen in one
+    transaction, so concurrent submissions from the same person cannot both
+    create a new lead.
+
+    Args:
+        db: Firestore client
+        tenant_id: Tenant ID
+        lead: Completed lead data
+        country_code: Default country code for numbers typed without one
+
+    Returns:
+        (lead_id, created) where created is False when merged
+    """
+    from google.cloud import firestore
+
+    leads_ref = db.collection("tenants").document(tenant_id).collection("leads")
+    keys = identity_keys(lead, country_code)
+    id_refs = [_identities_ref(db, tenant_id).document(key) for key in keys]
+
+    @firestore.transactional
+    def _upsert(transaction) -> Tuple[str, bool]:
+        lead_id = None
+        for snap in db.get_all(id_refs, transaction=transaction):
+            if snap.exists:
+                lead_id = snap.to_dict().get("lead_id")
+                break
+
+        existing = None
+        if lead_id:
+            lead_snap = leads_ref.document(lead_id).get(transaction=transaction)
+            existing = lead_snap.to_dict() if lead_snap.exists else None
+
+        now = datetime.utcnow()
+        if existing is None:
+            lead_ref = leads_ref.document()
+            transaction.set(lead_ref, {
+                **lead, "first_completed_at": lead.get("completed_at"), "submissions": 1, "updated_at": now.isoformat()
+            })
+        else:
+            lead_ref = leads_ref.document(lead_id)
+            transaction.set(lead_ref, {**merge_lead(existing, lead), "updated_at": now.isoformat()})
+
+        for ref in id_refs:
+            transaction.set(ref, {"lead_id": lead_ref.id, "updated_at": now})
+        return lead_ref.id, existing is None
+
+    return _upsert(db.transaction())
+
+
+def _group_duplicates(entries: List[Tuple[str, List[str]]]) -> Tuple[List[List[str]], Dict[str, str]]:
+    """
+    Union leads that share any identity key.
+
+    `entries` must be oldest first; the oldest lead of each group is its
+    canonical lead and comes first in the group.
+
+    Returns:
+        (groups with 2+ leads, identity key -> canonical lead ID)
+    """
+    parent: Dict[str, str] = {}
+    rank = {lead_id: i for i, (lead_id, _) in enumerate(entries)}
+
+    def find(x: str) -> str:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    owner: Dict[str, str] = {}
+    for lead_id, keys in entries:
+        parent[lead_id] = lead_id
+        for key in keys:
+            if key not in owner:
+                owner[key] = lead_id
+                continue
+            a, b = find(owner[key]), find(lead_id)
+            if a != b:
+                if rank[b] < rank[a]:
+                    a, b = b, a
+                parent[b] = a
+
+    groups: Dict[str, List[str]] = {}
+    for lead_id, _ in entries:
+        groups.setdefault(find(lead_id), []).append(lead_id)
+    return (
+        [ids for ids in groups.values() if len(ids) > 1],
+        {key: find(lead_id) for key, lead_id in owner.items()}
+    )
+
+
+def backfill_identities(db: Any, tenant_id: str, country_code: str = DEFAULT_COUNTRY_CODE) -> Dict[str, Any]:
+    """
+    Build the identity index for existing leads and collapse duplicates.
+
+    A first pass reads only the identity fields of every lead; a second
+    fetches just the duplicate groups, merges each into its oldest lead and
+    deletes the rest. All writes go through one bulk writer.
+
+    Returns:
+        Dict with scanned leads, duplicate groups, removed leads and index entries
+    """
+    leads_ref = db.collection("tenants").document(tenant_id).collection("leads")
+    # Paged by document ID: ordering by completed_at would skip leads without it
+    query = leads_ref.select(["phone", "whatsapp", "email", "completed_at"]).order_by("__name__")
+
+    scanned: List[Tuple[Any, str, List[str]]] = []
+    cursor = None
+    while True:
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(PAGE_SIZE).stream())
+        for doc in docs:
+            data = doc.to_dict()
+            scanned.append((data.get("completed_at"), doc.id, identity_keys(data, country_code)))
+        if len(docs) < PAGE_SIZE:
+            break
+        cursor = docs[-1]
+
+    # Oldest first; leads without completed_at never become canonical over dated ones
+    scanned.sort(key=lambda entry: (entry[0] is None, entry[0] or 0, entry[1]))
+    entries = [(lead_id, keys) for _, lead_id, keys in scanned]
+    groups, owners = _group_duplicates(entries)
+    writer = db.bulk_writer()
+    removed = 0
+    now = datetime.utcnow()
+
+    for group in groups:
+        snaps = {snap.id: snap for snap in db.get_all([leads_ref.document(i) for i in group])}
+        merged = None
+        for lead_id in group:
+            snap = snaps.get(lead_id)
+            if snap is None or not snap.exists:
+                continue
+            lead = snap.to_dict()
+            merged = lead if merged is None else merge_lead(merged, lead)
+        if merged is None:
+            continue
+        merged["merged_ids"] = group[1:]
+        merged["updated_at"] = now.isoformat()
+        writer.set(leads_ref.document(group[0]), merged)
+        for lead_id in group[1:]:
+            writer.delete(leads_ref.document(lead_id))
+            removed += 1
+
+    identities_ref = _identities_ref(db, tenant_id)
+    for key, lead_id in owners.items():
+        writer.set(identities_ref.document(key), {"lead_id": lead_id, "updated_at": now})
+    writer.close()
+
+    return {
+        "scanned": len(entries),
+        "groups": len(groups),
+        "removed": removed,
+        "identities": len(owners)
+    }
@@ -0,0 +1,272 @@
+"""
+LLM Admission
+Per-tenant LLM concurrency quotas with deficit round robin across tenants
+"""
+
+from typing import Dict, Any, Deque, List, Optional
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import time
+
+from .analytics import get_aggregator
+
+
+# Concurrent LLM calls one tenant may hold in a container, by plan.
+# Enforced per container: a tenant's traffic spreads over every container,
+# so each one caps it at this share of its LLM_CONCURRENCY slots.
+PLAN_LIMITS = {
+    "free": 1,
+    "basic": 2,
+    "pro": 4,
+    "enterprise": 8,
+}
+DEFAULT_PLAN = "free"
+
+# DRR quantum by plan: share of freed slots a backlogged tenant gets per round
+PLAN_QUANTUM = {
+    "free": 1.0,
+    "basic": 1.0,
+    "pro": 2.0,
+    "enterprise": 4.0,
+}
+
+# Below handle_event's concurrent inputs (target 16, max 32), so requests
+# queue here under load and DRR decides who gets freed slots
+DEFAULT_CAPACITY = int(os.environ.get("LLM_CONCURRENCY", "8"))
+
+# Past this wait the request is answered without the LLM
+MAX_QUEUE_WAIT = float(os.environ.get("LLM_MAX_QUEUE_WAIT", "2.0"))
+
+# Samples kept for wait percentiles
+METRICS_WINDOW = 500
+
+
+class AdmissionRejected(Exception):
+    """No LLM slot was granted within the maximum queue wait"""
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct * len(ordered)))]
+
+
+class _Waiter:
+    __slots__ = ("future", "cost")
+
+    def __init__(self, future: asyncio.Future, cost: float):
+        self.future = future
+        self.cost = cost
+
+
+class LLMAdmission:
+    """
+    Admits at most `capacity` concurrent LLM calls per container and at most
+    the plan limit per tenant.
+
+    Backlogged tenants are served by deficit round robin: each visit adds the
+    plan's quantum to the tenant's deficit and admits queued requests while
+    their cost fits, so a tenant with hundreds of queued messages gets the
+    same share of freed slots as one with a single message.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, max_wait: float = MAX_QUEUE_WAIT):
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._tenant_in_flight: Dict[str, int] = {}
+        self._limits: Dict[str, int] = {}
+        self._quanta: Dict[str, float] = {}
+        self._plans: Dict[str, str] = {}
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._deficits: Dict[str, float] = {}
+        # Tenants with queued requests, in round-robin order
+        self._ring: List[str] = []
+        self._cursor = 0
+        self._waits: Deque[float] = deque(maxlen=METRICS_WINDOW)
+        self._counts = {"admitted": 0, "enqueued": 0, "rejected": 0}
+
+    def _eligible(self, tenant_id: str) -> bool:
+        return bool(self._queues.get(tenant_id)) and \
+            self._tenant_in_flight.get(tenant_id, 0) < self._limits[tenant_id]
+
+    def _grant(self, tenant_id: str) -> None:
+        self.in_flight += 1
+        self._tenant_in_flight[tenant_id] = self._tenant_in_flight.get(tenant_id, 0) + 1
+
+    def _drop_if_idle(self, tenant_id: str) -> None:
+        if not self._queues.get(tenant_id) and tenant_id in self._ring:
+            # Leaves the cursor on the tenant that followed this one
+            index = self._ring.index(tenant_id)
+            self._ring.pop(index)
+            if index < self._cursor:
+                self._cursor -= 1
+            self._queues.pop(tenant_id, None)
+            self._deficits.pop(tenant_id, None)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to backlogged tenants in deficit round robin order"""
+        while self.in_flight < self.capacity and any(self._eligible(t) for t in self._ring):
+            self._cursor %= len(self._ring)
+            tenant_id = self._ring[self._cursor]
+            queue = self._queues[tenant_id]
+
+            while queue and queue[0].future.done():
+                queue.popleft()  # Timed out or cancelled while queued
+            if not queue:
+                self._drop_if_idle(tenant_id)
+                continue
+            if not self._eligible(tenant_id):
+                self._cursor += 1
+                continue
+
+            waiter = queue[0]
+            if self._deficits[tenant_id] < waiter.cost:
+                self._deficits[tenant_id] += self._quanta[tenant_id]
+                self._cursor += 1
+                continue
+
+            queue.popleft()
+            self._deficits[tenant_id] -= waiter.cost
+            self._grant(tenant_id)
+            waiter.future.set_result(None)
+            self._drop_if_idle(tenant_id)
+
+    async def acquire(self, tenant_id: str, plan: Optional[str] = None, limit: Optional[int] = None, cost: float = 1.0) -> float:
+        """
+        Wait for an LLM slot for a tenant.
+
+        Returns:
+            Seconds spent queued
+
+        Raises:
+            AdmissionRejected if no slot was granted within max_wait
+        """
+        plan = plan if plan in PLAN_LIMITS else DEFAULT_PLAN
+        self._limits[tenant_id] = limit or PLAN_LIMITS[plan]
+        self._quanta[tenant_id] = PLAN_QUANTUM[plan]
+        self._plans[tenant_id] = plan
+        queued_at = time.monotonic()
+
+        if self.in_flight < self.capacity and not self._queues.get(tenant_id) \
+                and self._tenant_in_flight.get(tenant_id, 0) < self._limits[tenant_id]:
+            self._grant(tenant_id)
+            self._counts["admitted"] += 1
+            self._waits.append(0.0)
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        if tenant_id not in self._queues:
+            self._queues[tenant_id] = deque()
+            self._deficits[tenant_id] = 0.0
+            self._ring.append(tenant_id)
+        self._queues[tenant_id].append(_Waiter(future, cost))
+        self._counts["enqueued"] += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we gave up; give it back
+                self.release(tenant_id)
+            else:
+                future.cancel()
+                self._dispatch()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._counts["rejected"] += 1
+            self._waits.append(time.monotonic() - queued_at)
+            raise AdmissionRejected(f"No LLM slot for {tenant_id} within {self.max_wait}s")
+
+        waited = time.monotonic() - queued_at
+        self._counts["admitted"] += 1
+        self._waits.append(waited)
+        return waited
+
+    def release(self, tenant_id: str) -> None:
+        self.in_flight -= 1
+        self._tenant_in_flight[tenant_id] -= 1
+        if not self._tenant_in_flight[tenant_id]:
+            del self._tenant_in_flight[tenant_id]
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tenant_id: str, plan: Optional[str] = None, limit: Optional[int] = None, cost: float = 1.0):
+        """
+        Hold an LLM slot for a tenant; records queue wait and rejections
+        in the tenant's analytics (llm.queue_wait_ms, llm.rejected).
+
+        Yields:
+            Seconds spent queued
+
+        Raises:
+            AdmissionRejected if no slot was granted within max_wait
+        """
+        aggregator = get_aggregator()
+        try:
+            waited = await self.acquire(tenant_id, plan, limit, cost)
+        except AdmissionRejected:
+            aggregator.incr(tenant_id, "llm.rejected")
+            raise
+        if waited:
+            aggregator.incr(tenant_id, "llm.queued")
+            aggregator.incr(tenant_id, "llm.queue_wait_ms", round(waited * 1000))
+        try:
+            yield waited
+        finally:
+            self.release(tenant_id)
+
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def plan_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per plan: in-flight calls, queued requests, backlogged tenants and their DRR deficit"""
+        plans = {
+            plan: {"in_flight": 0, "queued": 0, "backlogged_tenants": 0, "deficit": 0.0}
+            for plan in PLAN_LIMITS
+        }
+        for tenant_id, count in self._tenant_in_flight.items():
+            plans[self._plans[tenant_id]]["in_flight"] += count
+        for tenant_id in self._ring:
+            stats = plans[self._plans[tenant_id]]
+            stats["queued"] += len(self._queues[tenant_id])
+            stats["backlogged_tenants"] += 1
+            stats["deficit"] += self._deficits[tenant_id]
+        return plans
+
+    def metrics(self) -> Dict[str, Any]:
+        """Capacity use, backlog per plan and queue wait percentiles"""
+        waits = list(self._waits)
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": self.queue_depth(),
+            "backlogged_tenants": len(self._ring),
+            **self._counts,
+            "wait_ms_p50": round(_percentile(waits, 0.50) * 1000, 1),
+            "wait_ms_p95": round(_percentile(waits, 0.95) * 1000, 1),
+            "plans": self.plan_metrics()
+        }
+
+
+def tenant_quota(service_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Plan and optional per-tenant override (tenants/{t}.llm.max_concurrency) for slot()"""
+    return {
+        "plan": service_config.get("tenant_plan"),
+        "limit": (service_config.get("tenant_llm") or {}).get("max_concurrency")
+    }
+
+
+_ADMISSION: Optional[LLMAdmission] = None
+
+
+def get_llm_admission() -> LLMAdmission:
+    """Process-wide admission controller shared by all LLM call sites"""
+    global _ADMISSION
+    if _ADMISSION is None:
+        _ADMISSION = LLMAdmission()
+    return _ADMISSION
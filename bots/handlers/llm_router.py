@@ -0,0 +1,360 @@
+"""
+LLM Provider Router
+Hedged requests and failover across OpenAI-compatible providers (Ark, OpenAI)
+"""
+
+from typing import Dict, Any, Deque, List, Optional, Tuple
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+import asyncio
+import os
+import random
+import time
+
+from .analytics import get_aggregator
+
+
+@dataclass
+class Provider:
+    name: str
+    base_url: str
+    api_key_env: str
+    default_model: str
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return os.environ.get(self.api_key_env)
+
+
+PROVIDERS: Dict[str, Provider] = {
+    "openai": Provider("openai", "https://api.openai.com/v1", "OPENAI_API_KEY", "gpt-4o-mini"),
+    "ark": Provider("ark", "https://ark.ap-southeast.bytepluses.com/api/v3", "DEEPSEEK_API_KEY", "deepseek-v3-2-251201"),
+}
+
+# Latency samples kept per provider
+STATS_WINDOW = 200
+
+# Attempts kept across providers for time-windowed health signals
+RECENT_WINDOW = 2000
+
+# Below this many samples p95 is unreliable; hedge after a fixed delay instead
+MIN_SAMPLES = 20
+DEFAULT_HEDGE_DELAY = 3.0
+MIN_HEDGE_DELAY = 0.3
+
+# Consecutive failures that open a provider's circuit; while open it is tried
+# only after every other provider, and the first success closes it again
+CIRCUIT_FAILURES = 5
+CIRCUIT_OPEN_SECONDS = 30.0
+
+
+class ProviderError(Exception):
+    """Every allowed provider failed or the overall deadline passed"""
+
+
+@dataclass
+class Completion:
+    content: str
+    provider: str
+    model: str
+    usage: Dict[str, Any] = field(default_factory=dict)
+    latency: float = 0.0
+    hedged: bool = False
+    failover: bool = False
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct * len(ordered)))]
+
+
+class ProviderStats:
+    """Rolling latency, error and token usage window for one provider or model"""
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.usage: Deque[Tuple[int, int]] = deque(maxlen=window)
+
+    def record(self, latency: Optional[float], ok: bool, usage: Optional[Dict[str, Any]] = None) -> None:
+        self.outcomes.append(ok)
+        if ok and latency is not None:
+            self.latencies.append(latency)
+        if usage:
+            self.usage.append((usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)))
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        return _percentile(list(self.latencies), 0.95)
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def mean_usage(self) -> Optional[Tuple[float, float]]:
+        """Mean (prompt, completion) tokens per call"""
+        if not self.usage:
+            return None
+        return (
+            sum(p for p, _ in self.usage) / len(self.usage),
+            sum(c for _, c in self.usage) / len(self.usage)
+        )
+
+
+_client = None
+
+
+def _http_client() -> Any:
+    """One connection pool per container, shared by every provider call"""
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient()
+    return _client
+
+
+async def _post_completion(provider: Provider, model: str, messages: List[Dict[str, str]], timeout: float, **params: Any) -> Dict[str, Any]:
+    """One chat completion request; raises on transport or HTTP errors"""
+    response = await _http_client().post(
+        f"{provider.base_url}/chat/completions",
+        headers={
+            "Authorization": f"Bearer {provider.api_key}",
+            "Content-Type": "application/json"
+        },
+        json={"model": model, "messages": messages, **params},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _content(data: Any) -> str:
+    """The completion text; raises ProviderError if the response is not a chat completion"""
+    try:
+        content = data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise ProviderError(f"Malformed completion response: {e!r}")
+    if not isinstance(content, str):
+        raise ProviderError(f"Malformed completion content: {type(content).__name__}")
+    return content
+
+
+class StandInTransport:
+    """
+    Local provider stand-in for offline runs and load tests (LLM_STAND_IN=1).
+
+    Each model answers after a latency drawn around its configured mean and
+    fails at its configured error rate; usage is reported like the real API.
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, Tuple[float, float]]] = None, default: Tuple[float, float] = (0.8, 0.0)):
+        # model -> (mean latency seconds, error rate)
+        self.profiles = profiles or {}
+        self.default = default
+
+    async def __call__(self, provider: Provider, model: str, messages: List[Dict[str, str]], timeout: float, **params: Any) -> Dict[str, Any]:
+        latency, error_rate = self.profiles.get(model, self.default)
+        delay = random.uniform(0.5, 1.5) * latency
+        await asyncio.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise TimeoutError(f"{model} stand-in timed out")
+        if random.random() < error_rate:
+            raise RuntimeError(f"{model} stand-in error")
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = min(params.get("max_tokens", 300), 60)
+        return {
+            "choices": [{"message": {"content": f"[{provider.name}/{model}] respuesta de prueba"}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+
+class ProviderRouter:
+    """
+    Sends each request to the first allowed provider. If it has not answered
+    by its observed p95, the same request is hedged to the next provider and
+    whichever answers first wins; the other is cancelled. A provider that
+    errors (including a malformed response) is failed over to the next one
+    immediately, and one that keeps failing has its circuit opened.
+    """
+
+    def __init__(self, providers: Optional[Dict[str, Provider]] = None, transport: Any = None):
+        self.providers = providers or PROVIDERS
+        # Swappable for local stand-ins: async (provider, model, messages, timeout, **params) -> response JSON
+        self.transport = transport or _post_completion
+        # Stand-ins need no credentials
+        self.require_keys = transport is None
+        self.stats: Dict[str, ProviderStats] = {name: ProviderStats() for name in self.providers}
+        self.model_stats: Dict[str, ProviderStats] = defaultdict(ProviderStats)
+        # (monotonic time, latency or None, ok) of every attempt, for time-windowed health
+        self.recent: Deque[Tuple[float, Optional[float], bool]] = deque(maxlen=RECENT_WINDOW)
+        self.consecutive_failures: Dict[str, int] = {name: 0 for name in self.providers}
+        self.open_until: Dict[str, float] = {}
+
+    def circuit_open(self, name: str, now: Optional[float] = None) -> bool:
+        until = self.open_until.get(name)
+        return until is not None and (now if now is not None else time.monotonic()) < until
+
+    def _record_failure(self, name: str, model: str) -> None:
+        self.stats[name].record(None, ok=False)
+        self.model_stats[model].record(None, ok=False)
+        self.recent.append((time.monotonic(), None, False))
+        self.consecutive_failures[name] += 1
+        if self.consecutive_failures[name] >= CIRCUIT_FAILURES:
+            if not self.circuit_open(name):
+                print(f"LLM provider {name} circuit open after {self.consecutive_failures[name]} failures")
+            self.open_until[name] = time.monotonic() + CIRCUIT_OPEN_SECONDS
+
+    def candidates(self, preferred: Optional[List[str]] = None, allowed: Optional[List[str]] = None) -> List[str]:
+        """
+        Providers to try, in order: preferred first, filtered by allow-list and
+        configured keys; providers with an open circuit go last
+        """
+        order = list(preferred or []) + [name for name in self.providers if name not in (preferred or [])]
+        names = [
+            name for name in order
+            if name in self.providers
+            and (allowed is None or name in allowed)
+            and (self.providers[name].api_key or not self.require_keys)
+        ]
+        now = time.monotonic()
+        return sorted(names, key=lambda name: self.circuit_open(name, now))
+
+    def hedge_delay(self, name: str) -> float:
+        p95 = self.stats[name].p95()
+        return DEFAULT_HEDGE_DELAY if p95 is None else max(p95, MIN_HEDGE_DELAY)
+
+    async def _attempt(self, name: str, model: str, messages: List[Dict[str, str]], timeout: float, params: Dict[str, Any]) -> Completion:
+        provider = self.providers[name]
+        started = time.monotonic()
+        try:
+            data = await self.transport(provider, model, messages, timeout, **params)
+            content = _content(data)
+        except asyncio.CancelledError:
+            raise  # Lost a hedge race; says nothing about the provider's health
+        except Exception:
+            self._record_failure(name, model)
+            raise
+        latency = time.monotonic() - started
+        usage = data.get("usage") or {}
+        self.consecutive_failures[name] = 0
+        self.open_until.pop(name, None)
+        self.recent.append((time.monotonic(), latency, True))
+        self.stats[name].record(latency, ok=True)
+        self.model_stats[model].record(latency, ok=True, usage=usage)
+        return Completion(content, name, model, usage, latency)
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        preferred: Optional[List[str]] = None,
+        allowed: Optional[List[str]] = None,
+        models: Optional[Dict[str, str]] = None,
+        tenant_id: Optional[str] = None,
+        timeout: float = 30.0,
+        hedge: bool = True,
+        **params: Any
+    ) -> Completion:
+        """
+        Run a chat completion across providers.
+
+        Args:
+            messages: Chat messages
+            preferred: Provider names to try first, in order
+            allowed: Tenant allow-list; None allows every configured provider
+            models: Model per provider; defaults to each provider's default_model
+            tenant_id: Tenant to record llm.* analytics for
+            timeout: Overall deadline in seconds
+            hedge: Whether to hedge slow requests to the next provider
+            **params: Extra request fields (max_tokens, temperature, response_format...)
+
+        Raises:
+            ProviderError if no provider answered in time
+        """
+        names = self.candidates(preferred, allowed)
+        if not names:
+            raise ProviderError("No LLM provider allowed and configured")
+
+        models = models or {}
+        deadline = time.monotonic() + timeout
+        pending: Dict[asyncio.Task, Tuple[str, str]] = {}
+        errors: List[str] = []
+        hedged = failover = False
+
+        def launch() -> str:
+            name = names.pop(0)
+            model = models.get(name, self.providers[name].default_model)
+            remaining = max(deadline - time.monotonic(), 0.1)
+            pending[asyncio.ensure_future(self._attempt(name, model, messages, remaining, params))] = (name, model)
+            return name
+
+        last = launch()
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    for name, model in pending.values():
+                        self._record_failure(name, model)
+                    raise ProviderError(f"LLM deadline of {timeout}s exceeded")
+                wait = min(self.hedge_delay(last), remaining) if hedge and names else remaining
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if hedge and names:
+                        last = launch()
+                        hedged = True
+                    continue
+
+                for task in done:
+                    name, _ = pending.pop(task)
+                    if task.exception() is None:
+                        result = task.result()
+                        result.hedged, result.failover = hedged, failover
+                        self._record(tenant_id, result)
+                        return result
+                    errors.append(f"{name}: {task.exception()}")
+
+                # Every in-flight attempt failed: fail over without waiting
+                if not pending and names:
+                    last = launch()
+                    failover = True
+
+            raise ProviderError("; ".join(errors))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _record(self, tenant_id: Optional[str], result: Completion) -> None:
+        if not tenant_id:
+            return
+        aggregator = get_aggregator()
+        aggregator.incr(tenant_id, "llm.calls")
+        aggregator.incr(tenant_id, "llm.tokens", result.usage.get("total_tokens", 0))
+        aggregator.incr(tenant_id, f"llm.provider.{result.provider}")
+        if result.hedged:
+            aggregator.incr(tenant_id, "llm.hedged")
+        if result.failover:
+            aggregator.incr(tenant_id, "llm.failovers")
+
+
+def tenant_providers(service_config: Dict[str, Any]) -> Optional[List[str]]:
+    """Tenant allow-list (tenants/{t}.llm.providers); None when unrestricted"""
+    return (service_config.get("tenant_llm") or {}).get("providers")
+
+
+_router: Optional[ProviderRouter] = None
+
+
+def get_provider_router() -> ProviderRouter:
+    """Process-wide router, so latency windows are shared by all requests"""
+    global _router
+    if _router is None:
+        _router = ProviderRouter(transport=StandInTransport() if os.environ.get("LLM_STAND_IN") else None)
+    return _router
@@ -0,0 +1,110 @@
+"""
+Load Shedder
+Skips the LLM under saturation so handlers answer from the knowledge base or templates
+"""
+
+from typing import Dict, Any, Optional
+import os
+import random
+import time
+
+from shared.load_shedding import ShedSwitch, percentile
+from .llm_admission import LLMAdmission, get_llm_admission
+from .llm_router import ProviderRouter, get_provider_router
+
+
+# Health signals are computed over LLM attempts in this window
+WINDOW_SECONDS = 60.0
+
+# Fewer attempts than this in the window say nothing about error rate or p95
+MIN_SAMPLES = 10
+
+SHED_P95_MS = float(os.environ.get("LLM_SHED_P95_MS", "8000"))
+
+# Start shedding when any signal reaches its enter threshold; stop only after
+# every signal has stayed at or below its exit threshold for COOLDOWN_SECONDS
+# (see ShedSwitch)
+THRESHOLDS = {
+    "queue_depth": {"enter": 20, "exit": 5},
+    "error_rate": {"enter": 0.5, "exit": 0.2},
+    "p95_ms": {"enter": SHED_P95_MS, "exit": SHED_P95_MS / 2},
+}
+COOLDOWN_SECONDS = 30.0
+
+# Share of requests still sent to the LLM while shedding, so recovery is observed
+PROBE_RATE = 0.05
+
+
+class LoadShedder:
+    """
+    Sheds LLM calls while this container's LLM queue depth, error rate or
+    p95 latency is past its ShedSwitch thresholds.
+    """
+
+    def __init__(self, providers: Optional[ProviderRouter] = None, admission: Optional[LLMAdmission] = None):
+        self._providers = providers
+        self._admission = admission
+        self.switch = ShedSwitch(THRESHOLDS, COOLDOWN_SECONDS)
+        self.counts = {"shed": 0, "probes": 0}
+
+    @property
+    def providers(self) -> ProviderRouter:
+        return self._providers or get_provider_router()
+
+    @property
+    def admission(self) -> LLMAdmission:
+        return self._admission or get_llm_admission()
+
+    @property
+    def shedding(self) -> bool:
+        return self.switch.shedding
+
+    @property
+    def reason(self) -> Optional[str]:
+        return self.switch.reason
+
+    def signals(self, now: Optional[float] = None) -> Dict[str, float]:
+        now = now if now is not None else time.monotonic()
+        recent = [(latency, ok) for ts, latency, ok in self.providers.recent if now - ts <= WINDOW_SECONDS]
+        signals = {"queue_depth": float(self.admission.queue_depth())}
+        if len(recent) >= MIN_SAMPLES:
+            latencies = [latency for latency, ok in recent if ok]
+            signals["error_rate"] = 1 - len(latencies) / len(recent)
+            if latencies:
+                signals["p95_ms"] = percentile(latencies, 0.95) * 1000
+        return signals
+
+    def _update(self, now: float) -> None:
+        self.switch.update(self.signals(now), now)
+
+    def should_shed(self) -> bool:
+        """Whether this request should skip the LLM"""
+        self._update(time.monotonic())
+        if not self.shedding:
+            return False
+        if random.random() < PROBE_RATE:
+            self.counts["probes"] += 1
+            return False
+        self.counts["shed"] += 1
+        return True
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "shedding": self.shedding,
+            "reason": self.reason,
+            "state_age_s": round(time.monotonic() - self.switch.since, 1),
+            "signals": self.signals(),
+            "transitions": self.switch.transitions,
+            **self.counts
+        }
+
+
+_SHEDDER: Optional[LoadShedder] = None
+
+
+def get_load_shedder() -> LoadShedder:
+    """Process-wide shedder shared by the LLM handlers"""
+    global _SHEDDER
+    if _SHEDDER is None:
+        _SHEDDER = LoadShedder()
+    return _SHEDDER
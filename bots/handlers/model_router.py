@@ -0,0 +1,203 @@
+"""
+Model Router
+Picks the model for each LLM request from live latency, error and cost stats
+"""
+
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, field
+import random
+
+from .llm_router import ProviderRouter, get_provider_router
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    provider: str
+    # USD per 1K tokens
+    input_cost: float
+    output_cost: float
+
+
+MODELS: Dict[str, ModelSpec] = {
+    spec.name: spec for spec in [
+        ModelSpec("gpt-4o-mini", "openai", 0.00015, 0.0006),
+        ModelSpec("gpt-4o", "openai", 0.0025, 0.01),
+        ModelSpec("deepseek-v3-2-251201", "ark", 0.00028, 0.00042),
+    ]
+}
+
+
+class Policy:
+    """Tenant model selection policies (tenants/{t}.llm.policy)"""
+    CHEAPEST = "cheapest"  # Cheapest model whose p95 is within the latency SLO
+    FASTEST = "fastest"    # Lowest p95
+    FIXED = "fixed"        # Always the configured / call-site model
+
+
+DEFAULT_LATENCY_SLO_MS = 4000
+
+# Models failing more often than this are only used if nothing else is left
+MAX_ERROR_RATE = 0.2
+
+# Share of requests sent to a random other candidate so its stats stay fresh
+EXPLORE_RATE = 0.05
+
+# Token mix assumed for cost estimates until a model has usage samples
+DEFAULT_USAGE = (400, 150)
+
+
+@dataclass
+class ModelDecision:
+    model: str
+    provider: str
+    policy: str
+    reason: str
+    # Candidates best first (model -> provider); the best of each other
+    # provider is used for hedging/failover
+    ranked: Dict[str, str] = field(default_factory=dict)
+    p95_ms: Optional[float] = None
+    error_rate: float = 0.0
+    est_cost_usd: float = 0.0
+
+    def provider_models(self) -> Dict[str, str]:
+        """Best model of each provider, for ProviderRouter.complete(models=...)"""
+        models: Dict[str, str] = {}
+        for name, provider in self.ranked.items():
+            models.setdefault(provider, name)
+        return models
+
+    def providers(self) -> List[str]:
+        return list(self.provider_models())
+
+    def to_meta(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "provider": self.provider,
+            "policy": self.policy,
+            "reason": self.reason,
+            "p95_ms": self.p95_ms,
+            "error_rate": round(self.error_rate, 3),
+            "est_cost_usd": round(self.est_cost_usd, 6)
+        }
+
+
+class ModelRouter:
+    """
+    Chooses among known models using the provider router's rolling per-model
+    stats, so every decision reflects the latency, errors and token usage
+    actually observed in this container.
+    """
+
+    def __init__(self, providers: Optional[ProviderRouter] = None, models: Optional[Dict[str, ModelSpec]] = None):
+        self._providers = providers
+        self.models = models or MODELS
+
+    @property
+    def providers(self) -> ProviderRouter:
+        return self._providers or get_provider_router()
+
+    def estimated_cost(self, model: str) -> float:
+        spec = self.models.get(model)
+        if spec is None:
+            return 0.0  # Pinned model without a price entry
+        prompt, completion = self.providers.model_stats[model].mean_usage() or DEFAULT_USAGE
+        return (prompt * spec.input_cost + completion * spec.output_cost) / 1000
+
+    def p95_ms(self, model: str) -> Optional[float]:
+        p95 = self.providers.model_stats[model].p95()
+        return None if p95 is None else round(p95 * 1000, 1)
+
+    def candidates(self, policy: Dict[str, Any], allowed: Optional[List[str]]) -> List[str]:
+        """Known models the tenant may use whose provider is allowed and configured"""
+        usable = set(self.providers.candidates(allowed=allowed))
+        names = policy.get("models") or list(self.models)
+        return [name for name in names if name in self.models and self.models[name].provider in usable]
+
+    def choose(
+        self,
+        policy: Optional[Dict[str, Any]],
+        default_model: str,
+        allowed: Optional[List[str]] = None,
+        service_model: Optional[str] = None
+    ) -> Optional[ModelDecision]:
+        """
+        Pick a model for one request.
+
+        Args:
+            policy: Tenant LLM policy: {"policy": "cheapest"|"fastest"|"fixed",
+                "latency_slo_ms": 4000, "models": [...], "model": "..."}
+            default_model: Call-site model when no policy applies
+            allowed: Tenant provider allow-list
+            service_model: Model pinned in the service settings, if any
+
+        Returns:
+            The decision, or None if no model is usable
+        """
+        policy = policy or {}
+        names = self.candidates(policy, allowed)
+        provider_of = {}
+
+        mode = policy.get("policy", Policy.FIXED)
+        slo_ms = policy.get("latency_slo_ms", DEFAULT_LATENCY_SLO_MS)
+
+        def p95_or_zero(name: str) -> float:
+            # Unmeasured models sort first so they get measured
+            return self.p95_ms(name) or 0.0
+
+        healthy = [n for n in names if self.providers.model_stats[n].error_rate() <= MAX_ERROR_RATE]
+        unhealthy = [n for n in names if n not in healthy]
+
+        if mode == Policy.CHEAPEST:
+            within = [n for n in healthy if p95_or_zero(n) <= slo_ms]
+            over = [n for n in healthy if n not in within]
+            ranked = sorted(within, key=self.estimated_cost) + sorted(over, key=p95_or_zero)
+            reason = "cheapest_within_slo" if within else "none_within_slo_fastest"
+        elif mode == Policy.FASTEST:
+            ranked = sorted(healthy, key=p95_or_zero)
+            reason = "lowest_p95"
+        else:
+            fixed = policy.get("model") or service_model or default_model
+            # Models without a price entry are assumed to run on the call site's provider
+            spec = self.models.get(fixed) or self.models.get(default_model)
+            usable = spec is not None and spec.provider in self.providers.candidates(allowed=allowed)
+            ranked = ([fixed] if usable else []) + [n for n in healthy if n != fixed]
+            reason = "fixed" if usable else "fixed_unavailable"
+            if usable:
+                provider_of = {fixed: spec.provider}
+        ranked += [
+            n for n in sorted(unhealthy, key=lambda n: self.providers.model_stats[n].error_rate())
+            if n not in ranked
+        ]
+        if not ranked:
+            return None
+
+        if mode != Policy.FIXED and len(ranked) > 1 and random.random() < EXPLORE_RATE:
+            pick = random.choice(ranked[1:])
+            ranked.remove(pick)
+            ranked.insert(0, pick)
+            reason = "explore"
+
+        provider_of.update({n: self.models[n].provider for n in ranked if n in self.models})
+        model = ranked[0]
+        return ModelDecision(
+            model=model,
+            provider=provider_of[model],
+            policy=mode,
+            reason=reason,
+            ranked={n: provider_of[n] for n in ranked},
+            p95_ms=self.p95_ms(model),
+            error_rate=self.providers.model_stats[model].error_rate(),
+            est_cost_usd=self.estimated_cost(model)
+        )
+
+
+_model_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    """Process-wide model router over the shared provider router"""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter()
+    return _model_router
@@ -6,6 +6,14 @@ Handles appointment reminders, order updates, and simple confirmations
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
 
+from templates import DEFAULT_TEMPLATES, TemplateSet
+from .availability import get_slot_minutes, invalidate_day
+from .reservations import cancel_appointment
+from .appointment_queries import invalidate_sender
+from .reminder_index import unindex_appointment
+from .analytics import get_aggregator
+from .conversation_state import Flow, conversation_ref, load_state, save_state
+
 
 class NotificationType:
     """Types of notifications"""
@@ -49,11 +57,8 @@ async def handle_notification_bot(
     business_name = settings.get("business_name", "Nuestro Negocio")
     
     # Get conversation context
-    conv_ref = db.collection("tenants").document(event.tenantId)\
-                  .collection("conversations").document(event.from_)
-    conv_doc = conv_ref.get()
-    
-    conv_data = conv_doc.to_dict() if conv_doc.exists else {}
+    conv_ref = conversation_ref(db, event.tenantId, event.from_, event.serviceId)
+    conv_data = load_state(conv_ref)
     pending_action = conv_data.get("pending_notification_action")
     context = conv_data.get("notification_context", {})
     
@@ -68,11 +73,11 @@ async def handle_notification_bot(
                            .collection("appointments").document(appointment_id)
                 apt_ref.update({"confirmed": True, "confirmed_at": datetime.utcnow()})
             
-            conv_ref.set({
+            save_state(conv_ref, Flow.NOTIFICATION, {
                 "pending_notification_action": None,
                 "notification_context": {},
                 "updated_at": datetime.utcnow()
-            }, merge=True)
+            })
             
             return {
                 "reply_text": (
@@ -89,17 +94,21 @@ async def handle_notification_bot(
             }
         
         elif text_lower in ["2", "no", "cancelar"]:
-            # Cancel appointment
+            # Cancel appointment and free its slot; repeating "cancelar" is a no-op
+            apt = None
             if appointment_id:
-                apt_ref = db.collection("tenants").document(event.tenantId)\
-                           .collection("appointments").document(appointment_id)
-                apt_ref.update({"status": "cancelled", "cancelled_at": datetime.utcnow()})
+                apt = cancel_appointment(db, event.tenantId, appointment_id, get_slot_minutes(settings))
+            if apt is not None:
+                invalidate_day(event.tenantId, apt.get("date", ""))
+                unindex_appointment(db, event.tenantId, appointment_id, apt)
+                invalidate_sender(event.tenantId, event.from_)
+                get_aggregator().incr(event.tenantId, "appointments.cancelled")
             
-            conv_ref.set({
+            save_state(conv_ref, Flow.NOTIFICATION, {
                 "pending_notification_action": None,
                 "notification_context": {},
                 "updated_at": datetime.utcnow()
-            }, merge=True)
+            })
             
             return {
                 "reply_text": (
@@ -126,11 +135,11 @@ async def handle_notification_bot(
                                  .collection("orders").document(order_id)
                     order_ref.update({"rating": rating, "rated_at": datetime.utcnow()})
                 
-                conv_ref.set({
+                save_state(conv_ref, Flow.NOTIFICATION, {
                     "pending_notification_action": None,
                     "notification_context": {},
                     "updated_at": datetime.utcnow()
-                }, merge=True)
+                })
                 
                 if rating >= 4:
                     return {
@@ -160,11 +169,11 @@ async def handle_notification_bot(
         payment_id = context.get("payment_id")
         
         if text_lower in ["si", "confirmo", "recibido", "ok"]:
-            conv_ref.set({
+            save_state(conv_ref, Flow.NOTIFICATION, {
                 "pending_notification_action": None,
                 "notification_context": {},
                 "updated_at": datetime.utcnow()
-            }, merge=True)
+            })
             
             return {
                 "reply_text": "Gracias por confirmar!",
@@ -188,11 +197,58 @@ async def handle_notification_bot(
 # ===== OUTGOING NOTIFICATION FUNCTIONS =====
 # These are called programmatically, not by user messages
 
+def _reminder_context(appointment: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": appointment.get("name", "Cliente"),
+        "date": appointment.get("date_display", appointment.get("date")),
+        "time": appointment.get("time"),
+        "location": appointment.get("location", "nuestra oficina")
+    }
+
+
+def build_appointment_reminders(
+    appointments: List[Dict[str, Any]],
+    reminder_type: str = "24h",
+    templates: TemplateSet = DEFAULT_TEMPLATES
+) -> List[Dict[str, Any]]:
+    """
+    Prepare reminder messages for many appointments in one pass.
+    
+    Args:
+        appointments: Appointment data (each with its "id")
+        reminder_type: "24h" or "1h"
+        templates: Tenant template set (defaults when not customised)
+        
+    Returns:
+        List of dicts with to, text, and context, in input order
+    """
+    contexts = [_reminder_context(apt) for apt in appointments]
+    template_name = "REMINDER_1H" if reminder_type == "1h" else "REMINDER_24H"
+    texts = templates.render_many(template_name, contexts)
+    pending_action = "confirm_appointment" if reminder_type == "24h" else None
+    
+    return [
+        {
+            "to": apt.get("phone"),
+            "text": text,
+            "notification_type": f"reminder_{reminder_type}",
+            "context": {
+                "appointment_id": apt.get("id"),
+                "date": ctx["date"],
+                "time": ctx["time"]
+            },
+            "pending_action": pending_action
+        }
+        for apt, ctx, text in zip(appointments, contexts, texts)
+    ]
+
+
 async def send_appointment_reminder(
     db: Any,
     tenant_id: str,
     appointment: Dict[str, Any],
-    reminder_type: str = "24h"
+    reminder_type: str = "24h",
+    templates: TemplateSet = DEFAULT_TEMPLATES
 ) -> Dict[str, Any]:
     """
     Prepare appointment reminder message.
@@ -202,52 +258,20 @@ async def send_appointment_reminder(
         tenant_id: Tenant ID
         appointment: Appointment data
         reminder_type: "24h" or "1h"
+        templates: Tenant template set (defaults when not customised)
         
     Returns:
         Dict with to, text, and context
     """
-    phone = appointment.get("phone")
-    name = appointment.get("name", "Cliente")
-    date = appointment.get("date_display", appointment.get("date"))
-    time = appointment.get("time")
-    location = appointment.get("location", "nuestra oficina")
-    
-    if reminder_type == "1h":
-        text = (
-            f"Hola {name}! Tu cita es en 1 hora.\n\n"
-            f"Hora: {time}\n"
-            f"Lugar: {location}\n\n"
-            "Te esperamos!"
-        )
-    else:
-        text = (
-            f"Hola {name}! Recordatorio: Tienes una cita manana.\n\n"
-            f"Fecha: {date}\n"
-            f"Hora: {time}\n"
-            f"Lugar: {location}\n\n"
-            "Confirma tu asistencia:\n"
-            "1. Confirmo\n"
-            "2. Necesito cancelar"
-        )
-    
-    return {
-        "to": phone,
-        "text": text,
-        "notification_type": f"reminder_{reminder_type}",
-        "context": {
-            "appointment_id": appointment.get("id"),
-            "date": date,
-            "time": time
-        },
-        "pending_action": "confirm_appointment" if reminder_type == "24h" else None
-    }
+    return build_appointment_reminders([appointment], reminder_type, templates)[0]
 
 
 async def send_order_update(
     db: Any,
     tenant_id: str,
     order: Dict[str, Any],
-    update_type: str
+    update_type: str,
+    templates: TemplateSet = DEFAULT_TEMPLATES
 ) -> Dict[str, Any]:
     """
     Prepare order update message.
@@ -257,6 +281,7 @@ async def send_order_update(
         tenant_id: Tenant ID
         order: Order data
         update_type: "shipped" or "delivered"
+        templates: Tenant template set (defaults when not customised)
         
     Returns:
         Dict with to, text, and context
@@ -265,19 +290,16 @@ async def send_order_update(
     order_id = order.get("id", "N/A")
     
     if update_type == "shipped":
-        text = (
-            f"Tu pedido #{order_id} ha sido enviado!\n\n"
-            f"Numero de rastreo: {order.get('tracking', 'N/A')}\n"
-            f"Entrega estimada: {order.get('eta', 'En 3-5 dias')}\n\n"
-            f"Rastrear: {order.get('tracking_url', '#')}"
+        text = templates.render(
+            "ORDER_SHIPPED",
+            order_id=order_id,
+            tracking=order.get("tracking", "N/A"),
+            eta=order.get("eta", "En 3-5 dias"),
+            tracking_url=order.get("tracking_url", "#")
         )
         pending_action = None
     else:
-        text = (
-            f"Tu pedido #{order_id} fue entregado!\n\n"
-            "Gracias por tu compra.\n"
-            "Calificanos del 1 al 5"
-        )
+        text = templates.render("ORDER_DELIVERED", order_id=order_id)
         pending_action = "rate_order"
     
     return {
@@ -293,7 +315,8 @@ async def send_payment_notification(
     db: Any,
     tenant_id: str,
     payment: Dict[str, Any],
-    notification_type: str
+    notification_type: str,
+    templates: TemplateSet = DEFAULT_TEMPLATES
 ) -> Dict[str, Any]:
     """
     Prepare payment notification message.
@@ -303,6 +326,7 @@ async def send_payment_notification(
         tenant_id: Tenant ID
         payment: Payment data
         notification_type: "received" or "due"
+        templates: Tenant template set (defaults when not customised)
         
     Returns:
         Dict with to, text, and context
@@ -311,18 +335,17 @@ async def send_payment_notification(
     amount = payment.get("amount", 0)
     
     if notification_type == "received":
-        text = (
-            f"Pago recibido!\n\n"
-            f"Monto: ${amount}\n"
-            f"Referencia: {payment.get('reference', 'N/A')}\n\n"
-            "Gracias por tu pago!"
+        text = templates.render(
+            "PAYMENT_RECEIVED",
+            amount=amount,
+            reference=payment.get("reference", "N/A")
         )
     else:
-        text = (
-            f"Recordatorio de pago\n\n"
-            f"Tienes un pago pendiente de ${amount}.\n"
-            f"Fecha limite: {payment.get('due_date', 'Pronto')}\n\n"
-            f"Pagar ahora: {payment.get('payment_url', '#')}"
+        text = templates.render(
+            "PAYMENT_DUE",
+            amount=amount,
+            due_date=payment.get("due_date", "Pronto"),
+            payment_url=payment.get("payment_url", "#")
         )
     
     return {
@@ -0,0 +1,350 @@
+"""
+Outbound Send Queue
+Durable, paced delivery of outgoing WhatsApp messages through the gateway
+"""
+
+from typing import Dict, Any, Callable, Optional, Tuple
+from collections import deque
+import asyncio
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+
+from .work_scheduler import BulkGovernor
+
+
+# Pacing per (tenant, sender number). WhatsApp throttles or bans linked
+# numbers that fan out too fast, so bulk traffic is spread out.
+SEND_RATE_PER_SEC = float(os.environ.get("OUTBOUND_RATE_PER_SEC", "0.5"))
+SEND_BURST = int(os.environ.get("OUTBOUND_BURST", "5"))
+SEND_JITTER_SEC = float(os.environ.get("OUTBOUND_JITTER_SEC", "0.8"))
+
+# Cap on bulk sends across all senders. The gateway also relays every
+# interactive reply; on top of this fixed cap, a governor (if set) runs
+# each send as Tier.BULK and slows down while interactive load is high.
+GATEWAY_RATE_PER_SEC = float(os.environ.get("OUTBOUND_GATEWAY_RATE_PER_SEC", "5"))
+GATEWAY_BURST = int(os.environ.get("OUTBOUND_GATEWAY_BURST", "10"))
+
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_SEC = 2.0
+GATEWAY_TIMEOUT = 15.0
+
+SPOOL_DIR = os.environ.get("OUTBOUND_SPOOL_DIR", "/tmp/softfawer-outbound")
+
+# A consumer that hasn't refreshed its lease for this long is presumed dead
+# and its claimed messages go back to pending
+LEASE_SECONDS = 120.0
+POLL_SECONDS = 2.0
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `burst` banked"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def try_take(self) -> float:
+        """Take a token if available; otherwise return seconds until one is"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self, jitter: float = 0.0) -> None:
+        while True:
+            wait = self.try_take()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait + random.uniform(0, jitter))
+
+
+async def deliver(client: Any, message: Dict[str, Any]) -> bool:
+    """POST one message to the WhatsApp gateway"""
+    gateway_url = os.environ.get("GATEWAY_URL", "http://localhost:3001")
+    tenant_id = message["tenant_id"]
+    try:
+        response = await client.post(
+            f"{gateway_url}/send/{tenant_id}",
+            json={"to": message["to"], "message": message["text"]},
+            timeout=GATEWAY_TIMEOUT
+        )
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Gateway send error ({tenant_id}): {e}")
+        return False
+
+
+class OutboundQueue:
+    """
+    Spool-backed outbound queue with a single paced consumer.
+
+    Producers (`enqueue`) only write the message to `pending/` and return.
+    A consumer (`run`) claims pending files by renaming them into its own
+    `claimed/<worker>/` directory, so each file is owned by exactly one
+    consumer, and keeps a lease file there fresh while it runs. Files are
+    removed only after the gateway accepts them, so a crashed consumer's
+    claims return to pending once its lease expires and are re-delivered.
+    Messages that keep failing are moved to `dead/` after MAX_ATTEMPTS.
+
+    on_delivered / on_dead are called with the message after the gateway
+    accepted it or it was dead-lettered (e.g. to record a reminder as sent).
+    With a governor, each send takes a Tier.BULK slot.
+    """
+
+    def __init__(
+        self,
+        spool_dir: str = SPOOL_DIR,
+        rate: float = SEND_RATE_PER_SEC,
+        burst: int = SEND_BURST,
+        jitter: float = SEND_JITTER_SEC,
+        gateway_rate: float = GATEWAY_RATE_PER_SEC,
+        worker_id: Optional[str] = None,
+        on_delivered: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_dead: Optional[Callable[[Dict[str, Any]], None]] = None,
+        governor: Optional[BulkGovernor] = None
+    ):
+        self.spool_dir = spool_dir
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]
+        self.on_delivered = on_delivered
+        self.on_dead = on_dead
+        self.governor = governor
+        self.pending_dir = os.path.join(spool_dir, "pending")
+        self.dead_dir = os.path.join(spool_dir, "dead")
+        self.claimed_root = os.path.join(spool_dir, "claimed")
+        self.claimed_dir = os.path.join(self.claimed_root, self.worker_id)
+        self._queues: Dict[Tuple[str, str], deque] = {}
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._gateway = TokenBucket(gateway_rate, GATEWAY_BURST)
+        self._workers: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._client = None
+        self._stopping = False
+        self.counters = {"enqueued": 0, "claimed": 0, "reclaimed": 0, "sent": 0, "retried": 0, "dead": 0}
+        for path in (self.pending_dir, self.dead_dir, self.claimed_root):
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def _key(message: Dict[str, Any]) -> Tuple[str, str]:
+        return (message["tenant_id"], message.get("from_number") or "default")
+
+    def _claimed_path(self, record_id: str) -> str:
+        return os.path.join(self.claimed_dir, f"{record_id}.json")
+
+    @staticmethod
+    def _write(path: str, record: Dict[str, Any]) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(record, f, default=str)
+        os.replace(tmp, path)
+
+    def enqueue(self, message: Dict[str, Any]) -> str:
+        """
+        Durably spool a message for the consumer and return immediately.
+
+        Args:
+            message: Dict with tenant_id, to, text and optional from_number
+
+        Returns:
+            Spool record ID
+        """
+        record = {
+            "id": f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}",
+            "enqueued_at": time.time(),
+            "attempts": 0,
+            "message": message
+        }
+        self._write(os.path.join(self.pending_dir, f"{record['id']}.json"), record)
+        self.counters["enqueued"] += 1
+        return record["id"]
+
+    def heartbeat(self) -> None:
+        """Refresh this consumer's lease on its claimed directory"""
+        os.makedirs(self.claimed_dir, exist_ok=True)
+        self._write(os.path.join(self.claimed_dir, "lease"), {"worker": self.worker_id, "at": time.time()})
+
+    def reclaim_stale(self) -> int:
+        """Return the claims of consumers whose lease expired to pending"""
+        moved = 0
+        now = time.time()
+        for worker in os.listdir(self.claimed_root):
+            if worker == self.worker_id:
+                continue
+            directory = os.path.join(self.claimed_root, worker)
+            try:
+                with open(os.path.join(directory, "lease")) as f:
+                    leased_at = json.load(f).get("at", 0)
+            except (OSError, ValueError):
+                # Lease not written yet (or unreadable): age the directory itself
+                leased_at = os.path.getmtime(directory)
+            if now - leased_at < LEASE_SECONDS:
+                continue
+            for name in os.listdir(directory):
+                if name.endswith(".json"):
+                    os.replace(os.path.join(directory, name), os.path.join(self.pending_dir, name))
+                    moved += 1
+            shutil.rmtree(directory, ignore_errors=True)
+        self.counters["reclaimed"] += moved
+        return moved
+
+    def claim(self) -> int:
+        """Take ownership of every pending message and queue it for delivery"""
+        self.heartbeat()
+        claimed = 0
+        for name in sorted(n for n in os.listdir(self.pending_dir) if n.endswith(".json")):
+            target = os.path.join(self.claimed_dir, name)
+            try:
+                # Atomic: exactly one consumer wins each file
+                os.rename(os.path.join(self.pending_dir, name), target)
+            except FileNotFoundError:
+                continue
+            with open(target) as f:
+                record = json.load(f)
+            self._queues.setdefault(self._key(record["message"]), deque()).append(record)
+            claimed += 1
+        self.counters["claimed"] += claimed
+        for key, queue in self._queues.items():
+            worker = self._workers.get(key)
+            if queue and (worker is None or worker.done()):
+                self._workers[key] = asyncio.create_task(self._drain_sender(key))
+        return claimed
+
+    def _notify(self, callback: Optional[Callable[[Dict[str, Any]], None]], message: Dict[str, Any]) -> None:
+        if callback is None:
+            return
+        try:
+            callback(message)
+        except Exception as e:
+            print(f"Outbound callback error ({message.get('tenant_id')}): {e}")
+
+    async def _send(self, message: Dict[str, Any]) -> bool:
+        if self.governor is None:
+            return await deliver(self._client, message)
+        async with self.governor.slot():
+            return await deliver(self._client, message)
+
+    async def _drain_sender(self, key: Tuple[str, str]) -> None:
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient()
+
+        queue = self._queues[key]
+        bucket = self._buckets.setdefault(key, TokenBucket(self.rate, self.burst))
+
+        while queue and not self._stopping:
+            record = queue[0]
+            await bucket.acquire(self.jitter)
+            await self._gateway.acquire()
+
+            delivered = await self._send(record["message"])
+
+            if delivered:
+                queue.popleft()
+                os.remove(self._claimed_path(record["id"]))
+                self.counters["sent"] += 1
+                self._notify(self.on_delivered, record["message"])
+                continue
+
+            record["attempts"] += 1
+            if record["attempts"] >= MAX_ATTEMPTS:
+                queue.popleft()
+                os.replace(self._claimed_path(record["id"]), os.path.join(self.dead_dir, f"{record['id']}.json"))
+                self.counters["dead"] += 1
+                print(f"Outbound message {record['id']} dead-lettered after {MAX_ATTEMPTS} attempts")
+                self._notify(self.on_dead, record["message"])
+            else:
+                self._write(self._claimed_path(record["id"]), record)
+                self.counters["retried"] += 1
+                await asyncio.sleep(RETRY_BACKOFF_SEC * 2 ** (record["attempts"] - 1))
+
+    async def run(self, duration: float, sync: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+        """
+        Consume the spool for `duration` seconds.
+
+        Every POLL_SECONDS the lease is refreshed, stale claims are returned,
+        and new pending messages are claimed. `sync` is called before each
+        poll to publish local spool changes and see other producers' (e.g.
+        commit + reload of a shared volume). When time is up, in-flight sends
+        finish and unsent claims go back to pending.
+        """
+        deadline = time.monotonic() + duration
+        self._stopping = False
+        try:
+            while time.monotonic() < deadline:
+                if sync is not None:
+                    sync()
+                self.reclaim_stale()
+                self.claim()
+                await asyncio.sleep(POLL_SECONDS)
+        finally:
+            self._stopping = True
+            workers = [w for w in self._workers.values() if not w.done()]
+            if workers:
+                await asyncio.gather(*workers, return_exceptions=True)
+            self._release_claims()
+            if self._client is not None:
+                await self._client.aclose()
+                self._client = None
+            if sync is not None:
+                sync()
+        return self.metrics()
+
+    def _release_claims(self) -> None:
+        """Hand unsent claimed messages back to pending for the next consumer"""
+        for queue in self._queues.values():
+            while queue:
+                record = queue.popleft()
+                os.replace(self._claimed_path(record["id"]), os.path.join(self.pending_dir, f"{record['id']}.json"))
+        shutil.rmtree(self.claimed_dir, ignore_errors=True)
+
+    def spool_depth(self) -> Dict[str, int]:
+        """Messages on disk: pending, claimed by any consumer, and dead-lettered"""
+        claimed = 0
+        for worker in os.listdir(self.claimed_root):
+            directory = os.path.join(self.claimed_root, worker)
+            if os.path.isdir(directory):
+                claimed += sum(1 for name in os.listdir(directory) if name.endswith(".json"))
+        return {
+            "pending": sum(1 for name in os.listdir(self.pending_dir) if name.endswith(".json")),
+            "claimed": claimed,
+            "dead": sum(1 for name in os.listdir(self.dead_dir) if name.endswith(".json"))
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Spool depth on disk, plus depth and age of the oldest claimed message, overall and per sender"""
+        now = time.time()
+        senders = {}
+        for (tenant_id, sender), queue in self._queues.items():
+            if queue:
+                senders[f"{tenant_id}/{sender}"] = {
+                    "depth": len(queue),
+                    "oldest_age_s": round(now - queue[0]["enqueued_at"], 1)
+                }
+        return {
+            "depth": sum(s["depth"] for s in senders.values()),
+            "oldest_age_s": max((s["oldest_age_s"] for s in senders.values()), default=0.0),
+            "senders": senders,
+            "spool": self.spool_depth(),
+            **self.counters
+        }
+
+
+_QUEUE: Optional[OutboundQueue] = None
+
+
+def get_outbound_queue() -> OutboundQueue:
+    """Process-wide queue handle (producers enqueue; the consumer calls run())"""
+    global _QUEUE
+    if _QUEUE is None:
+        _QUEUE = OutboundQueue()
+    return _QUEUE
@@ -0,0 +1,244 @@
+"""
+Platform Rollup
+Incremental, idempotent merge of per-tenant daily counters into platform-wide totals
+"""
+
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+
+from .analytics import nest_counts, read_counter
+from .work_scheduler import BulkGovernor
+
+
+ROLLUP_CONCURRENCY = int(os.environ.get("PLATFORM_ROLLUP_CONCURRENCY", "16"))
+
+# Activity newer than this is left for the next run, so counter batches
+# that were still committing when we read are not skipped
+SETTLE_DELAY = timedelta(seconds=60)
+
+DAY_FORMAT = "%Y%m%d"
+
+# Days kept in a tenant's analytics_activity flags once they have been merged
+ACTIVITY_RETENTION_DAYS = int(os.environ.get("ANALYTICS_ACTIVITY_RETENTION_DAYS", "7"))
+
+WRITE_ATTEMPTS = 3
+
+
+def _flatten(nested: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in nested.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+
+def _days(start: datetime, end: datetime) -> List[str]:
+    """Every UTC day touched by [start, end]"""
+    days = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= end:
+        days.append(day.strftime(DAY_FORMAT))
+        day += timedelta(days=1)
+    return days
+
+
+def _platform_ref(db: Any) -> Any:
+    return db.collection("platform_metrics")
+
+
+def stale_days(written: Dict[str, datetime], until: datetime, retention_days: int = ACTIVITY_RETENTION_DAYS) -> List[str]:
+    """Activity flags a run up to `until` has merged, for days before its retention window"""
+    cutoff = (until - timedelta(days=retention_days)).strftime(DAY_FORMAT)
+    # Firestore returns tz-aware timestamps; we write naive UTC
+    return sorted(day for day, at in written.items() if day < cutoff and at.replace(tzinfo=None) <= until)
+
+
+def _active_tenants(db: Any, since: datetime, until: datetime) -> Tuple[Dict[str, List[str]], List[Tuple[Any, Any, List[str]]]]:
+    """
+    Tenants flagged since the watermark, with the days their counters were
+    written, and (reference, update time, stale days) of the flags to prune
+    once this window is merged
+    """
+    docs = db.collection("analytics_activity")\
+             .where("updated_at", ">", since)\
+             .where("updated_at", "<=", until)\
+             .select(["tenant_id", "days"]).stream()
+    window_days = _days(since, until)
+    tenants = {}
+    stale = []
+    for doc in docs:
+        written = doc.to_dict().get("days") or {}
+        days = [day for day, at in written.items() if at.replace(tzinfo=None) > since]
+        tenants[doc.id] = sorted(days) if days else window_days
+        old = stale_days(written, until)
+        if old:
+            stale.append((doc.reference, doc.update_time, old))
+    return tenants, stale
+
+
+def _prune_activity(db: Any, stale: List[Tuple[Any, Any, List[str]]]) -> int:
+    """
+    Drop merged day flags outside the retention window, so a tenant's
+    activity document stays small however long it has been active.
+
+    Each update is conditioned on the document's update time when it was
+    read; a document flagged again meanwhile is left for the next run.
+
+    Returns:
+        Number of day flags queued for removal
+    """
+    from google.cloud import firestore
+    from google.rpc import code_pb2
+
+    writer = db.bulk_writer()
+    writer.on_write_error(
+        lambda failure: failure.code != code_pb2.FAILED_PRECONDITION and failure.attempts < WRITE_ATTEMPTS
+    )
+    pruned = 0
+    for ref, update_time, days in stale:
+        writer.update(
+            ref,
+            {firestore.FieldPath("days", day).to_api_repr(): firestore.DELETE_FIELD for day in days},
+            option=db.write_option(last_update_time=update_time)
+        )
+        pruned += len(days)
+    writer.close()
+    return pruned
+
+
+def rollup_tenant_day(db: Any, tenant_id: str, day: str) -> bool:
+    """
+    Merge one tenant's daily counter into the platform total for that day.
+
+    The values last merged are kept in platform_metrics/{day}/tenants/{id}.
+    The delta against them and the new snapshot are written in one
+    transaction, so a crashed or overlapping run can't apply a delta twice;
+    a counter read that is older than the snapshot is skipped.
+
+    Returns:
+        True if the platform total changed
+    """
+    from google.cloud import firestore
+
+    current = _flatten(read_counter(db, tenant_id, day))
+    if not current:
+        return False
+    day_ref = _platform_ref(db).document(day)
+    seen_ref = day_ref.collection("tenants").document(tenant_id)
+
+    @firestore.transactional
+    def _merge(transaction) -> bool:
+        seen_doc = seen_ref.get(transaction=transaction)
+        seen = seen_doc.to_dict().get("counts", {}) if seen_doc.exists else {}
+        # Counters only grow; a lower value means another run already merged a newer read
+        if any(value < seen.get(field, 0) for field, value in current.items()):
+            return False
+        delta = {field: value - seen.get(field, 0) for field, value in current.items()}
+        delta = {field: value for field, value in delta.items() if value}
+        if not delta:
+            return False
+
+        now = datetime.utcnow()
+        transaction.set(day_ref, {
+            "day": day,
+            "updated_at": now,
+            **nest_counts(delta, firestore.Increment)
+        }, merge=True)
+        transaction.set(seen_ref, {"counts": current, "updated_at": now})
+        return True
+
+    return _merge(db.transaction())
+
+
+def _semaphore_slot(concurrency: int) -> Callable[[], Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    return lambda: semaphore
+
+
+async def run_platform_rollup(
+    db: Any,
+    now: Optional[datetime] = None,
+    concurrency: int = ROLLUP_CONCURRENCY,
+    governor: Optional[BulkGovernor] = None
+) -> Dict[str, Any]:
+    """
+    Merge the daily counters of recently active tenants into platform totals.
+
+    Only tenants flagged in analytics_activity since the watermark are read,
+    at most `concurrency` at a time (as Tier.BULK slots of `governor` when
+    given, so fewer while interactive load is high), and only for the days
+    they wrote to.
+    Once the watermark advances, the merged day flags of those tenants older
+    than ACTIVITY_RETENTION_DAYS are removed from analytics_activity.
+    Each tenant-day is merged into platform_metrics/{YYYYMMDD} by
+    rollup_tenant_day, so global dashboards read a single document per day
+    however many tenants there are, and re-running a window is harmless.
+    The watermark only advances when every tenant was merged.
+
+    Args:
+        db: Firestore client
+        now: Override for the current UTC time
+        concurrency: Tenants processed in parallel
+        governor: Sizes the rollup to interactive load instead of `concurrency`
+
+    Returns:
+        Dict with window, tenant, day and pruned flag counts and elapsed seconds
+    """
+    started = time.monotonic()
+    now = now or datetime.utcnow()
+    wm_ref = _platform_ref(db).document("_watermark")
+    wm_doc = wm_ref.get()
+    since = wm_doc.to_dict()["processed_until"].replace(tzinfo=None) if wm_doc.exists else now - timedelta(days=1)
+    until = now - SETTLE_DELAY
+    if until <= since:
+        return {"tenants": 0, "days": 0, "since": since.isoformat(), "until": since.isoformat(), "elapsed_s": 0.0}
+
+    tenants, stale = _active_tenants(db, since, until)
+    slot = governor.slot if governor is not None else _semaphore_slot(concurrency)
+    errors = 0
+
+    async def _one(tenant_id: str, days: List[str]) -> List[str]:
+        nonlocal errors
+        async with slot():
+            changed = []
+            for day in days:
+                try:
+                    if await asyncio.to_thread(rollup_tenant_day, db, tenant_id, day):
+                        changed.append(day)
+                except Exception as e:
+                    errors += 1
+                    print(f"Platform rollup error ({tenant_id}/{day}): {e}")
+            return changed
+
+    changed_days = set()
+    for days in await asyncio.gather(*(_one(t, d) for t, d in tenants.items())):
+        changed_days.update(days)
+
+    # Failed tenant-days are retried next run; merges are idempotent
+    pruned = 0
+    if not errors:
+        wm_ref.set({"processed_until": until, "last_tenants": len(tenants)})
+        if stale:
+            pruned = await asyncio.to_thread(_prune_activity, db, stale)
+
+    return {
+        "tenants": len(tenants),
+        "days": len(changed_days),
+        "pruned": pruned,
+        "errors": errors,
+        "since": since.isoformat(),
+        "until": (until if not errors else since).isoformat(),
+        "elapsed_s": round(time.monotonic() - started, 2)
+    }
+
+
+def read_platform_day(db: Any, day: str) -> Dict[str, Any]:
+    """Platform totals for one UTC day (YYYYMMDD)"""
+    doc = _platform_ref(db).document(day).get()
+    return doc.to_dict() if doc.exists else {}
@@ -0,0 +1,286 @@
+"""
+Reminder Dispatcher
+Scheduled bulk sending of appointment reminders across tenants
+"""
+
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import time
+import uuid
+
+from templates import DEFAULT_TEMPLATES, TemplateSet, get_templates
+from .analytics import get_aggregator
+from .notification_bot import build_appointment_reminders
+from .reminder_index import REMINDER_LEADS, claim_bucket, read_due, release_bucket
+from .outbound_queue import get_outbound_queue
+from .conversation_state import Flow, conversation_ref, expiry_fields
+from .work_scheduler import BulkGovernor
+
+
+PAGE_SIZE = 500
+
+# A tick that hasn't checkpointed for this long is presumed dead (ticks time
+# out after 5 minutes, like the bucket leases); the next tick adopts its
+# holder, so its unexpired leases are reused, and resumes after its cursor
+TICK_STALE = timedelta(minutes=2)
+
+
+def load_notification_service(db: Any, tenant_id: str) -> Tuple[Optional[str], TemplateSet]:
+    """
+    The tenant's notification service ID and its template set, compiled once per version.
+
+    The service ID is None when the tenant has no notification service.
+    """
+    services = db.collection("tenants").document(tenant_id)\
+                 .collection("services")\
+                 .where("type", "==", "notification")\
+                 .limit(1).stream()
+    for doc in services:
+        return doc.id, get_templates(tenant_id, doc.id, doc.to_dict())
+    return None, DEFAULT_TEMPLATES
+
+
+def build_reminder_batch(
+    db: Any,
+    docs: List[Any],
+    reminder_type: str,
+    services_cache: Optional[Dict[str, Tuple[Optional[str], TemplateSet]]] = None
+) -> List[Tuple[Any, Dict[str, Any], Dict[str, Any]]]:
+    """
+    Build reminder messages for a page of appointment snapshots.
+
+    Appointments are grouped by tenant and rendered in bulk with each
+    tenant's notification templates.
+
+    Returns:
+        List of (appointment_ref, message, appointment) tuples for appointments
+        that have not received this reminder yet; messages carry tenant_id
+        and the notification service_id
+    """
+    services_cache = {} if services_cache is None else services_cache
+    by_tenant: Dict[str, List[Tuple[Any, Dict[str, Any]]]] = {}
+    for doc in docs:
+        apt = doc.to_dict()
+        if apt.get("reminders_sent", {}).get(reminder_type) or not apt.get("phone"):
+            continue
+        apt["id"] = doc.id
+        by_tenant.setdefault(doc.reference.parent.parent.id, []).append((doc.reference, apt))
+
+    batch = []
+    for tenant_id, items in by_tenant.items():
+        if tenant_id not in services_cache:
+            services_cache[tenant_id] = load_notification_service(db, tenant_id)
+        service_id, templates = services_cache[tenant_id]
+        messages = build_appointment_reminders([apt for _, apt in items], reminder_type, templates)
+        for (apt_ref, apt), message in zip(items, messages):
+            message["tenant_id"] = tenant_id
+            message["service_id"] = service_id
+            # Lets the outbound consumer record the outcome on the appointment
+            message["appointment_path"] = apt_ref.path
+            message["reminder_type"] = reminder_type
+            batch.append((apt_ref, message, apt))
+    return batch
+
+
+def write_notification_context(db: Any, batch: List[Tuple[Any, Dict[str, Any], Dict[str, Any]]]) -> None:
+    """Store pending actions so replies are routed by handle_notification_bot"""
+    writer = db.bulk_writer()
+    now = datetime.utcnow()
+    for _, message, _ in batch:
+        # Replies can only be handled if the tenant has a notification service
+        if not message.get("pending_action") or not message.get("service_id"):
+            continue
+        conv_ref = conversation_ref(db, message["tenant_id"], message["to"], message["service_id"])
+        writer.set(conv_ref, {
+            "pending_notification_action": message["pending_action"],
+            "notification_context": message["context"],
+            "updated_at": now,
+            **expiry_fields(Flow.NOTIFICATION, now)
+        }, merge=True)
+    writer.close()
+
+
+def mark_sent(db: Any, message: Dict[str, Any]) -> None:
+    """Outbound on_delivered hook: flag the reminder as sent once the gateway accepted it"""
+    if not message.get("appointment_path"):
+        return
+    db.document(message["appointment_path"]).update({
+        f"reminders_sent.{message['reminder_type']}": datetime.utcnow()
+    })
+
+
+def mark_failed(db: Any, message: Dict[str, Any]) -> None:
+    """Outbound on_dead hook: record a reminder the gateway never accepted"""
+    if not message.get("appointment_path"):
+        return
+    db.document(message["appointment_path"]).update({
+        f"reminders_failed.{message['reminder_type']}": datetime.utcnow()
+    })
+    get_aggregator().incr(message["tenant_id"], "reminders.failed")
+
+
+def _tick_checkpoint_ref(db: Any) -> Any:
+    return db.collection("dispatcher_checkpoints").document("reminder_tick")
+
+
+def _start_tick(db: Any, holder: str) -> Tuple[str, Optional[Dict[str, str]], bool]:
+    """
+    Take the tick checkpoint, adopting a dead tick's.
+
+    Returns:
+        (holder, cursor, owned); holder and cursor are the dead tick's when
+        resuming it, and owned is False while a live tick holds the checkpoint
+    """
+    from google.cloud import firestore
+
+    ckpt_ref = _tick_checkpoint_ref(db)
+
+    @firestore.transactional
+    def _start(transaction) -> Tuple[str, Optional[Dict[str, str]], bool]:
+        now = datetime.utcnow()
+        snap = ckpt_ref.get(transaction=transaction)
+        ckpt = snap.to_dict() if snap.exists else {}
+        if ckpt.get("status") == "running":
+            # Firestore returns tz-aware timestamps; we write naive UTC
+            if ckpt["heartbeat_at"].replace(tzinfo=None) > now - TICK_STALE:
+                return holder, None, False
+            transaction.update(ckpt_ref, {"heartbeat_at": now, "resumed_at": now})
+            return ckpt["holder"], ckpt.get("cursor"), True
+        transaction.set(ckpt_ref, {
+            "status": "running",
+            "holder": holder,
+            "cursor": None,
+            "started_at": now,
+            "heartbeat_at": now
+        })
+        return holder, None, True
+
+    return _start(db.transaction())
+
+
+async def run_reminder_tick(
+    db: Any,
+    now: Optional[datetime] = None,
+    persist: Optional[Callable[[], None]] = None,
+    governor: Optional[BulkGovernor] = None
+) -> Dict[str, Any]:
+    """
+    Send every reminder whose index entry is due.
+
+    Reads only the due entries of the global reminder index, so the cost is
+    proportional to reminders due rather than to tenants or appointments.
+    Each due-minute bucket is leased before its entries are sent, so ticks
+    that overlap (a slow run and the next minute's) split the work instead
+    of sending it twice. Messages are spooled to the outbound queue and
+    `persist` makes the spool durable before the entries are deleted; the
+    outbound consumer sends them and marks them sent.
+
+    Progress is checkpointed in dispatcher_checkpoints/reminder_tick after
+    every page. A tick that died mid-run is resumed by the next one from its
+    cursor, under its holder; a tick that overlaps a live one runs without
+    the checkpoint and relies on the bucket leases alone.
+
+    Args:
+        db: Firestore client
+        now: Override for the current time
+        persist: Called after each page is spooled (e.g. commit the spool volume)
+        governor: Runs each page as Tier.BULK, yielding to interactive load
+
+    Returns:
+        Dict with counts and elapsed seconds
+    """
+    started = time.monotonic()
+    now = now or datetime.now()
+    holder, resume, owns_checkpoint = _start_tick(db, uuid.uuid4().hex)
+    stats = {"queued": 0, "skipped": 0, "pages": 0, "leased_elsewhere": 0, "resumed": resume is not None}
+    queue = get_outbound_queue()
+    services_cache: Dict[str, Tuple[Optional[str], TemplateSet]] = {}
+    buckets: Dict[str, bool] = {}
+    ckpt_ref = _tick_checkpoint_ref(db)
+    # Entries before the cursor were deleted once queued, so field values stand in for them
+    cursor: Any = {"due_minute": resume["due_minute"], "__name__": resume["id"]} if resume else None
+
+    try:
+        while True:
+            page = read_due(db, now, PAGE_SIZE, after=cursor)
+            if not page:
+                break
+            cursor = page[-1]
+            stats["pages"] += 1
+
+            for entry in page:
+                minute = entry.get("due_minute")
+                if minute not in buckets:
+                    buckets[minute] = claim_bucket(db, minute, holder)
+            # Entries read before the lease was won may have been sent by its previous holder
+            owned = [entry.reference for entry in page if buckets[entry.get("due_minute")]]
+            stats["leased_elsewhere"] += len(page) - len(owned)
+            entries = [doc for doc in db.get_all(owned) if doc.exists] if owned else []
+
+            if entries and governor is not None:
+                async with governor.slot():
+                    stats["queued"] += _queue_entries(db, entries, queue, services_cache, stats, persist)
+            elif entries:
+                stats["queued"] += _queue_entries(db, entries, queue, services_cache, stats, persist)
+
+            if owns_checkpoint:
+                ckpt_ref.update({
+                    "cursor": {"due_minute": cursor.get("due_minute"), "id": cursor.id},
+                    "heartbeat_at": datetime.utcnow()
+                })
+
+            if len(page) < PAGE_SIZE:
+                break
+    finally:
+        for minute, owned in buckets.items():
+            if owned:
+                release_bucket(db, minute, holder)
+
+    stats["elapsed_s"] = round(time.monotonic() - started, 2)
+    if owns_checkpoint:
+        ckpt_ref.set({"status": "done", "holder": None, "cursor": None, "finished_at": datetime.utcnow(), "last_stats": stats})
+    return stats
+
+
+def _queue_entries(
+    db: Any,
+    entries: List[Any],
+    queue: Any,
+    services_cache: Dict[str, Tuple[Optional[str], TemplateSet]],
+    stats: Dict[str, Any],
+    persist: Optional[Callable[[], None]] = None
+) -> int:
+    """Render and queue the reminders of a page of index entries, then delete the entries"""
+    # One batched read for the whole page of appointments
+    apt_refs = [
+        db.collection("tenants").document(entry.get("tenant_id"))
+          .collection("appointments").document(entry.get("appointment_id"))
+        for entry in entries
+    ]
+    apt_docs = {doc.reference.path: doc for doc in db.get_all(apt_refs)}
+
+    queued = 0
+    for reminder_type in REMINDER_LEADS:
+        live = []
+        for entry, apt_ref in zip(entries, apt_refs):
+            if entry.get("reminder_type") != reminder_type:
+                continue
+            doc = apt_docs.get(apt_ref.path)
+            if doc is None or not doc.exists or doc.to_dict().get("status") != "confirmed":
+                stats["skipped"] += 1
+                continue
+            live.append(doc)
+
+        batch = build_reminder_batch(db, live, reminder_type, services_cache)
+        write_notification_context(db, batch)
+        for _, message, _ in batch:
+            queue.enqueue(message)
+        queued += len(batch)
+
+    if persist is not None:
+        persist()
+    writer = db.bulk_writer()
+    for entry in entries:
+        writer.delete(entry.reference)
+    writer.close()
+    return queued
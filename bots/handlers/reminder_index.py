@@ -0,0 +1,216 @@
+"""
+Reminder Index
+Global due-time index of appointment reminders, maintained at booking time
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+
+
+# Lead time before the appointment for each reminder type
+REMINDER_LEADS = {
+    "24h": timedelta(hours=24),
+    "1h": timedelta(hours=1),
+}
+
+MINUTE_FORMAT = "%Y%m%d%H%M"
+
+# A due-minute bucket claimed by a tick stays reserved this long; more than
+# enough for one page, short enough that a crashed tick's buckets are retried
+BUCKET_LEASE = timedelta(minutes=5)
+
+BACKFILL_PAGE_SIZE = 500
+
+
+def _entry_id(due_minute: str, tenant_id: str, appointment_id: str, reminder_type: str) -> str:
+    return f"{due_minute}_{tenant_id}_{appointment_id}_{reminder_type}"
+
+
+def reminder_entries(
+    tenant_id: str,
+    appointment_id: str,
+    appointment: Dict[str, Any]
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """Index entries (doc_id, data) for every reminder type of an appointment"""
+    starts_at = appointment.get("starts_at")
+    if not starts_at:
+        return []
+    start = datetime.strptime(starts_at, "%Y-%m-%dT%H:%M")
+
+    entries = []
+    for reminder_type, lead in REMINDER_LEADS.items():
+        due_minute = (start - lead).strftime(MINUTE_FORMAT)
+        entries.append((_entry_id(due_minute, tenant_id, appointment_id, reminder_type), {
+            "due_minute": due_minute,
+            "tenant_id": tenant_id,
+            "appointment_id": appointment_id,
+            "reminder_type": reminder_type
+        }))
+    return entries
+
+
+def index_appointment(db: Any, tenant_id: str, appointment_id: str, appointment: Dict[str, Any]) -> int:
+    """
+    Add an appointment's upcoming reminders to the index.
+
+    Reminders whose due time has already passed (bookings made less than
+    24h ahead) are skipped.
+
+    Returns:
+        Number of entries written
+    """
+    now_minute = datetime.now().strftime(MINUTE_FORMAT)
+    index_ref = db.collection("reminder_index")
+    batch = db.batch()
+    written = 0
+
+    for doc_id, data in reminder_entries(tenant_id, appointment_id, appointment):
+        if data["due_minute"] < now_minute:
+            continue
+        data["created_at"] = datetime.utcnow()
+        batch.set(index_ref.document(doc_id), data)
+        written += 1
+
+    if written:
+        batch.commit()
+    return written
+
+
+def unindex_appointment(db: Any, tenant_id: str, appointment_id: str, appointment: Dict[str, Any]) -> None:
+    """Remove an appointment's reminders (e.g. after cancellation)"""
+    index_ref = db.collection("reminder_index")
+    batch = db.batch()
+    for doc_id, _ in reminder_entries(tenant_id, appointment_id, appointment):
+        batch.delete(index_ref.document(doc_id))
+    batch.commit()
+
+
+def read_due(db: Any, up_to: datetime, limit: int, after: Optional[Any] = None) -> List[Any]:
+    """Index entries due at or before `up_to`, oldest first"""
+    query = db.collection("reminder_index")\
+              .where("due_minute", "<=", up_to.strftime(MINUTE_FORMAT))\
+              .order_by("due_minute")\
+              .order_by("__name__")
+    if after is not None:
+        query = query.start_after(after)
+    return list(query.limit(limit).stream())
+
+
+def claim_bucket(db: Any, due_minute: str, holder: str, ttl: timedelta = BUCKET_LEASE) -> bool:
+    """
+    Lease a due-minute bucket so overlapping ticks don't send its reminders twice.
+
+    Returns:
+        True if `holder` now owns the bucket (or already did), False if
+        another tick holds an unexpired lease on it
+    """
+    from google.cloud import firestore
+
+    lease_ref = db.collection("reminder_index_leases").document(due_minute)
+
+    @firestore.transactional
+    def _claim(transaction) -> bool:
+        now = datetime.utcnow()
+        snap = lease_ref.get(transaction=transaction)
+        lease = snap.to_dict() if snap.exists else None
+        if lease and lease.get("holder") != holder:
+            # Firestore returns tz-aware timestamps; we write naive UTC
+            if lease["expires_at"].replace(tzinfo=None) > now:
+                return False
+        transaction.set(lease_ref, {"holder": holder, "expires_at": now + ttl})
+        return True
+
+    return _claim(db.transaction())
+
+
+def release_bucket(db: Any, due_minute: str, holder: str) -> None:
+    """Drop a bucket lease if `holder` still owns it"""
+    lease_ref = db.collection("reminder_index_leases").document(due_minute)
+    snap = lease_ref.get()
+    if snap.exists and snap.to_dict().get("holder") == holder:
+        try:
+            lease_ref.delete(option=db.write_option(last_update_time=snap.update_time))
+        except Exception as e:
+            print(f"Bucket lease release skipped: {e}")
+
+
+def _backfill_query(db: Any, since: str) -> Any:
+    """Confirmed appointments starting at or after `since`, across all tenants"""
+    return db.collection_group("appointments")\
+             .where("status", "==", "confirmed")\
+             .where("starts_at", ">=", since)\
+             .order_by("starts_at")\
+             .order_by("__name__")
+
+
+def backfill_reminder_index(
+    db: Any,
+    now: Optional[datetime] = None,
+    page_size: int = BACKFILL_PAGE_SIZE
+) -> Dict[str, Any]:
+    """
+    One-time index build for appointments booked before the index existed.
+
+    Upcoming confirmed appointments are read page by page with a
+    collection-group range query on starts_at, and their pending reminders
+    are written to the index. Entry IDs are deterministic, so appointments
+    already indexed at booking time are just rewritten. The checkpoint in
+    dispatcher_checkpoints/reminder_backfill is updated after every page:
+    an interrupted run resumes from its cursor, and a finished backfill
+    returns at once.
+
+    Args:
+        db: Firestore client
+        now: Override for the current time
+        page_size: Appointments fetched per query
+
+    Returns:
+        Dict with scanned/indexed counts and the checkpoint status
+    """
+    ckpt_ref = db.collection("dispatcher_checkpoints").document("reminder_backfill")
+    ckpt_doc = ckpt_ref.get()
+    ckpt = ckpt_doc.to_dict() if ckpt_doc.exists else {}
+    if ckpt.get("status") == "done":
+        return {"status": "done", **(ckpt.get("last_stats") or {})}
+
+    if ckpt.get("status") == "running":
+        since = ckpt["since"]
+        stats = ckpt.get("stats") or {"scanned": 0, "indexed": 0, "pages": 0}
+        cursor = db.document(ckpt["cursor"]).get() if ckpt.get("cursor") else None
+    else:
+        since = (now or datetime.now()).strftime("%Y-%m-%dT%H:%M")
+        stats = {"scanned": 0, "indexed": 0, "pages": 0}
+        cursor = None
+        ckpt_ref.set({"status": "running", "since": since, "cursor": None, "stats": stats, "started_at": datetime.utcnow()})
+
+    now_minute = (now or datetime.now()).strftime(MINUTE_FORMAT)
+    index_ref = db.collection("reminder_index")
+    query = _backfill_query(db, since)
+
+    while True:
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(page_size).stream())
+        if not docs:
+            break
+
+        writer = db.bulk_writer()
+        for doc in docs:
+            apt = doc.to_dict()
+            sent = apt.get("reminders_sent") or {}
+            for doc_id, data in reminder_entries(doc.reference.parent.parent.id, doc.id, apt):
+                if data["due_minute"] < now_minute or sent.get(data["reminder_type"]):
+                    continue
+                data["created_at"] = datetime.utcnow()
+                writer.set(index_ref.document(doc_id), data)
+                stats["indexed"] += 1
+        writer.close()
+
+        stats["scanned"] += len(docs)
+        stats["pages"] += 1
+        cursor = docs[-1]
+        ckpt_ref.update({"cursor": cursor.reference.path, "stats": stats, "updated_at": datetime.utcnow()})
+        if len(docs) < page_size:
+            break
+
+    ckpt_ref.set({"status": "done", "since": since, "cursor": None, "last_stats": stats, "finished_at": datetime.utcnow()})
+    return {"status": "done", **stats}
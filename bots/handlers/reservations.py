@@ -0,0 +1,229 @@
+"""
+Slot Reservations
+Conflict-free booking through deterministic per-slot claim documents
+"""
+
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import re
+
+
+# How long a selected slot stays held while we ask for the customer's name
+HOLD_TTL_SECONDS = 300
+
+
+class ClaimStatus:
+    """Lifecycle of a slot claim document"""
+    HELD = "held"
+    BOOKED = "booked"
+
+
+def _claim_ids(date_str: str, time_str: str, staff: str, duration_min: int, slot_minutes: int) -> List[str]:
+    """Deterministic claim document IDs for every slot a booking covers"""
+    staff_key = re.sub(r"[^a-z0-9]+", "-", staff.lower()).strip("-") or "staff"
+    hour, minute = time_str.split(":")
+    start = int(hour) * 60 + int(minute)
+    length = max(1, -(-duration_min // slot_minutes))
+
+    ids = []
+    for i in range(length):
+        minutes = start + i * slot_minutes
+        ids.append(f"{date_str}_{staff_key}_{minutes // 60:02d}{minutes % 60:02d}")
+    return ids
+
+
+def _claim_refs(db: Any, tenant_id: str, ids: List[str]) -> List[Any]:
+    claims_ref = db.collection("tenants").document(tenant_id).collection("slot_claims")
+    return [claims_ref.document(claim_id) for claim_id in ids]
+
+
+def _is_taken(claim: Optional[Dict[str, Any]], holder: str, now: datetime) -> bool:
+    """A claim blocks `holder` if it is booked, or actively held by someone else"""
+    if not claim:
+        return False
+    if claim.get("status") == ClaimStatus.BOOKED:
+        return True
+    if claim.get("holder") == holder:
+        return False
+    expires_at = claim.get("expires_at")
+    if expires_at is None:
+        return False
+    # Firestore returns tz-aware timestamps; we write naive UTC
+    return expires_at.replace(tzinfo=None) > now
+
+
+def hold_slot(
+    db: Any,
+    tenant_id: str,
+    slot: Dict[str, Any],
+    holder: str,
+    slot_minutes: int,
+    ttl_seconds: int = HOLD_TTL_SECONDS
+) -> bool:
+    """
+    Place a short-lived hold on a slot for one customer.
+
+    Args:
+        db: Firestore client
+        tenant_id: Tenant ID
+        slot: Dict with date, time, staff and duration_min
+        holder: Customer phone number
+        slot_minutes: Slot granularity of the business
+        ttl_seconds: Hold lifetime
+
+    Returns:
+        True if the hold was placed (or refreshed), False if the slot is taken
+    """
+    from google.cloud import firestore
+
+    refs = _claim_refs(db, tenant_id, _claim_ids(
+        slot["date"], slot["time"], slot["staff"], slot["duration_min"], slot_minutes
+    ))
+
+    @firestore.transactional
+    def _hold(transaction) -> bool:
+        now = datetime.utcnow()
+        for snap in db.get_all(refs, transaction=transaction):
+            if _is_taken(snap.to_dict() if snap.exists else None, holder, now):
+                return False
+
+        for ref in refs:
+            transaction.set(ref, {
+                "status": ClaimStatus.HELD,
+                "holder": holder,
+                "date": slot["date"],
+                "staff": slot["staff"],
+                "expires_at": now + timedelta(seconds=ttl_seconds),
+                "updated_at": now
+            })
+        return True
+
+    return _hold(db.transaction())
+
+
+def book_slot(
+    db: Any,
+    tenant_id: str,
+    appointment: Dict[str, Any],
+    holder: str,
+    slot_minutes: int
+) -> Optional[str]:
+    """
+    Atomically convert a hold into a booking and create the appointment.
+
+    The claim documents and the appointment are written in one transaction,
+    so an appointment exists only if every slot it covers was claimed.
+
+    Args:
+        db: Firestore client
+        tenant_id: Tenant ID
+        appointment: Appointment data (date, time, staff, duration_min, ...)
+        holder: Customer phone number
+        slot_minutes: Slot granularity of the business
+
+    Returns:
+        The new appointment document ID, or None if the slot was lost
+    """
+    from google.cloud import firestore
+
+    refs = _claim_refs(db, tenant_id, _claim_ids(
+        appointment["date"], appointment["time"], appointment["staff"],
+        appointment["duration_min"], slot_minutes
+    ))
+    apt_ref = db.collection("tenants").document(tenant_id)\
+                .collection("appointments").document()
+
+    @firestore.transactional
+    def _book(transaction) -> Optional[str]:
+        now = datetime.utcnow()
+        for snap in db.get_all(refs, transaction=transaction):
+            if _is_taken(snap.to_dict() if snap.exists else None, holder, now):
+                return None
+
+        for ref in refs:
+            transaction.set(ref, {
+                "status": ClaimStatus.BOOKED,
+                "holder": holder,
+                "date": appointment["date"],
+                "staff": appointment["staff"],
+                "appointment_id": apt_ref.id,
+                "expires_at": None,
+                "updated_at": now
+            })
+        transaction.set(apt_ref, appointment)
+        return apt_ref.id
+
+    return _book(db.transaction())
+
+
+def release_slot(
+    db: Any,
+    tenant_id: str,
+    slot: Dict[str, Any],
+    slot_minutes: int,
+    holder: str
+) -> None:
+    """Drop a customer's holds on a slot (abandoned flow); bookings are untouched"""
+    if not all(slot.get(k) for k in ("date", "time", "staff")):
+        return
+
+    refs = _claim_refs(db, tenant_id, _claim_ids(
+        slot["date"], slot["time"], slot["staff"],
+        int(slot.get("duration_min", slot_minutes)), slot_minutes
+    ))
+
+    for snap in db.get_all(refs):
+        claim = snap.to_dict() if snap.exists else None
+        if claim and claim.get("status") == ClaimStatus.HELD and claim.get("holder") == holder:
+            # Precondition: skip if the claim changed since we read it
+            try:
+                snap.reference.delete(option=db.write_option(last_update_time=snap.update_time))
+            except Exception as e:
+                print(f"Hold release skipped: {e}")
+
+
+def cancel_appointment(
+    db: Any,
+    tenant_id: str,
+    appointment_id: str,
+    slot_minutes: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Cancel an appointment and free the slot claims it owns, atomically.
+
+    Only claims whose appointment_id matches are deleted, so a slot that was
+    freed and booked again by someone else keeps its new claim.
+
+    Returns:
+        The appointment data, or None if it does not exist or was already cancelled
+    """
+    from google.cloud import firestore
+
+    apt_ref = db.collection("tenants").document(tenant_id)\
+                .collection("appointments").document(appointment_id)
+
+    @firestore.transactional
+    def _cancel(transaction) -> Optional[Dict[str, Any]]:
+        snap = apt_ref.get(transaction=transaction)
+        if not snap.exists:
+            return None
+        apt = snap.to_dict()
+        if apt.get("status") == "cancelled":
+            return None
+
+        claims = []
+        if all(apt.get(k) for k in ("date", "time", "staff")):
+            refs = _claim_refs(db, tenant_id, _claim_ids(
+                apt["date"], apt["time"], apt["staff"],
+                int(apt.get("duration_min", slot_minutes)), slot_minutes
+            ))
+            claims = list(db.get_all(refs, transaction=transaction))
+
+        now = datetime.utcnow()
+        for claim in claims:
+            if claim.exists and (claim.to_dict() or {}).get("appointment_id") == appointment_id:
+                transaction.delete(claim.reference)
+        transaction.update(apt_ref, {"status": "cancelled", "cancelled_at": now})
+        return apt
+
+    return _cancel(db.transaction())
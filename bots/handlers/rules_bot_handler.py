@@ -6,6 +6,8 @@ State-machine based bot for Menus and Appointments.
 from typing import Dict, Any
 from datetime import datetime
 
+from .conversation_state import Flow, conversation_ref, load_state, save_state
+
 async def handle_rule_bot(event: Any, config: Dict[str, Any], db: Any) -> Dict[str, Any]:
     text = event.text.strip()
     settings = config.get("settings", {})
@@ -35,12 +37,11 @@ def handle_support_mode(text: str, settings: Dict[str, Any]) -> Dict[str, Any]:
 
 async def handle_appointment_mode(event: Any, settings: Dict[str, Any], db: Any) -> Dict[str, Any]:
     # State management in Firestore
-    conv_ref = db.collection("tenants").document(event.tenantId)\
-                 .collection("conversations").document(event.from_)
+    conv_ref = conversation_ref(db, event.tenantId, event.from_, event.serviceId)
                  
-    conv_doc = conv_ref.get()
-    state = conv_doc.to_dict().get("state", "INIT") if conv_doc.exists else "INIT"
-    data = conv_doc.to_dict().get("data", {}) if conv_doc.exists else {}
+    conv_data = load_state(conv_ref)
+    state = conv_data.get("state", "INIT")
+    data = conv_data.get("data", {})
     
     reply = ""
     new_state = state
@@ -69,10 +70,10 @@ async def handle_appointment_mode(event: Any, settings: Dict[str, Any], db: Any)
             reply = "Cita cancelada. ¿Para cuándo quieres reservar?"
             
     # Update State
-    conv_ref.set({
+    save_state(conv_ref, Flow.RULES, {
         "state": new_state,
         "data": data,
         "last_updated": datetime.utcnow()
-    }, merge=True)
+    })
     
     return {"reply_text": reply}
@@ -0,0 +1,93 @@
+"""
+Runtime Metrics
+Per-container scheduler, admission, shedding and queue state published to Firestore for status views
+"""
+
+from typing import Dict, Any, Callable, List, Optional
+from datetime import datetime, timedelta
+import os
+import socket
+import time
+
+from .analytics import FLUSH_INTERVAL_SECONDS
+from .llm_admission import get_llm_admission
+from .load_shedder import get_load_shedder
+from .work_scheduler import BulkGovernor, Tier, get_scheduler
+
+
+RUNTIME_COLLECTION = "runtime_metrics"
+
+# Snapshots older than this belong to containers that stopped serving
+STALE_AFTER = timedelta(seconds=max(60.0, FLUSH_INTERVAL_SECONDS * 4))
+
+# Firestore TTL policy field; exited containers' snapshots are dropped after a day
+RETENTION = timedelta(days=1)
+
+# Process-wide components whose metrics() go into every snapshot
+_SOURCES: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "scheduler": lambda: get_scheduler().metrics(),
+    "llm_admission": lambda: get_llm_admission().metrics(),
+    "load_shedder": lambda: get_load_shedder().metrics(),
+}
+
+_last_publish: Optional[float] = None
+
+
+def container_id() -> str:
+    """Modal task ID, or host and pid when run elsewhere"""
+    return os.environ.get("MODAL_TASK_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def snapshot(role: str) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    data: Dict[str, Any] = {"role": role, "updated_at": now, "expires_at": now + RETENTION}
+    for name, source in _SOURCES.items():
+        try:
+            data[name] = source()
+        except Exception as e:
+            print(f"Runtime metrics error ({name}): {e}")
+    return data
+
+
+def publish(db: Any, role: str, extra: Optional[Dict[str, Any]] = None) -> None:
+    """Write this container's snapshot to runtime_metrics/{container}"""
+    global _last_publish
+    _last_publish = time.monotonic()
+    data = snapshot(role)
+    data.update(extra or {})
+    db.collection(RUNTIME_COLLECTION).document(container_id()).set(data)
+
+
+def maybe_publish(db: Any, role: str, extra: Optional[Callable[[], Dict[str, Any]]] = None) -> None:
+    """Publish at most once per analytics flush interval; `extra` is only called when publishing"""
+    if _last_publish is not None and time.monotonic() - _last_publish < FLUSH_INTERVAL_SECONDS:
+        return
+    publish(db, role, extra() if extra is not None else None)
+
+
+def read_live(db: Any, role: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Snapshots of containers that published recently, with their "container" ID"""
+    query = db.collection(RUNTIME_COLLECTION)\
+              .where("updated_at", ">", datetime.utcnow() - STALE_AFTER)
+    live = []
+    for doc in query.stream():
+        data = doc.to_dict()
+        if role is None or data.get("role") == role:
+            live.append({"container": doc.id, **data})
+    return live
+
+
+def interactive_load(snapshots: List[Dict[str, Any]]) -> float:
+    """(in flight + queued) / capacity of the busiest interactive container"""
+    load = 0.0
+    for data in snapshots:
+        scheduler = data.get("scheduler") or {}
+        tier = (scheduler.get("tiers") or {}).get(Tier.INTERACTIVE) or {}
+        capacity = scheduler.get("capacity") or 1
+        load = max(load, (tier.get("in_flight", 0) + tier.get("queued", 0)) / capacity)
+    return load
+
+
+def bulk_governor(db: Any, **kwargs: Any) -> BulkGovernor:
+    """Governor for a scheduled job, driven by the published interactive load"""
+    return BulkGovernor(lambda: interactive_load(read_live(db, "interactive")), **kwargs)
@@ -7,6 +7,15 @@ from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import re
 
+from .availability import (
+    get_day_availability, get_slot_minutes, get_staff, invalidate_day, service_duration
+)
+from .reservations import hold_slot, book_slot, release_slot
+from .appointment_queries import list_upcoming_for_sender, invalidate_sender
+from .reminder_index import index_appointment
+from .analytics import get_aggregator
+from .conversation_state import Flow, conversation_ref, load_state, save_state
+
 
 class SchedulingState:
     """Conversation states for scheduling flow"""
@@ -164,21 +173,21 @@ async def handle_scheduling_bot(
     services = settings.get("services", ["Consulta General"])
     
     # Get or create conversation state
-    conv_ref = db.collection("tenants").document(event.tenantId)\
-                  .collection("conversations").document(event.from_)
-    conv_doc = conv_ref.get()
-    
-    conv_data = conv_doc.to_dict() if conv_doc.exists else {}
+    conv_ref = conversation_ref(db, event.tenantId, event.from_, event.serviceId)
+    conv_data = load_state(conv_ref)
     state = conv_data.get("scheduling_state", SchedulingState.IDLE)
     pending = conv_data.get("pending_appointment", {})
     
     # Handle reset/cancel commands
     if text in ["cancelar", "reiniciar", "menu", "inicio", "salir"]:
-        conv_ref.set({
+        if pending.get("staff"):
+            release_slot(db, event.tenantId, pending, get_slot_minutes(settings), holder=event.from_)
+        
+        save_state(conv_ref, Flow.SCHEDULING, {
             "scheduling_state": SchedulingState.IDLE,
             "pending_appointment": {},
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": (
@@ -194,14 +203,48 @@ async def handle_scheduling_bot(
     
     # State machine
     if state == SchedulingState.IDLE:
-        if any(kw in text for kw in ["cita", "agendar", "reservar", "turno", "1"]):
+        if text in ["2", "ver", "ver citas", "mis citas", "mas", "ver mas"]:
+            # Page through the sender's upcoming appointments
+            cursor = conv_data.get("appointments_cursor") if text in ["mas", "ver mas"] else None
+            appointments, next_cursor = list_upcoming_for_sender(
+                db, event.tenantId, event.from_, cursor=cursor
+            )
+            
+            save_state(conv_ref, Flow.SCHEDULING, {
+                "appointments_cursor": next_cursor,
+                "updated_at": datetime.utcnow()
+            })
+            
+            if not appointments:
+                return {
+                    "reply_text": "No tienes citas proximas.\n\nEscribe 'cita' para agendar.",
+                    "meta": {"handler": "scheduling_bot", "action": "view_appointments", "count": 0}
+                }
+            
+            lines = "\n".join(
+                f"- {apt.get('date_display', apt.get('date'))} {apt.get('time')} - "
+                f"{apt.get('service', 'Consulta')} (#{apt['id'][:8].upper()})"
+                for apt in appointments
+            )
+            more = "\n\nEscribe 'mas' para ver mas citas." if next_cursor else ""
+            return {
+                "reply_text": f"*Tus proximas citas:*\n\n{lines}{more}",
+                "meta": {
+                    "handler": "scheduling_bot",
+                    "action": "view_appointments",
+                    "count": len(appointments),
+                    "has_more": bool(next_cursor)
+                }
+            }
+        
+        elif any(kw in text for kw in ["cita", "agendar", "reservar", "turno", "1"]):
             # Check if multiple services available
             if len(services) > 1:
-                conv_ref.set({
+                save_state(conv_ref, Flow.SCHEDULING, {
                     "scheduling_state": SchedulingState.ASK_SERVICE,
                     "pending_appointment": {},
                     "updated_at": datetime.utcnow()
-                }, merge=True)
+                })
                 
                 service_list = "\n".join(f"{i+1}. {s}" for i, s in enumerate(services))
                 return {
@@ -211,11 +254,11 @@ async def handle_scheduling_bot(
             else:
                 # Single service, skip to date
                 pending["service"] = services[0]
-                conv_ref.set({
+                save_state(conv_ref, Flow.SCHEDULING, {
                     "scheduling_state": SchedulingState.ASK_DATE,
                     "pending_appointment": pending,
                     "updated_at": datetime.utcnow()
-                }, merge=True)
+                })
                 
                 return {
                     "reply_text": (
@@ -226,13 +269,6 @@ async def handle_scheduling_bot(
                     "meta": {"handler": "scheduling_bot", "state": "ask_date"}
                 }
         
-        elif any(kw in text for kw in ["ver", "mis citas", "2"]):
-            # TODO: List user's appointments
-            return {
-                "reply_text": "Esta funcion estara disponible pronto.\n\nEscribe 'cita' para agendar.",
-                "meta": {"handler": "scheduling_bot", "action": "view_appointments"}
-            }
-        
         else:
             return {
                 "reply_text": (
@@ -255,11 +291,11 @@ async def handle_scheduling_bot(
             matched = next((s for s in services if text in s.lower()), services[0])
             pending["service"] = matched
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.SCHEDULING, {
             "scheduling_state": SchedulingState.ASK_DATE,
             "pending_appointment": pending,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": (
@@ -293,9 +329,12 @@ async def handle_scheduling_bot(
         
         pending["date"] = parsed_date.strftime("%Y-%m-%d")
         pending["date_display"] = parsed_date.strftime("%A %d de %B")
+        pending["duration_min"] = service_duration(settings, pending.get("service"))
         
-        # Generate available slots (mock - would integrate with Calendar)
-        slots = generate_time_slots(parsed_date)
+        # Free slots from business hours, staff and the day's bookings
+        availability = get_day_availability(db, event.tenantId, parsed_date, settings)
+        not_before = datetime.now() if parsed_date.date() == datetime.now().date() else None
+        slots = availability.free_starts(pending["duration_min"], not_before=not_before)
         
         if not slots:
             return {
@@ -306,11 +345,11 @@ async def handle_scheduling_bot(
         # Store slots for validation
         pending["available_slots"] = slots[:8]  # Limit to 8 slots
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.SCHEDULING, {
             "scheduling_state": SchedulingState.ASK_TIME,
             "pending_appointment": pending,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         slots_display = "\n".join(f"- {s}" for s in slots[:8])
         return {
@@ -331,13 +370,50 @@ async def handle_scheduling_bot(
                 "meta": {"handler": "scheduling_bot", "state": "ask_time", "error": "invalid_time"}
             }
         
+        # Validate against live availability, not just the slots we displayed
+        availability = get_day_availability(
+            db, event.tenantId, datetime.strptime(pending["date"], "%Y-%m-%d"), settings
+        )
+        staff = availability.find_staff(parsed_time, pending.get("duration_min", 30))
+        
+        if not staff:
+            slots_display = "\n".join(f"- {s}" for s in pending.get("available_slots", []))
+            return {
+                "reply_text": (
+                    f"El horario {parsed_time} no esta disponible.\n\n"
+                    f"{slots_display}\n\n"
+                    "Cual horario prefieres?"
+                ),
+                "meta": {"handler": "scheduling_bot", "state": "ask_time", "error": "slot_unavailable"}
+            }
+        
+        # Hold the slot while we ask for the name
+        slot = {
+            "date": pending["date"],
+            "time": parsed_time,
+            "staff": staff,
+            "duration_min": pending.get("duration_min", 30)
+        }
+        if pending.get("staff") and pending.get("time") != parsed_time:
+            release_slot(db, event.tenantId, pending, get_slot_minutes(settings), holder=event.from_)
+        
+        if not hold_slot(db, event.tenantId, slot, event.from_, get_slot_minutes(settings)):
+            return {
+                "reply_text": (
+                    f"El horario {parsed_time} acaba de ser reservado por otra persona.\n\n"
+                    "Elige otro horario por favor."
+                ),
+                "meta": {"handler": "scheduling_bot", "state": "ask_time", "error": "slot_taken"}
+            }
+        
         pending["time"] = parsed_time
+        pending["staff"] = staff
         
-        conv_ref.set({
+        save_state(conv_ref, Flow.SCHEDULING, {
             "scheduling_state": SchedulingState.ASK_NAME,
             "pending_appointment": pending,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": (
@@ -352,20 +428,42 @@ async def handle_scheduling_bot(
         pending["phone"] = event.from_
         pending["created_at"] = datetime.utcnow().isoformat()
         pending["status"] = "confirmed"
+        pending["starts_at"] = f"{pending['date']}T{pending['time']}"
+        pending.pop("available_slots", None)
+        pending.setdefault("staff", get_staff(settings)[0])
+        pending.setdefault("duration_min", service_duration(settings, pending.get("service")))
+        
+        # Claim the slot and save the appointment in one transaction
+        doc_id = book_slot(db, event.tenantId, pending, event.from_, get_slot_minutes(settings))
+        invalidate_day(event.tenantId, pending["date"])
+        invalidate_sender(event.tenantId, event.from_)
+        
+        if not doc_id:
+            save_state(conv_ref, Flow.SCHEDULING, {
+                "scheduling_state": SchedulingState.ASK_DATE,
+                "pending_appointment": {"service": pending.get("service")},
+                "updated_at": datetime.utcnow()
+            })
+            
+            return {
+                "reply_text": (
+                    f"Lo sentimos, el horario {pending['time']} ya fue reservado.\n\n"
+                    "Para que dia te gustaria buscar otro horario?"
+                ),
+                "meta": {"handler": "scheduling_bot", "state": "ask_date", "error": "slot_taken"}
+            }
         
-        # Save appointment to Firestore
-        appointments_ref = db.collection("tenants").document(event.tenantId)\
-                            .collection("appointments")
-        doc_ref = appointments_ref.add(pending)
-        appointment_id = doc_ref[1].id[:8].upper()
+        index_appointment(db, event.tenantId, doc_id, pending)
+        get_aggregator().incr(event.tenantId, "appointments.booked")
+        appointment_id = doc_id[:8].upper()
         
         # Reset conversation state
-        conv_ref.set({
+        save_state(conv_ref, Flow.SCHEDULING, {
             "scheduling_state": SchedulingState.CONFIRMED,
             "pending_appointment": {},
             "last_appointment_id": appointment_id,
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": (
@@ -387,11 +485,11 @@ async def handle_scheduling_bot(
     
     elif state == SchedulingState.CONFIRMED:
         # Reset for new conversation
-        conv_ref.set({
+        save_state(conv_ref, Flow.SCHEDULING, {
             "scheduling_state": SchedulingState.IDLE,
             "pending_appointment": {},
             "updated_at": datetime.utcnow()
-        }, merge=True)
+        })
         
         return {
             "reply_text": "Escribe *'cita'* para agendar otra cita.",
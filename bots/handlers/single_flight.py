@@ -0,0 +1,116 @@
+"""
+Single-flight
+Coalesces identical in-flight LLM requests within a container
+"""
+
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import time
+
+
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+
+def request_key(model: str, messages: Any, **params: Any) -> str:
+    """Stable hash of a completion request (model, messages and sampling params)"""
+    raw = json.dumps({"model": model, "messages": messages, **params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "deadline", "waiters")
+
+    def __init__(self, task: "asyncio.Task", deadline: float):
+        self.task = task
+        self.deadline = deadline
+        self.waiters = 1
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time; concurrent callers with the same key
+    await the in-flight call and share its result (or exception).
+
+    Each key has a deadline set by the call that started it. Callers that
+    join later only wait for what is left of it, and once it has passed the
+    key is free again, so a hung upstream call never collects new waiters.
+    The shared call is cancelled once every caller waiting on it is.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.stats = {"calls": 0, "coalesced": 0, "timeouts": 0, "cancelled": 0}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: float = DEFAULT_TIMEOUT_SECONDS
+    ) -> Tuple[Any, bool]:
+        """
+        Run fn() for key, or join the call already running for it.
+
+        Returns:
+            (result, coalesced) where coalesced is True if another caller's
+            request was reused
+
+        Raises:
+            asyncio.TimeoutError if the key's deadline passes first
+        """
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        flight = self._flights.get(key)
+
+        # Tasks are bound to their event loop; never share across loops
+        if flight is None or flight.deadline <= now or flight.task.get_loop() is not loop:
+            flight = _Flight(loop.create_task(fn()), now + timeout)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task, f=flight: self._done(key, f, task))
+            self.stats["calls"] += 1
+            coalesced = False
+        else:
+            flight.waiters += 1
+            self.stats["coalesced"] += 1
+            coalesced = True
+
+        try:
+            # shield: one caller timing out or being cancelled must not cancel the shared call
+            result = await asyncio.wait_for(asyncio.shield(flight.task), max(flight.deadline - now, 0))
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            self._release(key, flight)
+            raise
+        finally:
+            # Every exit (result, error, timeout, cancellation) stops waiting
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Nobody wants the result any more
+                flight.task.cancel()
+                self._release(key, flight)
+                self.stats["cancelled"] += 1
+        return result, coalesced
+
+    def _done(self, key: str, flight: _Flight, task: "asyncio.Task") -> None:
+        self._release(key, flight)
+        if not task.cancelled():
+            task.exception()  # Mark retrieved even if every waiter timed out
+
+    def _release(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """Process-wide single-flight group"""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,237 @@
+"""
+Work Scheduler
+Weighted fair queuing of the work admitted into one container
+"""
+
+from typing import Dict, Any, Callable, Deque, List, Optional, Tuple
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import time
+
+
+class Tier:
+    """Priority tiers sharing a container's capacity"""
+    INTERACTIVE = "interactive"  # handle_event replies to live customers
+    BULK = "bulk"                # reminders, outbound sends, exports, re-scoring, rollups
+
+
+# Share of capacity under contention: interactive gets 8 slots for every bulk one
+TIER_WEIGHTS = {
+    Tier.INTERACTIVE: 8.0,
+    Tier.BULK: 1.0,
+}
+
+# Keep in step with handle_event's @modal.concurrent target_inputs
+DEFAULT_CAPACITY = int(os.environ.get("WORK_SCHEDULER_CAPACITY", "16"))
+
+# Samples kept per tier for latency percentiles
+METRICS_WINDOW = 500
+
+# Slots of a container running only bulk work while live conversations are quiet
+BULK_CAPACITY = int(os.environ.get("BULK_CAPACITY", "8"))
+
+# Interactive load ((in flight + queued) / capacity of the busiest handle_event
+# container) at which bulk jobs drop to a single slot
+BULK_YIELD_LOAD = float(os.environ.get("BULK_YIELD_LOAD", "0.75"))
+
+# How often bulk jobs re-read the interactive load
+LOAD_REFRESH_SECONDS = 15.0
+
+# Pause before each unit of bulk work while interactive load is high
+BULK_YIELD_PAUSE = 1.0
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct * len(ordered)))]
+
+
+class WorkScheduler:
+    """
+    Admits at most `capacity` concurrent units of work.
+
+    When saturated, waiters are released in order of their WFQ virtual finish
+    tag, so each tier gets capacity in proportion to its weight and bulk work
+    yields to interactive traffic instead of competing with it FIFO.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, weights: Optional[Dict[str, float]] = None):
+        self.capacity = capacity
+        self.weights = weights or TIER_WEIGHTS
+        self.in_flight = 0
+        self.virtual_time = 0.0
+        self._last_finish = {tier: 0.0 for tier in self.weights}
+        self._waiting: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {
+            tier: deque() for tier in self.weights
+        }
+        self._stats = {
+            tier: {
+                "completed": 0,
+                "in_flight": 0,
+                "waits": deque(maxlen=METRICS_WINDOW),
+                "latencies": deque(maxlen=METRICS_WINDOW)
+            }
+            for tier in self.weights
+        }
+
+    def _finish_tag(self, tier: str) -> float:
+        start = max(self.virtual_time, self._last_finish[tier])
+        self._last_finish[tier] = start + 1.0 / self.weights[tier]
+        return self._last_finish[tier]
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the waiters with the smallest finish tags"""
+        while self.in_flight < self.capacity:
+            heads = [(queue[0][0], tier) for tier, queue in self._waiting.items() if queue]
+            if not heads:
+                return
+            tag, tier = min(heads)
+            _, future = self._waiting[tier].popleft()
+            if future.done():
+                continue
+            self.virtual_time = tag
+            self.in_flight += 1
+            future.set_result(None)
+
+    async def acquire(self, tier: str) -> None:
+        tag = self._finish_tag(tier)
+        if self.in_flight < self.capacity and not any(self._waiting.values()):
+            self.virtual_time = tag
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[tier].append((tag, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled; give it back
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def resize(self, capacity: int) -> None:
+        """Change capacity; work already admitted finishes, new slots follow the new size"""
+        self.capacity = max(1, capacity)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tier: str):
+        """
+        Run a unit of work in a tier.
+
+        Yields:
+            Seconds spent waiting for the slot
+        """
+        queued_at = time.monotonic()
+        await self.acquire(tier)
+        started = time.monotonic()
+        stats = self._stats[tier]
+        stats["waits"].append(started - queued_at)
+        stats["in_flight"] += 1
+        try:
+            yield started - queued_at
+        finally:
+            stats["in_flight"] -= 1
+            stats["completed"] += 1
+            stats["latencies"].append(time.monotonic() - started)
+            self.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-tier queue depth, in-flight work and wait/run latency percentiles"""
+        tiers = {}
+        for tier, stats in self._stats.items():
+            waits = list(stats["waits"])
+            latencies = list(stats["latencies"])
+            tiers[tier] = {
+                "queued": len(self._waiting[tier]),
+                "in_flight": stats["in_flight"],
+                "completed": stats["completed"],
+                "wait_ms_p50": round(_percentile(waits, 0.50) * 1000, 1),
+                "wait_ms_p95": round(_percentile(waits, 0.95) * 1000, 1),
+                "run_ms_p95": round(_percentile(latencies, 0.95) * 1000, 1)
+            }
+        return {"capacity": self.capacity, "in_flight": self.in_flight, "tiers": tiers}
+
+
+class BulkGovernor:
+    """
+    Runs bulk work as Tier.BULK and sizes it to interactive load.
+
+    Scheduled jobs run in their own Modal containers, so their bulk work
+    never queues behind handle_event's in the same scheduler. Instead the
+    governor reads the interactive load that handle_event containers publish
+    (runtime_metrics) and shrinks the bulk scheduler to one slot while live
+    conversations are busy, restoring `capacity` when they calm down.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], float],
+        scheduler: Optional[WorkScheduler] = None,
+        capacity: int = BULK_CAPACITY,
+        refresh: float = LOAD_REFRESH_SECONDS
+    ):
+        self._load = load
+        self.scheduler = scheduler or get_scheduler()
+        self.capacity = capacity
+        self.refresh = refresh
+        self.load = 0.0
+        self._checked_at: Optional[float] = None
+        self.scheduler.resize(capacity)
+
+    @property
+    def yielding(self) -> bool:
+        return self.load >= BULK_YIELD_LOAD
+
+    def check(self) -> None:
+        """Re-read the interactive load if it is older than `refresh`"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.refresh:
+            return
+        self._checked_at = now
+        try:
+            self.load = self._load()
+        except Exception as e:
+            # Unknown load: keep the last decision
+            print(f"Interactive load read error: {e}")
+        self.scheduler.resize(1 if self.yielding else self.capacity)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Run one unit of bulk work.
+
+        Yields:
+            Seconds spent waiting for the slot
+        """
+        await asyncio.to_thread(self.check)
+        if self.yielding:
+            await asyncio.sleep(BULK_YIELD_PAUSE)
+        async with self.scheduler.slot(Tier.BULK) as waited:
+            yield waited
+
+    def pace(self) -> None:
+        """Between pages of a synchronous bulk job: pause while interactive load is high"""
+        self.check()
+        if self.yielding:
+            time.sleep(BULK_YIELD_PAUSE)
+
+
+_SCHEDULER: Optional[WorkScheduler] = None
+
+
+def get_scheduler() -> WorkScheduler:
+    """Process-wide scheduler shared by the request handlers of a container"""
+    global _SCHEDULER
+    if _SCHEDULER is None:
+        _SCHEDULER = WorkScheduler()
+    return _SCHEDULER
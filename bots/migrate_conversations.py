@@ -0,0 +1,38 @@
+"""
+Migrate Conversation State
+Splits shared conversations/{phone} documents into per-service state slices.
+
+Usage:
+    python migrate_conversations.py demo
+    python migrate_conversations.py demo other-tenant
+"""
+
+import argparse
+import json
+from google.cloud import firestore
+from google.oauth2 import service_account
+
+from handlers.conversation_state import split_conversations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split conversation state by service")
+    parser.add_argument("tenant_ids", nargs="+")
+    args = parser.parse_args()
+
+    # Load credentials locally
+    with open("../firebase-service-account.json", "r") as f:
+        creds_info = json.load(f)
+
+    credentials = service_account.Credentials.from_service_account_info(creds_info)
+    db = firestore.Client(credentials=credentials, project=creds_info.get("project_id"))
+
+    for tenant_id in args.tenant_ids:
+        print(f"Migrating conversations of {tenant_id}...")
+        stats = split_conversations(db, tenant_id)
+        print(f"✓ {stats['migrated']} conversations -> {stats['slices']} service slices")
+        print(f"  Bytes: {stats['bytes_before']} before, {stats['bytes_after']} after")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 """
 Message Templates for SoftFawer Bots
-Reusable Spanish templates for WhatsApp responses
+Reusable Spanish templates for WhatsApp responses, compiled once and cached
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+from functools import lru_cache
+from string import Formatter
 
 
 class Templates:
@@ -25,6 +27,11 @@ class Templates:
         "escribe 'hola' para iniciar una nueva conversacion."
     )
     
+    LLM_BUSY = (
+        "Estamos recibiendo muchos mensajes en este momento. "
+        "Por favor escribe de nuevo en unos minutos o escribe 'agente' para hablar con una persona."
+    )
+    
     # =========== SCHEDULING BOT ===========
     SCHEDULING_WELCOME = (
         "Hola {name}! Soy el asistente de citas de {business}.\n\n"
@@ -153,7 +160,7 @@ class Templates:
     
     # =========== NOTIFICATION BOT ===========
     REMINDER_24H = (
-        "Recordatorio: Tienes una cita manana!\n\n"
+        "Hola {name}! Recordatorio: Tienes una cita manana.\n\n"
         "Fecha: {date}\n"
         "Hora: {time}\n"
         "Lugar: {location}\n\n"
@@ -163,7 +170,7 @@ class Templates:
     )
     
     REMINDER_1H = (
-        "Tu cita es en 1 hora!\n\n"
+        "Hola {name}! Tu cita es en 1 hora.\n\n"
         "Hora: {time}\n"
         "Lugar: {location}\n\n"
         "Te esperamos!"
@@ -207,9 +214,106 @@ def format_slots(slots: list[str]) -> str:
     return "\n".join(f"- {slot}" for slot in slots)
 
 
+MISSING_VALUE = "[N/A]"
+
+Renderer = Callable[[Dict[str, Any]], str]
+
+
+@lru_cache(maxsize=512)
+def compile_template(template: str) -> Renderer:
+    """
+    Parse a template once into a render function.
+
+    Only plain `{name}` fields are substituted; attribute or index lookups
+    (`{a.b}`, `{a[0]}`) are never evaluated and render as missing. Every
+    missing key is filled with MISSING_VALUE in the same pass.
+    """
+    parts: List[Tuple[str, Optional[str], str]] = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if field is not None and not field.isidentifier():
+            field = ""
+        parts.append((literal, field, spec or ""))
+
+    def render(values: Dict[str, Any]) -> str:
+        out = []
+        for literal, field, spec in parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = values.get(field) if field else None
+            if value is None:
+                out.append(MISSING_VALUE)
+            elif spec:
+                try:
+                    out.append(format(value, spec))
+                except (TypeError, ValueError):
+                    out.append(str(value))
+            else:
+                out.append(str(value))
+        return "".join(out)
+
+    return render
+
+
+def render_many(template: str, rows: Iterable[Dict[str, Any]]) -> List[str]:
+    """Render one template for many recipients"""
+    render = compile_template(template)
+    return [render(row) for row in rows]
+
+
+class TemplateSet:
+    """Templates for one service: defaults from Templates plus tenant overrides"""
+    
+    def __init__(self, overrides: Optional[Dict[str, str]] = None):
+        self.overrides = overrides or {}
+        self._renderers: Dict[str, Renderer] = {}
+    
+    def renderer(self, name: str) -> Renderer:
+        """Compiled renderer for a template name (e.g. "REMINDER_24H")"""
+        render = self._renderers.get(name)
+        if render is None:
+            render = compile_template(self.overrides.get(name) or getattr(Templates, name))
+            self._renderers[name] = render
+        return render
+    
+    def render(self, name: str, /, **kwargs) -> str:
+        # Positional-only, so templates may use a {name} field
+        return self.renderer(name)(kwargs)
+    
+    def render_many(self, name: str, rows: Iterable[Dict[str, Any]]) -> List[str]:
+        render = self.renderer(name)
+        return [render(row) for row in rows]
+
+
+DEFAULT_TEMPLATES = TemplateSet()
+
+# (tenant_id, service_id) -> (templates_version, TemplateSet)
+_TENANT_TEMPLATES: Dict[Tuple[str, str], Tuple[Any, TemplateSet]] = {}
+
+
+def get_templates(tenant_id: str, service_id: str, service_config: Dict[str, Any]) -> TemplateSet:
+    """
+    Template set for a service, recompiled only when its version changes.
+
+    Overrides live in `settings.templates` ({"REMINDER_24H": "..."}) and are
+    versioned by `settings.templates_version`; bump the version when editing.
+    """
+    settings = service_config.get("settings", {})
+    overrides = settings.get("templates")
+    if not overrides:
+        return DEFAULT_TEMPLATES
+    
+    version = settings.get("templates_version", 0)
+    key = (tenant_id, service_id)
+    cached = _TENANT_TEMPLATES.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    
+    template_set = TemplateSet(overrides)
+    _TENANT_TEMPLATES[key] = (version, template_set)
+    return template_set
+
+
 def format_template(template: str, **kwargs) -> str:
     """Safe format template with fallback for missing keys"""
-    try:
-        return template.format(**kwargs)
-    except KeyError as e:
-        return template.replace("{" + str(e).strip("'") + "}", "[N/A]")
+    return compile_template(template)(kwargs)
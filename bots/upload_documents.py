@@ -0,0 +1,52 @@
+"""
+Upload Documents
+Store tenant documents (menus, price lists, policies) used to ground LLM answers.
+
+Usage:
+    python upload_documents.py demo menu.txt precios.md
+    python upload_documents.py demo politicas.txt --title "Politicas de cancelacion"
+"""
+
+import argparse
+import json
+import os
+import sys
+from google.cloud import firestore
+from google.oauth2 import service_account
+
+# Handlers import the repo-level shared/ package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from handlers.doc_retrieval import build_index, save_document
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload tenant documents")
+    parser.add_argument("tenant_id")
+    parser.add_argument("files", nargs="+", help="UTF-8 text files; the file name is the document id")
+    parser.add_argument("--title", help="Title (single file only; defaults to the file name)")
+    args = parser.parse_args()
+
+    if args.title and len(args.files) > 1:
+        parser.error("--title can only be used with a single file")
+
+    # Load credentials locally
+    with open("../firebase-service-account.json", "r") as f:
+        creds_info = json.load(f)
+
+    credentials = service_account.Credentials.from_service_account_info(creds_info)
+    db = firestore.Client(credentials=credentials, project=creds_info.get("project_id"))
+
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        doc_id = os.path.splitext(os.path.basename(path))[0]
+        title = args.title or doc_id.replace("_", " ").replace("-", " ").title()
+
+        index = build_index([{"title": title, "content": content}])
+        save_document(db, args.tenant_id, doc_id, title, content)
+        print(f"✓ {doc_id}: {len(index)} chunks, ~{index.total_tokens()} tokens")
+
+
+if __name__ == "__main__":
+    main()
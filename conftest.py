@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# The bots app imports `handlers` and `templates` as top-level modules (as in
+# its Modal image) and the repo-level `shared` package
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bots"))
@@ -2,6 +2,8 @@ import requests
 import os
 import logging
 from typing import List, Dict, Any
+from .single_flight import single_flight, SingleFlightTimeout
+from .load_shedder import load_shedder
 
 class ArkClient:
     """
@@ -15,6 +17,7 @@ class ArkClient:
     def chat_completion(self, messages: List[Dict[str, str]], model: str = "deepseek-v3", temperature: float = 0.7) -> str:
         """
         Sends messages to DeepSeek v3 and returns the response content.
+        Identical concurrent requests in this container share one API call.
         """
         if not self.api_key:
             self.logger.error("ARK_API_KEY is missing")
@@ -31,16 +34,28 @@ class ArkClient:
             "temperature": temperature
         }
 
+        def request() -> str:
+            # Latency and failures feed the container's load shedder
+            with load_shedder.track():
+                response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
+                response.raise_for_status()
+                
+                data = response.json()
+                # Assuming standard OpenAI-compatible format which Ark uses
+                return data['choices'][0]['message']['content']
+
         try:
-            response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            # Assuming standard OpenAI-compatible format which Ark uses
-            content = data['choices'][0]['message']['content']
+            key = single_flight.request_key(model, messages, temperature=temperature)
+            content, coalesced = single_flight.do(key, request, timeout=30)
+            if coalesced:
+                self.logger.info(f"Reused in-flight Ark response (coalesced total: {single_flight.stats['coalesced']})")
             return content
 
-        except requests.Exceptions.RequestException as e:
+        except SingleFlightTimeout as e:
+            self.logger.error(f"Ark API Request Error: {e}")
+            return "Lo siento, tuve un problema al procesar tu mensaje."
+
+        except requests.exceptions.RequestException as e:
             self.logger.error(f"Ark API Request Error: {e}")
             if hasattr(e, 'response') and e.response:
                  self.logger.error(f"Response: {e.response.text}")
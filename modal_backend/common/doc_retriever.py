@@ -0,0 +1,56 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List
+
+from shared.bm25 import TOP_K, TOKEN_BUDGET, BM25Index, build_index
+
+
+class DocRetriever:
+    """
+    Selects the parts of a bot's business context relevant to a question.
+
+    The context is the config's "business_info" plus optional "documents"
+    ([{"title": ..., "content": ...}]). It is chunked and indexed with the
+    shared BM25 ranking once per distinct content (indexes are cached in
+    memory by content hash), and each question gets the top "context_top_k"
+    chunks that fit in "context_token_budget" tokens.
+    """
+    CACHE_MAX = 256
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._cache: Dict[str, BM25Index] = {}
+        self.stats = {"builds": 0, "hits": 0}
+
+    def get_index(self, business_info: str, documents: List[Dict[str, Any]]) -> BM25Index:
+        key = hashlib.sha1(json.dumps([business_info, documents], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        index = self._cache.get(key)
+        if index is not None:
+            self.stats["hits"] += 1
+            return index
+
+        index = build_index(documents, business_info)
+        if len(self._cache) >= self.CACHE_MAX:
+            self._cache.clear()
+        self._cache[key] = index
+        self.stats["builds"] += 1
+        self.logger.debug(f"Built BM25 index: {len(index)} chunks, ~{index.total_tokens()} tokens")
+        return index
+
+    def context_for(self, question: str, config: Dict[str, Any]) -> str:
+        """Business context for one question, within the config's token budget."""
+        business_info = config.get("business_info", "") or ""
+        documents = config.get("documents") or []
+        if not business_info and not documents:
+            return ""
+        index = self.get_index(business_info, documents)
+        chunks = index.context_for(
+            question,
+            top_k=config.get("context_top_k", TOP_K),
+            token_budget=config.get("context_token_budget", TOKEN_BUDGET)
+        )
+        return "\n\n".join(chunks)
+
+
+doc_retriever = DocRetriever()
@@ -58,6 +58,24 @@ class MultiTenantService:
             self.logger.error(f"Error fetching chat history: {e}")
             return []
 
+    def mark_escalated(self, tenant_id: str, bot_id: str, chat_id: str):
+        """
+        Flags a chat as waiting for a human agent.
+        Path: /tenants/{tenant_id}/bots/{bot_id}/chats/{chat_id}
+        """
+        try:
+            chat_ref = (
+                db.collection('tenants').document(tenant_id)
+                .collection('bots').document(bot_id)
+                .collection('chats').document(chat_id)
+            )
+            chat_ref.set({
+                'escalated': True,
+                'escalatedAt': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+        except Exception as e:
+            self.logger.error(f"Error marking chat {chat_id} as escalated: {e}")
+
     def save_message(self, tenant_id: str, bot_id: str, chat_id: str, message_data: Dict[str, Any]):
         """
         Saves a message (user or assistant) to Firestore.
@@ -0,0 +1,77 @@
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from shared.intent_rules import CONTEXTUAL_INTENTS, Intent, classify, normalize
+
+
+class IntentClassifier:
+    """
+    Local pre-classifier that answers trivial messages (greetings, thanks,
+    escalation requests, tenant-defined patterns) without calling the LLM.
+
+    The rules live in shared.intent_rules, so this backend and the bots app
+    classify alike. Tenant patterns live in the bot config:
+        "intent_patterns": {"horario": {"patterns": ["a que hora abren", "re:^horarios?$"], "reply": "..."}}
+    """
+    DEFAULT_REPLIES = {
+        Intent.GREETING: "¡Hola! ¿En qué puedo ayudarte?",
+        Intent.THANKS: "¡De nada! ¿Hay algo más en lo que pueda ayudarte?",
+        Intent.GOODBYE: "¡Gracias por escribirnos! Aquí estaremos cuando nos necesites.",
+        Intent.MENU: "Cuéntame qué necesitas y con gusto te ayudo.",
+        Intent.ESCALATE: "Entiendo. Un agente humano te contactará lo antes posible.",
+    }
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.stats = {"total": 0, "local": 0, "llm": 0, "by_intent": {}}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase, strip accents and punctuation, squeeze repeats ("Holaaa!!" -> "hola")."""
+        return normalize(text)
+
+    def classify(self, text: str, config: Dict[str, Any]) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Returns (intent, tenant_reply) for a locally answerable message,
+        or None when it needs the model.
+        """
+        match = classify(text, config.get("intent_patterns"))
+        return (match.intent, match.reply) if match else None
+
+    def local_reply(
+        self,
+        text: str,
+        config: Dict[str, Any],
+        has_history: bool,
+        can_escalate: bool = True
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Returns (intent, reply) if the message can be answered without the LLM.
+        Escalations are only answered locally when the caller can record the
+        handoff (`can_escalate`). Records the decision in `stats` either way.
+        """
+        match = self.classify(text, config)
+        reply = None
+        if match is not None:
+            intent, tenant_reply = match
+            unrecorded_handoff = intent == Intent.ESCALATE and not can_escalate
+            if not unrecorded_handoff and not (has_history and intent in CONTEXTUAL_INTENTS):
+                replies = {**self.DEFAULT_REPLIES, **(config.get("intent_replies") or {})}
+                reply = tenant_reply or replies.get(intent)
+
+        self.stats["total"] += 1
+        if reply is None:
+            self.stats["llm"] += 1
+            return None
+
+        self.stats["local"] += 1
+        self.stats["by_intent"][intent] = self.stats["by_intent"].get(intent, 0) + 1
+        self.logger.info(
+            f"Intent '{intent}' answered locally "
+            f"(hit rate {self.stats['local'] / self.stats['total']:.0%} of {self.stats['total']})"
+        )
+        return intent, reply
+
+
+# One per container, so stats and compiled tenant patterns are shared across requests
+intent_classifier = IntentClassifier()
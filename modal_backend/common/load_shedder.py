@@ -0,0 +1,100 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from shared.load_shedding import ShedSwitch, percentile
+
+# Ark calls considered for error rate and p95 latency
+WINDOW_SECONDS = 60.0
+
+# Fewer calls than this in the window say nothing about error rate or p95
+MIN_SAMPLES = 10
+
+SHED_P95_MS = float(os.getenv("LLM_SHED_P95_MS", "8000"))
+SHED_IN_FLIGHT = int(os.getenv("LLM_SHED_IN_FLIGHT", "16"))
+
+THRESHOLDS = {
+    "in_flight": {"enter": SHED_IN_FLIGHT, "exit": SHED_IN_FLIGHT // 4},
+    "error_rate": {"enter": 0.5, "exit": 0.2},
+    "p95_ms": {"enter": SHED_P95_MS, "exit": SHED_P95_MS / 2},
+}
+COOLDOWN_SECONDS = 30.0
+
+# Share of requests still sent to Ark while shedding, so recovery is observed
+PROBE_RATE = 0.05
+
+
+class LoadShedder:
+    """
+    Skips Ark under saturation so handle_ai_bot answers right away.
+
+    Ark calls made through `track` feed the signals: calls in flight in this
+    container, and error rate and p95 latency over the last WINDOW_SECONDS.
+    A ShedSwitch with enter/exit thresholds and a cooldown turns them into
+    a shed decision. Safe to use from the worker threads handlers run in.
+    """
+    def __init__(self, thresholds: Optional[Dict[str, Dict[str, float]]] = None, cooldown: float = COOLDOWN_SECONDS):
+        self._lock = threading.Lock()
+        self.switch = ShedSwitch(thresholds or THRESHOLDS, cooldown)
+        self.in_flight = 0
+        self.recent: Deque[Tuple[float, float, bool]] = deque(maxlen=500)
+        self.counts = {"shed": 0, "probes": 0}
+
+    @contextmanager
+    def track(self):
+        """Wrap one Ark call; an exception counts as a failed call"""
+        with self._lock:
+            self.in_flight += 1
+        started = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            finished = time.monotonic()
+            with self._lock:
+                self.in_flight -= 1
+                self.recent.append((finished, finished - started, ok))
+
+    def signals(self, now: Optional[float] = None) -> Dict[str, float]:
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            recent = [(latency, ok) for ts, latency, ok in self.recent if now - ts <= WINDOW_SECONDS]
+            signals = {"in_flight": float(self.in_flight)}
+        if len(recent) >= MIN_SAMPLES:
+            latencies = [latency for latency, ok in recent if ok]
+            signals["error_rate"] = 1 - len(latencies) / len(recent)
+            if latencies:
+                signals["p95_ms"] = percentile(latencies, 0.95) * 1000
+        return signals
+
+    def should_shed(self, now: Optional[float] = None) -> bool:
+        """Whether this request should skip Ark"""
+        now = now if now is not None else time.monotonic()
+        signals = self.signals(now)
+        with self._lock:
+            if not self.switch.update(signals, now):
+                return False
+            if random.random() < PROBE_RATE:
+                self.counts["probes"] += 1
+                return False
+            self.counts["shed"] += 1
+            return True
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "shedding": self.switch.shedding,
+            "reason": self.switch.reason,
+            "state_age_s": round(time.monotonic() - self.switch.since, 1),
+            "signals": self.signals(),
+            "transitions": self.switch.transitions,
+            **self.counts
+        }
+
+
+# Shared by every request handled in this container
+load_shedder = LoadShedder()
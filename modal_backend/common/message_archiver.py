@@ -0,0 +1,199 @@
+import gzip
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from .object_store import ObjectStore
+
+
+class MessageArchiver:
+    """
+    Moves chat messages older than the retention window out of Firestore
+    into gzip-compressed NDJSON segments.
+
+    Layout in the object store:
+        archive/{tenant_id}/{YYYY-MM}/{segment_id}.ndjson.gz
+        archive/{tenant_id}/manifest.json
+
+    The manifest lists every segment with its time range and message count,
+    so range reads only open the segments that overlap the request.
+    """
+    PAGE_SIZE = 1000
+    SEGMENT_MAX_MESSAGES = 5000
+    MAX_BUFFERED_MESSAGES = 20000
+    DELETE_BATCH_SIZE = 400
+
+    def __init__(self, db, store: ObjectStore, retention_days: int = 90):
+        self.db = db
+        self.store = store
+        self.retention_days = retention_days
+        self.logger = logging.getLogger(__name__)
+
+    # --- Paths ---
+
+    @staticmethod
+    def _manifest_key(tenant_id: str) -> str:
+        return f"archive/{tenant_id}/manifest.json"
+
+    @staticmethod
+    def _parse_path(path: str) -> Optional[Tuple[str, str, str]]:
+        """tenants/{t}/bots/{b}/chats/{c}/messages/{m} -> (t, b, c); None for other 'messages' collections"""
+        parts = path.split("/")
+        if len(parts) != 8 or parts[0] != "tenants" or parts[2] != "bots" or parts[4] != "chats":
+            return None
+        return parts[1], parts[3], parts[5]
+
+    @staticmethod
+    def _as_utc(ts: Any) -> datetime:
+        if ts.tzinfo is None:
+            return ts.replace(tzinfo=timezone.utc)
+        return ts.astimezone(timezone.utc)
+
+    # --- Manifest ---
+
+    def load_manifest(self, tenant_id: str) -> Dict[str, Any]:
+        raw = self.store.get(self._manifest_key(tenant_id))
+        return json.loads(raw) if raw else {"tenant_id": tenant_id, "segments": []}
+
+    def _add_to_manifest(self, tenant_id: str, segment: Dict[str, Any]) -> None:
+        manifest = self.load_manifest(tenant_id)
+        manifest["segments"].append(segment)
+        manifest["segments"].sort(key=lambda s: (s["start"], s["key"]))
+        manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self.store.put(self._manifest_key(tenant_id), json.dumps(manifest).encode("utf-8"))
+
+    # --- Archival ---
+
+    def _write_segment(self, tenant_id: str, month: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        records.sort(key=lambda r: r["timestamp"])
+        body = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records)
+        data = gzip.compress(body.encode("utf-8"))
+
+        key = f"archive/{tenant_id}/{month}/{records[0]['timestamp'][:10]}-{uuid.uuid4().hex[:8]}.ndjson.gz"
+        self.store.put(key, data)
+
+        segment = {
+            "key": key,
+            "month": month,
+            "start": records[0]["timestamp"],
+            "end": records[-1]["timestamp"],
+            "count": len(records),
+            "bytes": len(data),
+            "bots": sorted({r["bot_id"] for r in records}),
+        }
+        self._add_to_manifest(tenant_id, segment)
+        return segment
+
+    def _delete_originals(self, refs: List[Any]) -> None:
+        for i in range(0, len(refs), self.DELETE_BATCH_SIZE):
+            batch = self.db.batch()
+            for ref in refs[i:i + self.DELETE_BATCH_SIZE]:
+                batch.delete(ref)
+            batch.commit()
+
+    def _flush(self, tenant_id: str, month: str, buffered: List[Tuple[Any, Dict[str, Any]]], stats: Dict[str, int]) -> None:
+        """Persist one partition's buffer; originals are deleted only after the manifest lists them."""
+        segment = self._write_segment(tenant_id, month, [record for _, record in buffered])
+        self._delete_originals([ref for ref, _ in buffered])
+        stats["segments"] += 1
+        stats["archived"] += segment["count"]
+        stats["bytes"] += segment["bytes"]
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Archives every message older than the retention window.
+
+        Returns:
+            Counts of archived messages, written segments and compressed bytes.
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=self.retention_days)
+        query = (
+            self.db.collection_group("messages")
+            .where("timestamp", "<", cutoff)
+            .order_by("timestamp")
+            .limit(self.PAGE_SIZE)
+        )
+
+        stats = {"archived": 0, "segments": 0, "bytes": 0}
+        partitions: Dict[Tuple[str, str], List[Tuple[Any, Dict[str, Any]]]] = {}
+        buffered = 0
+        last = None
+
+        while True:
+            # Cursors keep working after the documents they point at are deleted
+            page = query.start_after(last) if last is not None else query
+            docs = list(page.stream())
+            if not docs:
+                break
+
+            for doc in docs:
+                data = doc.to_dict()
+                owner = self._parse_path(doc.reference.path)
+                if owner is None or not data.get("timestamp"):
+                    continue
+                tenant_id, bot_id, chat_id = owner
+                ts = self._as_utc(data["timestamp"])
+                record = {**data, "id": doc.id, "bot_id": bot_id, "chat_id": chat_id, "timestamp": ts.isoformat()}
+                partition = partitions.setdefault((tenant_id, ts.strftime("%Y-%m")), [])
+                partition.append((doc.reference, record))
+                buffered += 1
+
+                if len(partition) >= self.SEGMENT_MAX_MESSAGES:
+                    self._flush(tenant_id, ts.strftime("%Y-%m"), partition, stats)
+                    buffered -= len(partition)
+                    partition.clear()
+            last = docs[-1]
+
+            if buffered >= self.MAX_BUFFERED_MESSAGES:
+                for (tenant_id, month), items in partitions.items():
+                    if items:
+                        self._flush(tenant_id, month, items, stats)
+                partitions.clear()
+                buffered = 0
+
+            if len(docs) < self.PAGE_SIZE:
+                break
+
+        for (tenant_id, month), items in partitions.items():
+            if items:
+                self._flush(tenant_id, month, items, stats)
+
+        self.logger.info(f"Archived {stats['archived']} messages into {stats['segments']} segments")
+        return stats
+
+    # --- Reads ---
+
+    def read_range(
+        self,
+        tenant_id: str,
+        start: datetime,
+        end: datetime,
+        bot_id: Optional[str] = None,
+        chat_id: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yields archived messages with start <= timestamp < end, oldest first per segment.
+        Only segments whose [start, end] overlaps the range are downloaded.
+        """
+        start_iso, end_iso = self._as_utc(start).isoformat(), self._as_utc(end).isoformat()
+        for segment in self.load_manifest(tenant_id)["segments"]:
+            if segment["end"] < start_iso or segment["start"] >= end_iso:
+                continue
+            if bot_id and bot_id not in segment.get("bots", []):
+                continue
+            raw = self.store.get(segment["key"])
+            if raw is None:
+                self.logger.error(f"Missing archive segment {segment['key']}")
+                continue
+            for line in gzip.decompress(raw).decode("utf-8").splitlines():
+                record = json.loads(line)
+                if not (start_iso <= record["timestamp"] < end_iso):
+                    continue
+                if bot_id and record["bot_id"] != bot_id:
+                    continue
+                if chat_id and record["chat_id"] != chat_id:
+                    continue
+                yield record
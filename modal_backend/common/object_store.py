@@ -0,0 +1,77 @@
+import os
+import logging
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+
+class ObjectStore(ABC):
+    """
+    Minimal object storage interface used for message archives.
+    Keys are '/'-separated paths; values are opaque bytes.
+    """
+
+    @abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """Stores `data` under `key`, replacing any existing object."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the object at `key`, or None if it does not exist."""
+
+    @abstractmethod
+    def list(self, prefix: str) -> List[str]:
+        """Returns all keys starting with `prefix`, sorted."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Removes the object at `key` if present."""
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    Filesystem-backed store for offline runs and tests.
+    Writes go to a temp file first and are renamed into place, so readers
+    never see a partial object.
+    """
+    def __init__(self, root: str = None):
+        self.root = root or os.getenv("ARCHIVE_DIR", "/tmp/softfawer-archive")
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix: str) -> List[str]:
+        keys = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a key's in-flight call does not finish before its deadline."""
+
+
+class _Flight:
+    __slots__ = ("done", "deadline", "result", "error", "waiters")
+
+    def __init__(self, deadline: float):
+        self.done = threading.Event()
+        self.deadline = deadline
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls across threads.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight block until it finishes and receive the same result (or
+    exception). Each key's deadline is set by the caller that started it:
+    joiners only wait for what is left of it, and after it passes the key is
+    free again so a hung call stops collecting waiters.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.stats = {"calls": 0, "coalesced": 0, "timeouts": 0}
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def request_key(model: str, messages: Any, **params: Any) -> str:
+        """Stable hash of a completion request (model, messages and sampling params)."""
+        raw = json.dumps({"model": model, "messages": messages, **params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: float = 30.0) -> Tuple[Any, bool]:
+        """
+        Runs fn() for `key`, or waits for the call already running for it.
+
+        Returns:
+            (result, coalesced) where coalesced is True if another caller's call was reused.
+        Raises:
+            SingleFlightTimeout if the key's deadline passes before the call finishes.
+        """
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.deadline <= now:
+                flight = _Flight(now + timeout)
+                self._flights[key] = flight
+                self.stats["calls"] += 1
+                leader = True
+            else:
+                flight.waiters += 1
+                self.stats["coalesced"] += 1
+                leader = False
+
+        if leader:
+            try:
+                flight.result = fn()
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+                flight.done.set()
+                if flight.waiters:
+                    self.logger.info(f"Single-flight: {flight.waiters} identical request(s) shared one call")
+        elif not flight.done.wait(max(flight.deadline - now, 0)):
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise SingleFlightTimeout(f"In-flight request {key[:12]} exceeded its deadline")
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, not leader
+
+
+# One per container, shared by every ArkClient
+single_flight = SingleFlight()
@@ -1,14 +1,25 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, List, Optional
 import logging
+from shared.intent_rules import Intent
 from ..common.ark_client import ArkClient
+from ..common.doc_retriever import doc_retriever
+from ..common.intent_classifier import intent_classifier
+from ..common.load_shedder import load_shedder
 
 logger = logging.getLogger(__name__)
 
+# Sent instead of an Ark answer while the container is shedding load
+BUSY_REPLY = (
+    "Estamos recibiendo muchos mensajes en este momento. "
+    "Por favor escribe de nuevo en unos minutos o escribe 'agente' para hablar con una persona."
+)
+
 def handle_ai_bot(
     message_text: str,
     chat_history: List[Dict[str, Any]],
     config: Dict[str, Any],
-    ark_client: ArkClient
+    ark_client: ArkClient,
+    escalate: Optional[Callable[[], None]] = None
 ) -> str:
     """
     Processes a user message using DeepSeek v3 via ArkClient.
@@ -16,18 +27,37 @@ def handle_ai_bot(
     Args:
         message_text: The user's input.
         chat_history: List of previous messages (dict with 'role' and 'content').
-        config: Bot configuration containing 'prompt' and 'model'.
+        config: Bot configuration containing 'prompt', 'model' and optionally
+                'business_info' / 'documents' (see DocRetriever).
         ark_client: Instance of ArkClient to make the API call.
+        escalate: Records a request for a human agent; without it, escalation
+                  requests go to the LLM instead of promising a handoff.
         
     Returns:
         The text response from the AI.
     """
     
+    # 0. Answer trivial messages locally (greetings, thanks, escalation, tenant patterns)
+    local = intent_classifier.local_reply(
+        message_text, config, has_history=bool(chat_history), can_escalate=escalate is not None
+    )
+    if local:
+        intent, reply = local
+        if intent == Intent.ESCALATE:
+            escalate()
+        logger.debug(f"Skipped LLM call for intent '{intent}'")
+        return reply
+
+    # Under Ark saturation answer right away instead of queueing another call
+    if load_shedder.should_shed():
+        logger.info(f"Shed LLM call ({load_shedder.switch.reason})")
+        return BUSY_REPLY
+
     # 1. Construct System Prompt
     system_prompt = config.get("prompt", "Eres un asistente útil y amable.")
     
-    # Contextual data injection (if we had specific context like business info in config)
-    business_info = config.get("business_info", "")
+    # Contextual data injection: only the business info / documents relevant to the question
+    business_info = doc_retriever.context_for(message_text, config)
     if business_info:
         system_prompt += f"\n\nInformación del negocio:\n{business_info}"
 
@@ -3,6 +3,8 @@ from typing import Dict, Any
 from fastapi import FastAPI, Request, HTTPException
 import os
 import json
+import asyncio
+from functools import partial
 
 # Define the image with necessary dependencies
 # We use a slim Python image and install our requirements
@@ -24,8 +26,11 @@ fastapi_app = FastAPI()
 
 # However, for the purpose of this file acting as the entry point, we will import them relative
 # assuming the file structure is preserved in the mount.
-from .common.firebase_service import MultiTenantService
+from .common.firebase_service import MultiTenantService, db
+from .common.message_archiver import MessageArchiver
+from .common.object_store import LocalObjectStore
 from .common.ark_client import ArkClient
+from .common.load_shedder import load_shedder
 from .handlers.ai_bot import handle_ai_bot
 from .handlers.rules_bot import handle_rules_bot
 
@@ -36,14 +41,46 @@ from .handlers.rules_bot import handle_rules_bot
         modal.Secret.from_name("firebase-credentials"), # Expected to have FIREBASE_SERVICE_ACCOUNT_PATH or content
         modal.Secret.from_name("ark-api-key")        # Expected to have ARK_API_KEY
     ],
-    mounts=[modal.Mount.from_local_dir("modal_backend", remote_path="/root/modal_backend")]
+    mounts=[
+        modal.Mount.from_local_dir("modal_backend", remote_path="/root/modal_backend"),
+        modal.Mount.from_local_dir("shared", remote_path="/root/shared")
+    ]
 )
 @modal.asgi_app()
 def fastapi_entrypoint():
     return fastapi_app
 
+# Archived chat segments (local filesystem backend on a Modal volume)
+archive_volume = modal.Volume.from_name("softfawer-message-archive", create_if_missing=True)
+
+@app.function(
+    secrets=[modal.Secret.from_name("firebase-credentials")],
+    mounts=[
+        modal.Mount.from_local_dir("modal_backend", remote_path="/root/modal_backend"),
+        modal.Mount.from_local_dir("shared", remote_path="/root/shared")
+    ],
+    volumes={"/archive": archive_volume},
+    schedule=modal.Period(days=1),
+    timeout=3600
+)
+def archive_messages():
+    """
+    Moves chat messages older than MESSAGE_RETENTION_DAYS into compressed
+    monthly segments and deletes the originals.
+    """
+    retention_days = int(os.getenv("MESSAGE_RETENTION_DAYS", "90"))
+    archiver = MessageArchiver(db, LocalObjectStore("/archive"), retention_days=retention_days)
+    stats = archiver.run()
+    archive_volume.commit()
+    print(f"Message archive: {stats}")
+
 # --- FastAPI Routes ---
 
+@fastapi_app.get("/status")
+async def status():
+    """Load shedding state and Ark call signals of this container"""
+    return {"load_shedder": load_shedder.metrics()}
+
 @fastapi_app.post("/webhook/{platform}")
 async def unified_webhook(platform: str, request: Request):
     """
@@ -116,7 +153,10 @@ async def unified_webhook(platform: str, request: Request):
         history = firebase.get_chat_history(tenant_id, bot_id, chat_id, limit=10)
         
         # Run AI
-        response_text = handle_ai_bot(user_text, history, config, ark)
+        # Off the event loop, so concurrent webhooks can share in-flight Ark calls
+        # Escalation requests are recorded on the chat for the agents' inbox
+        escalate = partial(firebase.mark_escalated, tenant_id, bot_id, chat_id)
+        response_text = await asyncio.to_thread(handle_ai_bot, user_text, history, config, ark, escalate)
         
     elif bot_type == "rules":
         # Run Rules Engine
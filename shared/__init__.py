@@ -0,0 +1,4 @@
+"""
+Shared
+Dependency-free modules used by both the bots app and modal_backend
+"""
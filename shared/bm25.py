@@ -0,0 +1,154 @@
+"""
+BM25
+Chunking and BM25 ranking of business documents, so LLM prompts carry only the relevant chunks
+"""
+
+from typing import Dict, List, Tuple
+import math
+import re
+
+from .intent_rules import normalize
+
+
+# Chunks are packed from paragraphs/lines up to this size
+CHUNK_TOKENS = 120
+
+# Defaults for the context_top_k / context_token_budget settings
+TOP_K = 4
+TOKEN_BUDGET = 400
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Too common in Spanish questions to say anything about relevance
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "me", "mi", "o", "para", "por", "que", "se", "si", "su", "sus", "te", "tu",
+    "un", "una", "y", "hay", "como", "cual", "cuales", "donde", "esta", "estan",
+    "tienen", "tiene", "puedo", "pueden", "quiero", "the", "and", "of", "to"
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in normalize(text).split() if t not in STOPWORDS and len(t) > 1]
+
+
+def chunk_text(text: str, title: str = "", max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """
+    Split a document into chunks of at most ~max_tokens.
+
+    Paragraphs and lines are kept whole where possible, so menu items and
+    price lines stay together; oversized lines are split on word boundaries.
+    Each chunk is prefixed with the document title for context.
+    """
+    prefix = f"{title}: " if title else ""
+    pieces: List[str] = []
+    for line in re.split(r"\n+", text):
+        line = line.strip()
+        if not line:
+            continue
+        if estimate_tokens(line) <= max_tokens:
+            pieces.append(line)
+            continue
+        current: List[str] = []
+        for word in line.split():
+            if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+                pieces.append(" ".join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+
+    chunks: List[str] = []
+    current = []
+    for piece in pieces:
+        if current and estimate_tokens("\n".join(current + [piece])) > max_tokens:
+            chunks.append(prefix + "\n".join(current))
+            current = []
+        current.append(piece)
+    if current:
+        chunks.append(prefix + "\n".join(current))
+    return chunks
+
+
+class BM25Index:
+    """
+    Compact BM25 index over text chunks.
+
+    Postings map each term to (chunk, weight) pairs with the length
+    normalization folded in, so scoring a question is a few dict lookups.
+    """
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+        self.tokens = [estimate_tokens(c) for c in chunks]
+        docs = [tokenize(c) for c in chunks]
+        avg_length = (sum(len(d) for d in docs) / len(docs)) if docs else 0.0
+
+        term_counts: Dict[str, Dict[int, int]] = {}
+        for doc_id, terms in enumerate(docs):
+            for term in terms:
+                counts = term_counts.setdefault(term, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        n = len(docs)
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for term, counts in term_counts.items():
+            idf = math.log(1 + (n - len(counts) + 0.5) / (len(counts) + 0.5))
+            self.postings[term] = [
+                (doc_id, idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(docs[doc_id]) / (avg_length or 1.0))))
+                for doc_id, tf in counts.items()
+            ]
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def total_tokens(self) -> int:
+        return sum(self.tokens)
+
+    def search(self, query: str, top_k: int = TOP_K) -> List[Tuple[int, float]]:
+        """(chunk index, score) of the best matching chunks, best first"""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            for doc_id, weight in self.postings.get(term, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+    def context_for(self, query: str, top_k: int = TOP_K, token_budget: int = TOKEN_BUDGET) -> List[str]:
+        """
+        Chunks to put in the prompt: everything if it fits the budget,
+        otherwise the top-k matches that fit (or the leading chunks if none
+        match), in document order.
+        """
+        if self.total_tokens() <= token_budget:
+            return list(self.chunks)
+        picked, used = [], 0
+        for index, _ in self.search(query, top_k):
+            if used + self.tokens[index] > token_budget:
+                continue
+            picked.append(index)
+            used += self.tokens[index]
+        if not picked:
+            # Nothing matched; fall back to the start of the documents
+            for index, tokens in enumerate(self.tokens):
+                if used + tokens > token_budget:
+                    break
+                picked.append(index)
+                used += tokens
+        return [self.chunks[i] for i in sorted(picked)]
+
+
+def build_index(documents: List[Dict[str, str]], extra_context: str = "") -> BM25Index:
+    """Index over the extra context (e.g. business info) plus [{"title", "content"}] documents"""
+    chunks: List[str] = []
+    if extra_context:
+        chunks.extend(chunk_text(extra_context))
+    for document in documents:
+        chunks.extend(chunk_text(document.get("content", ""), document.get("title", "")))
+    return BM25Index(chunks)
@@ -0,0 +1,124 @@
+"""
+Intent Rules
+Deterministic local classification of greetings, menu picks, confirmations and escalations
+"""
+
+from typing import Dict, Any, List, Optional, Pattern, Tuple
+from dataclasses import dataclass
+import json
+import logging
+import re
+import unicodedata
+
+
+logger = logging.getLogger(__name__)
+
+
+class Intent:
+    """Intents answered without a model"""
+    GREETING = "greeting"
+    THANKS = "thanks"
+    GOODBYE = "goodbye"
+    MENU = "menu"
+    MENU_CHOICE = "menu_choice"
+    CONFIRM = "confirm"
+    DENY = "deny"
+    ESCALATE = "escalate"
+
+
+# Matched against the whole normalized message, so "hola" short-circuits but
+# "hola, cuanto cuesta el corte?" still goes to the model
+_COURTESY = r"( (como estas|como esta|que tal|buen dia|buenas|amig[oa]|a todos|por todo|por la ayuda|por tu ayuda))*"
+
+BUILTIN_RULES: List[Tuple[str, str]] = [
+    (Intent.GREETING, r"(hola|buen(os|as)?( (dias|tardes|noches))?|hey|hi|hello|que tal|saludos)" + _COURTESY),
+    (Intent.THANKS, r"(muchas |mil )?(gracias|grax|thx|thanks|te agradezco)" + _COURTESY),
+    (Intent.GOODBYE, r"(adios|bye|hasta luego|nos vemos|chao|chau)" + _COURTESY),
+    (Intent.MENU, r"(menu|opciones|ayuda|help|inicio|start)"),
+    (Intent.MENU_CHOICE, r"\d{1,2}"),
+    (Intent.CONFIRM, r"(si|sip|ok|okay|vale|claro|de acuerdo|perfecto|listo|confirmo|correcto)"),
+    (Intent.DENY, r"(no|nop|nel|para nada)"),
+]
+
+# Matched anywhere in the message
+ESCALATION_KEYWORDS = ["agente", "humano", "persona", "hablar con", "asesor", "operador"]
+
+# Only meaningful as an answer to the previous bot message
+CONTEXTUAL_INTENTS = {Intent.MENU_CHOICE, Intent.CONFIRM, Intent.DENY}
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    rule: str
+    reply: Optional[str] = None
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation, squeeze repeats ("Holaaa!!" -> "hola")"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = re.sub(r"(\w)\1{2,}", r"\1", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+_BUILTIN = [(intent, re.compile(pattern)) for intent, pattern in BUILTIN_RULES]
+
+# Tenant pattern JSON -> compiled rules
+_TENANT_CACHE: Dict[str, List[Tuple[str, Pattern, Optional[str]]]] = {}
+_TENANT_CACHE_MAX = 512
+
+
+def tenant_rules(patterns: Dict[str, Any]) -> List[Tuple[str, Pattern, Optional[str]]]:
+    """
+    Compile tenant intent patterns, e.g.
+    {"horario": {"patterns": ["a que hora abren", "horario"], "reply": "..."}}
+
+    Patterns are plain phrases (matched as whole words anywhere) unless they
+    start with "re:", in which case the rest is a regex.
+    """
+    key = json.dumps(patterns, sort_keys=True)
+    if key not in _TENANT_CACHE:
+        if len(_TENANT_CACHE) >= _TENANT_CACHE_MAX:
+            _TENANT_CACHE.clear()
+        rules = []
+        for intent, spec in patterns.items():
+            for pattern in spec.get("patterns", []):
+                if pattern.startswith("re:"):
+                    regex = pattern[3:]
+                else:
+                    regex = rf"\b{re.escape(normalize(pattern))}\b"
+                try:
+                    rules.append((intent, re.compile(regex), spec.get("reply")))
+                except re.error as e:
+                    logger.warning(f"Invalid intent pattern {pattern!r}: {e}")
+        _TENANT_CACHE[key] = rules
+    return _TENANT_CACHE[key]
+
+
+def classify(text: str, patterns: Optional[Dict[str, Any]] = None) -> Optional[IntentMatch]:
+    """
+    Classify a message locally.
+
+    Tenant patterns are checked first, then escalation keywords, then the
+    built-in whole-message rules.
+
+    Returns:
+        The match, or None if the message needs the model
+    """
+    normalized = normalize(text)
+
+    for intent, regex, reply in tenant_rules(patterns or {}):
+        if regex.search(normalized):
+            return IntentMatch(intent, f"tenant:{regex.pattern}", reply)
+
+    for keyword in ESCALATION_KEYWORDS:
+        if re.search(rf"\b{keyword}\b", normalized):
+            return IntentMatch(Intent.ESCALATE, f"keyword:{keyword}")
+
+    for intent, regex in _BUILTIN:
+        if regex.fullmatch(normalized):
+            return IntentMatch(intent, f"builtin:{intent}")
+
+    return None
@@ -0,0 +1,62 @@
+"""
+Load Shedding
+Hysteresis switch deciding when LLM handlers answer without the model
+"""
+
+from typing import Dict, List, Optional
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct * len(ordered)))]
+
+
+class ShedSwitch:
+    """
+    Two-state (normal / shedding) switch over named load signals.
+
+    Shedding starts when any signal reaches its enter threshold and stops only
+    after every signal has stayed at or below its exit threshold for
+    `cooldown` seconds. The gap between the thresholds plus the cooldown keep
+    it from flapping at the boundary. Signals missing from an update (e.g. too
+    few samples) count as healthy.
+    """
+
+    def __init__(self, thresholds: Dict[str, Dict[str, float]], cooldown: float):
+        self.thresholds = thresholds
+        self.cooldown = cooldown
+        self.shedding = False
+        self.reason: Optional[str] = None
+        self.since = time.monotonic()
+        self.transitions = 0
+        self._healthy_since: Optional[float] = None
+
+    def update(self, signals: Dict[str, float], now: float) -> bool:
+        """Apply a reading of the signals; returns whether to shed"""
+        if not self.shedding:
+            tripped = [name for name, value in signals.items() if value >= self.thresholds[name]["enter"]]
+            if tripped:
+                self.shedding, self.reason = True, tripped[0]
+                self.since, self._healthy_since = now, None
+                self.transitions += 1
+                logger.warning(f"LLM load shedding ON ({self.reason}): {signals}")
+            return self.shedding
+
+        if all(value <= self.thresholds[name]["exit"] for name, value in signals.items()):
+            if self._healthy_since is None:
+                self._healthy_since = now
+            elif now - self._healthy_since >= self.cooldown:
+                logger.warning(f"LLM load shedding OFF after {now - self.since:.0f}s: {signals}")
+                self.shedding, self.reason = False, None
+                self.since, self._healthy_since = now, None
+                self.transitions += 1
+        else:
+            self._healthy_since = None
+        return self.shedding
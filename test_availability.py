@@ -0,0 +1,111 @@
+from datetime import datetime
+
+from handlers.availability import DayAvailability, _load_busy_bitmaps, _span_mask
+
+SLOT = 30
+
+
+def mask(start, end):
+    """Busy bitmap for 'HH:MM' start to end on 30 minute slots"""
+    first = int(start[:2]) * 2 + int(start[3:]) // SLOT
+    last = int(end[:2]) * 2 + int(end[3:]) // SLOT
+    return _span_mask(first, last - first)
+
+
+def day(**busy):
+    return DayAvailability(SLOT, mask("09:00", "18:00"), busy or {"Ana": 0})
+
+
+def test_overlapping_spans_are_busy_and_adjacent_ones_free():
+    availability = day(Ana=mask("10:00", "11:00"))
+    assert availability.find_staff("10:00", 30) is None
+    assert availability.find_staff("10:30", 30) is None
+    # Starts before but runs into the booking
+    assert availability.find_staff("09:30", 60) is None
+    # Ends exactly when the booking starts / starts exactly when it ends
+    assert availability.find_staff("09:30", 30) == "Ana"
+    assert availability.find_staff("11:00", 30) == "Ana"
+
+
+def test_first_free_staff_takes_the_slot():
+    availability = day(Ana=mask("10:00", "11:00"), Luis=mask("11:00", "12:00"))
+    assert availability.find_staff("10:00", 60) == "Luis"
+    assert availability.find_staff("10:30", 60) is None
+    assert availability.find_staff("11:00", 60) == "Ana"
+
+
+def test_opening_hours_bound_the_whole_duration():
+    availability = day()
+    assert availability.find_staff("09:00", 30) == "Ana"
+    assert availability.find_staff("08:30", 30) is None
+    assert availability.find_staff("17:00", 60) == "Ana"
+    assert availability.find_staff("17:30", 60) is None
+    # Durations round up to whole slots
+    assert availability.find_staff("17:30", 20) == "Ana"
+    assert availability.find_staff("17:30", 31) is None
+
+
+def test_misaligned_start_is_never_offered():
+    assert day().find_staff("10:15", 30) is None
+
+
+def test_free_starts_skips_busy_spans_and_rounds_not_before_up():
+    availability = day(Ana=mask("09:00", "17:00"))
+    assert availability.free_starts(30) == ["17:00", "17:30"]
+    assert availability.free_starts(60) == ["17:00"]
+    assert availability.free_starts(30, not_before=datetime(2026, 5, 4, 17, 1)) == ["17:30"]
+    assert DayAvailability(SLOT, 0, {"Ana": 0}).free_starts(30) == []
+
+
+def test_mark_busy_blocks_the_span_for_that_staff_only():
+    availability = day(Ana=0, Luis=0)
+    availability.mark_busy("Ana", "12:00", 45)
+    assert availability.busy["Ana"] == mask("12:00", "13:00")
+    assert availability.find_staff("12:30", 30) == "Luis"
+    availability.mark_busy("Nadie", "12:00", 30)
+    availability.mark_busy("Luis", "12:10", 30)
+    assert availability.busy["Luis"] == 0
+
+
+class Doc:
+    def __init__(self, data):
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+class Query:
+    def __init__(self, appointments):
+        self.appointments = appointments
+
+    def collection(self, name):
+        return self
+
+    def document(self, name):
+        return self
+
+    def where(self, *args):
+        return self
+
+    def select(self, fields):
+        return self
+
+    def stream(self):
+        return [Doc(apt) for apt in self.appointments]
+
+
+def test_bitmaps_skip_cancelled_and_place_legacy_appointments_on_a_free_staff():
+    db = Query([
+        {"time": "10:00", "duration_min": 60, "staff": "Ana"},
+        {"time": "10:30", "duration_min": 30, "staff": "Ana", "status": "cancelled"},
+        # No staff: lands on the first one free for its span
+        {"time": "10:00", "duration_min": 30},
+        {"time": "15:00"},
+        {"duration_min": 30, "staff": "Luis"},
+    ])
+
+    busy = _load_busy_bitmaps(db, "t1", "2026-05-04", SLOT, ["Ana", "Luis"], default_duration=45)
+
+    assert busy["Ana"] == mask("10:00", "11:00") | mask("15:00", "16:00")
+    assert busy["Luis"] == mask("10:00", "10:30")
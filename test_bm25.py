@@ -0,0 +1,53 @@
+from shared.bm25 import BM25Index, build_index, chunk_text, estimate_tokens, tokenize
+
+MENU = "\n".join(
+    f"Plato {i}: descripcion del plato numero {i} con ingredientes varios, precio {i * 10} pesos."
+    for i in range(60)
+)
+POLICIES = "Estacionamiento gratuito para clientes.\nAceptamos tarjetas de credito y debito."
+
+
+def test_tokenize_drops_accents_and_stopwords():
+    assert tokenize("¿Dónde está el ESTACIONAMIENTO?") == ["estacionamiento"]
+
+
+def test_chunks_keep_lines_whole_and_carry_title():
+    chunks = chunk_text(MENU, "Menu", max_tokens=60)
+    assert len(chunks) > 1
+    assert all(chunk.startswith("Menu: ") for chunk in chunks)
+    lines = [line for chunk in chunks for line in chunk[len("Menu: "):].split("\n")]
+    assert lines == MENU.split("\n")
+
+
+def test_oversized_line_is_split_on_words():
+    line = " ".join(["palabra"] * 200)
+    chunks = chunk_text(line, max_tokens=20)
+    assert all(estimate_tokens(chunk) <= 20 for chunk in chunks)
+    assert " ".join(chunks) == line
+
+
+def test_search_ranks_matching_chunk_first():
+    index = BM25Index(["Horario de lunes a viernes", "Estacionamiento gratuito", "Pago con tarjeta"])
+    hits = index.search("hay estacionamiento?")
+    assert [i for i, _ in hits] == [1]
+    assert index.search("zzz") == []
+
+
+def test_context_within_budget_keeps_relevant_chunks():
+    index = build_index([{"title": "Menu", "content": MENU}, {"title": "Politicas", "content": POLICIES}])
+    assert index.total_tokens() > 400
+
+    chunks = index.context_for("tienen estacionamiento?", top_k=2, token_budget=400)
+    assert any("Estacionamiento" in chunk for chunk in chunks)
+    assert sum(estimate_tokens(chunk) for chunk in chunks) <= 400
+
+
+def test_small_context_is_sent_whole():
+    index = build_index([], "Somos una barberia familiar.")
+    assert index.context_for("precio del corte?") == ["Somos una barberia familiar."]
+
+
+def test_no_match_falls_back_to_leading_chunks():
+    index = build_index([{"title": "Menu", "content": MENU}])
+    chunks = index.context_for("zzz", top_k=4, token_budget=200)
+    assert chunks and chunks[0] == index.chunks[0]
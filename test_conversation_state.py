@@ -0,0 +1,161 @@
+import sys
+import types
+from datetime import datetime, timedelta
+
+import pytest
+
+from handlers.conversation_state import STATE_COLLECTION, estimate_size, sweep_expired
+
+NOW = datetime(2026, 5, 1, 12, 0)
+DELETE_FIELD = object()
+FAILED_PRECONDITION = 9
+UNAVAILABLE = 14
+
+
+@pytest.fixture(autouse=True)
+def firestore_modules(monkeypatch):
+    """The two google modules sweep_expired imports, reduced to the names it uses"""
+    firestore = types.SimpleNamespace(DELETE_FIELD=DELETE_FIELD)
+    code_pb2 = types.SimpleNamespace(FAILED_PRECONDITION=FAILED_PRECONDITION)
+    monkeypatch.setitem(sys.modules, "google", types.SimpleNamespace())
+    monkeypatch.setitem(sys.modules, "google.cloud", types.SimpleNamespace(firestore=firestore))
+    monkeypatch.setitem(sys.modules, "google.rpc", types.SimpleNamespace(code_pb2=code_pb2))
+
+
+class Ref:
+    def __init__(self, path):
+        self.path = path
+
+
+class Snap:
+    def __init__(self, path, data):
+        self.reference = Ref(path)
+        self.update_time = "t0"
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class Query:
+    def __init__(self, docs, start=0, limit=None):
+        self.docs, self.start, self._limit = docs, start, limit
+
+    def where(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def start_after(self, cursor):
+        return Query(self.docs, self.docs.index(cursor) + 1, self._limit)
+
+    def limit(self, n):
+        return Query(self.docs, self.start, n)
+
+    def stream(self):
+        return iter(self.docs[self.start:self.start + self._limit])
+
+
+class Failure:
+    def __init__(self, code, attempts):
+        self.code, self.attempts = code, attempts
+
+
+class BulkWriter:
+    """Acknowledges writes on close, except those `errors` rejects with a status code"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.writes = []
+
+    def on_write_result(self, callback):
+        self.on_result = callback
+
+    def on_write_error(self, callback):
+        self.on_error = callback
+
+    def delete(self, ref, option=None):
+        self.writes.append(("delete", ref, None))
+
+    def update(self, ref, data, option=None):
+        self.writes.append(("update", ref, data))
+
+    def close(self):
+        for _, ref, _ in self.writes:
+            code = self.errors.get(ref.path)
+            if code is None:
+                self.on_result(ref, None, self)
+                continue
+            attempts = 1
+            while self.on_error(Failure(code, attempts)):
+                attempts += 1
+
+
+class DB:
+    def __init__(self, docs, errors=None):
+        self.docs = docs
+        self.writer = BulkWriter(errors or {})
+
+    def collection_group(self, name):
+        assert name == STATE_COLLECTION
+        return Query(self.docs)
+
+    def write_option(self, **kwargs):
+        return kwargs
+
+    def bulk_writer(self):
+        return self.writer
+
+
+def state(path, **data):
+    return Snap(f"tenants/t1/conversations/{path}/{STATE_COLLECTION}/s1", data)
+
+
+def faq_state(path):
+    expired = NOW - timedelta(minutes=5)
+    return state(path, awaiting_feedback=True, last_question="horario?", expires={"faq": expired}, expires_at=expired)
+
+
+def test_sweep_deletes_compacts_and_counts_acknowledged_writes():
+    lead_expires = NOW + timedelta(hours=3)
+    mixed = state(
+        "+522", last_question="precio?", lead_state="ASK_EMAIL",
+        expires={"faq": NOW - timedelta(minutes=1), "lead": lead_expires}, expires_at=NOW - timedelta(minutes=1)
+    )
+    docs = [faq_state("+521"), mixed, faq_state("+523")]
+    db = DB(docs)
+
+    stats = sweep_expired(db, now=NOW, page_size=2)
+
+    assert stats == {
+        "scanned": 3, "compacted": 1, "deleted": 2, "skipped": 0, "failed": 0,
+        "bytes": 2 * (estimate_size(docs[0].reference.path) + 32 + estimate_size(docs[0].to_dict()))
+                 + estimate_size("last_question") + estimate_size("precio?")
+    }
+    update = next(data for op, ref, data in db.writer.writes if op == "update")
+    assert update == {"last_question": DELETE_FIELD, "expires.faq": DELETE_FIELD, "expires_at": lead_expires}
+
+
+def test_sweep_counts_rejected_and_failed_writes_separately():
+    docs = [faq_state("+521"), faq_state("+522"), faq_state("+523")]
+    db = DB(docs, errors={
+        # The customer wrote meanwhile: not retried
+        docs[1].reference.path: FAILED_PRECONDITION,
+        # Backend kept failing: retried until out of attempts
+        docs[2].reference.path: UNAVAILABLE,
+    })
+
+    stats = sweep_expired(db, now=NOW)
+
+    assert stats["scanned"] == 3
+    assert stats["deleted"] == 1
+    assert stats["skipped"] == 1
+    assert stats["failed"] == 1
+    assert stats["bytes"] == estimate_size(docs[0].reference.path) + 32 + estimate_size(docs[0].to_dict())
+
+
+def test_nothing_expired_writes_nothing():
+    assert sweep_expired(DB([]), now=NOW) == {
+        "scanned": 0, "compacted": 0, "deleted": 0, "skipped": 0, "failed": 0, "bytes": 0
+    }
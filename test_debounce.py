@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from handlers.debounce import (
+    MAX_WINDOW_MS, MessageDebouncer, Turn, add_event, close_at, debounce_window,
+    finish_turn, take_turn, turn_ready
+)
+
+WINDOW = 1.0
+MAX_WINDOW = 3.0
+
+
+def event(text, timestamp=0):
+    return {"text": text, "timestamp": timestamp, "messageId": f"m-{text}"}
+
+
+def test_first_message_opens_burst():
+    burst, leads = add_event(None, event("hola"), 100.0, WINDOW, MAX_WINDOW)
+    assert leads
+    assert burst["opened_at"] == burst["last_at"] == 100.0
+    assert [e["text"] for e in burst["events"]] == ["hola"]
+
+
+def test_messages_within_window_join_and_extend_it():
+    burst, _ = add_event(None, event("hola"), 100.0, WINDOW, MAX_WINDOW)
+    burst, leads = add_event(burst, event("quiero"), 100.8, WINDOW, MAX_WINDOW)
+    assert not leads
+    assert close_at(burst, WINDOW, MAX_WINDOW) == 101.8
+    burst, leads = add_event(burst, event("una cita"), 101.5, WINDOW, MAX_WINDOW)
+    assert not leads
+    assert [e["text"] for e in burst["events"]] == ["hola", "quiero", "una cita"]
+
+
+def test_burst_closes_at_max_window_while_sender_keeps_typing():
+    burst, _ = add_event(None, event("a"), 100.0, WINDOW, MAX_WINDOW)
+    for t in (100.5, 101.0, 101.5, 102.0, 102.5):
+        burst, _ = add_event(burst, event("x"), t, WINDOW, MAX_WINDOW)
+    assert close_at(burst, WINDOW, MAX_WINDOW) == 103.0
+    _, leads = add_event(burst, event("late"), 103.2, WINDOW, MAX_WINDOW)
+    assert leads
+
+
+def test_unanswered_burst_is_carried_into_the_next():
+    # Its leader never deleted it (slow or dead), so no turn answered these
+    stale, _ = add_event(None, event("hola"), 100.0, WINDOW, MAX_WINDOW)
+    burst, leads = add_event(stale, event("sigues ahi?"), 200.0, WINDOW, MAX_WINDOW)
+    assert leads
+    assert burst["burst_id"] != stale["burst_id"]
+    assert [e["text"] for e in burst["events"]] == ["hola", "sigues ahi?"]
+
+
+def test_turn_text_joins_messages():
+    assert Turn([event("hola"), event("precio?")]).text == "hola\nprecio?"
+
+
+def test_window_from_settings_is_capped():
+    assert debounce_window({"settings": {"debounce_ms": 1500}}) == 1.5
+    assert debounce_window({"settings": {"debounce_ms": 60000}}) == MAX_WINDOW_MS / 1000
+    assert debounce_window({"settings": {"debounce_ms": -5}}) == 0
+
+
+def test_turns_run_in_sequence():
+    turns, first = take_turn(None, 100.0)
+    turns, second = take_turn(turns, 101.0)
+    assert (first, second) == (0, 1)
+    assert turn_ready(turns, first, 101.0, lease=60.0)[1]
+    assert not turn_ready(turns, second, 101.0, lease=60.0)[1]
+    turns = finish_turn(turns, first, 102.0)
+    assert turn_ready(turns, second, 102.0, lease=60.0)[1]
+
+
+def test_dead_turn_is_skipped_after_its_lease():
+    turns, _ = take_turn(None, 100.0)
+    turns, second = take_turn(turns, 101.0)
+    turns, third = take_turn(turns, 102.0)
+    turns, ready = turn_ready(turns, second, 159.0, lease=60.0)
+    assert not ready
+    turns, ready = turn_ready(turns, second, 160.0, lease=60.0)
+    assert ready
+    # Only the dead turn is skipped: the next one still waits for `second`
+    assert not turn_ready(turns, third, 161.0, lease=60.0)[1]
+
+
+def test_idle_sender_turn_starts_a_fresh_lease():
+    turns, first = take_turn(None, 100.0)
+    turns = finish_turn(turns, first, 101.0)
+    turns, second = take_turn(turns, 1000.0)
+    turns, third = take_turn(turns, 1001.0)
+    assert turn_ready(turns, second, 1001.0, lease=60.0)[1]
+    assert not turn_ready(turns, third, 1001.0, lease=60.0)[1]
+
+
+class MemoryDebouncer(MessageDebouncer):
+    """Debouncer over an in-memory document store instead of Firestore"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.docs = {}
+        self.lock = threading.Lock()
+
+    def _ref(self, db, key):
+        return ("burst", key)
+
+    def _turns_ref(self, db, key):
+        return ("turns", key)
+
+    def _transact(self, db, refs, change):
+        with self.lock:
+            docs = [self.docs.get(ref) for ref in refs]
+            updated, result = change(docs)
+            for ref, new in zip(refs, updated):
+                if new is None:
+                    self.docs.pop(ref, None)
+                else:
+                    self.docs[ref] = new
+            return result
+
+
+def test_back_to_back_bursts_reply_in_order():
+    window = 0.05
+    key = ("t1", "s1", "+521")
+    replies = []
+
+    async def handle(debouncer, text, reply_delay):
+        message = SimpleNamespace(text=text, timestamp=0, messageId=f"m-{text}")
+        turn = await debouncer.submit(None, key, message, window)
+        if turn is None:
+            return
+        try:
+            # The first turn is slow (e.g. an LLM call); the second is instant
+            await asyncio.sleep(reply_delay)
+            replies.append(turn.text)
+        finally:
+            await debouncer.release(None, key, turn)
+
+    async def run():
+        debouncer = MemoryDebouncer(poll=0.01)
+        first = [asyncio.ensure_future(handle(debouncer, "hola", 0.3))]
+        await asyncio.sleep(0.01)
+        first.append(asyncio.ensure_future(handle(debouncer, "quiero una cita", 0.3)))
+        # Second burst opens right after the first one closes
+        await asyncio.sleep(window + 0.05)
+        second = asyncio.ensure_future(handle(debouncer, "para manana", 0.0))
+        await asyncio.gather(*first, second)
+        return debouncer
+
+    debouncer = asyncio.run(run())
+    assert replies == ["hola\nquiero una cita", "para manana"]
+    assert debouncer.stats == {"turns": 2, "merged": 1, "waited": 1}
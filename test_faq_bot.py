@@ -0,0 +1,47 @@
+import asyncio
+
+from handlers.faq_bot import DEFAULT_KNOWLEDGE, answer_question
+from handlers.llm_router import Completion
+
+HOURS = DEFAULT_KNOWLEDGE["horarios"]["answer"]
+
+
+class LLM:
+    def __init__(self, completion=None, delay=0.0):
+        self.completion, self.delay, self.calls = completion, delay, 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.completion
+
+
+def answer(text, ask_llm, **kwargs):
+    return asyncio.run(answer_question(text, DEFAULT_KNOWLEDGE, ask_llm, **kwargs))
+
+
+def test_confident_match_answers_without_calling_the_llm():
+    llm = LLM(Completion("llm", "openai", "gpt-4o-mini"))
+    reply, source, outcome, completion, confidence = answer("a que hora abren y cierran?", llm)
+    assert (reply, source, outcome, completion) == (HOURS, "knowledge_base", "kb_confident", None)
+    assert confidence >= 0.6
+    assert llm.calls == 0
+
+
+def test_unconfident_match_asks_the_llm():
+    llm = LLM(Completion("Abrimos a las 9.", "openai", "gpt-4o-mini"))
+    reply, source, outcome, completion, _ = answer("estan abiertos el sabado?", llm)
+    assert (reply, source, outcome) == ("Abrimos a las 9.", "openai", "llm")
+    assert completion is llm.completion and llm.calls == 1
+
+
+def test_llm_failure_or_deadline_falls_back_to_the_match():
+    assert answer("estan abiertos el sabado?", LLM(None))[:3] == (HOURS, "knowledge_base", "llm_failed")
+    slow = LLM(Completion("tarde", "openai", "gpt-4o-mini"), delay=1.0)
+    assert answer("estan abiertos el sabado?", slow, deadline=0.01)[:3] == (HOURS, "knowledge_base", "llm_deadline")
+
+
+def test_without_llm_or_match():
+    assert answer("estan abiertos el sabado?", None, unavailable="degraded")[:3] == (HOURS, "knowledge_base", "degraded")
+    assert answer("me gusta el azul", None)[:3] == (None, "fallback", "no_llm")
+    assert answer("me gusta el azul", LLM(None))[:3] == (None, "fallback", "llm_failed")
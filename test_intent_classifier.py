@@ -0,0 +1,31 @@
+import pytest
+
+from handlers.intent_classifier import Intent, classify, normalize
+from modal_backend.common.intent_classifier import IntentClassifier
+
+PATTERNS = {
+    "horario": {"patterns": ["a que hora abren", "re:^horarios?$"], "reply": "Abrimos de 9 a 18."},
+    "ubicacion": {"patterns": ["donde estan"]},
+}
+
+MESSAGES = [
+    "Hola", "Holaaa!!", "Buenas tardes", "hola, cuanto cuesta el corte?",
+    "Muchas gracias por la ayuda", "adiós", "menú", "2", "Sí", "no",
+    "quiero hablar con un asesor", "¿A qué hora abren?", "Horarios", "donde estan ubicados",
+    "necesito una cita para mañana", "",
+]
+
+
+@pytest.mark.parametrize("text", MESSAGES)
+def test_bots_and_backend_classify_alike(text):
+    bot = classify(text, {"intent_patterns": PATTERNS})
+    backend = IntentClassifier().classify(text, {"intent_patterns": PATTERNS})
+    assert (backend is None) == (bot is None)
+    if bot is not None:
+        assert backend == (bot.intent, bot.reply)
+
+
+def test_parity_covers_builtin_tenant_and_model_paths():
+    intents = {getattr(classify(text, {"intent_patterns": PATTERNS}), "intent", None) for text in MESSAGES}
+    assert {Intent.GREETING, Intent.ESCALATE, "horario", None} <= intents
+    assert IntentClassifier.normalize("¿Qué TAL?") == normalize("¿Qué TAL?") == "que tal"
@@ -0,0 +1,148 @@
+import io
+import json
+
+from handlers.lead_export import export_leads, iter_leads
+
+
+class Snap:
+    def __init__(self, id, data, exists=True):
+        self.id, self._data, self.exists = id, data, exists
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class Query:
+    """Leads ordered by (field, id) with where, keyset cursors and limits"""
+
+    def __init__(self, db, filters=(), order=None, after=None, limit=None):
+        self.db, self.filters, self.order, self.after, self._limit = db, filters, order, after, limit
+
+    def _with(self, **changes):
+        fields = {"filters": self.filters, "order": self.order, "after": self.after, "limit": self._limit}
+        return Query(self.db, **{**fields, **changes})
+
+    def where(self, field, op, value):
+        return self._with(filters=self.filters + ((field, op, value),))
+
+    def order_by(self, field):
+        return self if field == "__name__" else self._with(order=field)
+
+    def start_after(self, cursor):
+        if isinstance(cursor, Snap):
+            cursor = {self.order: cursor.to_dict()[self.order], "__name__": cursor.id}
+        return self._with(after=(cursor[self.order], cursor["__name__"]))
+
+    def limit(self, n):
+        return self._with(limit=n)
+
+    def stream(self):
+        ops = {"==": lambda a, b: a == b, ">=": lambda a, b: a >= b, "<": lambda a, b: a < b}
+        rows = [
+            (lead[self.order], id, lead) for id, lead in self.db.leads.items()
+            # Firestore leaves out documents without the ordered field
+            if self.order in lead and all(f in lead and ops[op](lead[f], v) for f, op, v in self.filters)
+        ]
+        rows.sort(key=lambda row: row[:2])
+        if self.after is not None:
+            rows = [row for row in rows if row[:2] > self.after]
+        self.db.reads += 1
+        return [Snap(id, lead) for _, id, lead in rows[:self._limit]]
+
+
+class Doc:
+    def __init__(self, db, path):
+        self.db, self.path = db, path
+
+    def collection(self, name):
+        return Query(self.db) if name == "leads" else Doc(self.db, f"{self.path}/{name}")
+
+    def document(self, id):
+        return Doc(self.db, f"{self.path}/{id}")
+
+    def get(self):
+        data = self.db.docs.get(self.path)
+        return Snap(self.path, data, exists=data is not None)
+
+    def set(self, data):
+        self.db.docs[self.path] = data
+
+
+class DB:
+    def __init__(self, leads):
+        self.leads, self.docs, self.reads = leads, {}, 0
+
+    def collection(self, name):
+        return Doc(self, name)
+
+
+def lead(completed, updated=None, **data):
+    return {"completed_at": completed, "updated_at": updated or completed, **data}
+
+
+LEADS = {
+    "a": lead("2026-01-01T10:00"),
+    "c": lead("2026-01-02T10:00"),
+    "b": lead("2026-01-02T10:00", priority="HOT"),
+    "d": lead("2026-01-03T10:00", priority="HOT"),
+    "e": lead("2026-01-04T10:00"),
+}
+
+
+def export(db, **kwargs):
+    out = io.StringIO()
+    result = export_leads(db, "t1", out, **kwargs)
+    return [json.loads(line)["id"] for line in out.getvalue().splitlines()], result
+
+
+def test_pages_resume_after_the_last_key_and_break_ties_by_id():
+    db = DB(dict(LEADS))
+    assert [lead["id"] for lead in iter_leads(db, "t1", page_size=2)] == ["a", "b", "c", "d", "e"]
+    assert db.reads == 3
+
+    after = {"completed_at": "2026-01-02T10:00", "id": "b"}
+    assert [lead["id"] for lead in iter_leads(db, "t1", after=after, page_size=2)] == ["c", "d", "e"]
+
+
+def test_filters_bound_the_ordering_key():
+    db = DB(dict(LEADS))
+    ids = [lead["id"] for lead in iter_leads(db, "t1", since="2026-01-02", until="2026-01-04", priority="HOT")]
+    assert ids == ["b", "d"]
+
+
+def test_sync_resumes_from_checkpoint_and_re_exports_changed_leads():
+    db = DB({id: dict(data) for id, data in LEADS.items()})
+    ids, result = export(db, sync_name="crm")
+    assert ids == ["a", "b", "c", "d", "e"]
+    assert result["checkpoint"] == {"updated_at": "2026-01-04T10:00", "id": "e"}
+
+    # Nothing new: nothing exported, checkpoint kept
+    assert export(db, sync_name="crm") == ([], {"exported": 0, "checkpoint": result["checkpoint"]})
+
+    # a was re-scored and b merged into after the last sync; f is new
+    db.leads["a"].update(score=80, updated_at="2026-01-05T09:00")
+    db.leads["b"].update(submissions=2, updated_at="2026-01-05T08:00")
+    db.leads["f"] = lead("2026-01-05T10:00")
+    ids, result = export(db, sync_name="crm", fmt="ndjson")
+    assert ids == ["b", "a", "f"]
+    assert db.docs["tenants/t1/sync_checkpoints/crm"]["last_lead"] == {"updated_at": "2026-01-05T10:00", "id": "f"}
+
+
+def test_completed_at_checkpoint_is_carried_over_without_skipping():
+    db = DB({id: dict(data) for id, data in LEADS.items()})
+    db.docs["tenants/t1/sync_checkpoints/crm"] = {"last_lead": {"completed_at": "2026-01-02T10:00", "id": "c"}}
+    db.leads["a"]["updated_at"] = "2026-01-03T00:00"
+
+    ids, _ = export(db, sync_name="crm")
+
+    assert ids == ["a", "d", "e"]
+
+
+def test_csv_export_without_sync_orders_by_completed_at():
+    db = DB(dict(LEADS))
+    out = io.StringIO()
+    result = export_leads(db, "t1", out, fmt="csv", priority="HOT")
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("id,name,email")
+    assert [line.split(",")[0] for line in lines[1:]] == ["b", "d"]
+    assert result["checkpoint"] == {"completed_at": "2026-01-03T10:00", "id": "d"}
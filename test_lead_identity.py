@@ -0,0 +1,142 @@
+from datetime import datetime
+
+from handlers import lead_identity
+from handlers.lead_identity import _group_duplicates, backfill_identities
+
+
+def test_leads_sharing_any_key_are_grouped_transitively():
+    # a-b share a phone, b-c an email: one group even though a and c share nothing
+    groups, owners = _group_duplicates([
+        ("a", ["phone:+5215511111111"]),
+        ("b", ["phone:+5215511111111", "email:b@x.mx"]),
+        ("c", ["email:b@x.mx"]),
+        ("d", ["phone:+525599999999"]),
+    ])
+    assert groups == [["a", "b", "c"]]
+    assert owners == {"phone:+5215511111111": "a", "email:b@x.mx": "a", "phone:+525599999999": "d"}
+
+
+def test_joining_two_groups_keeps_the_oldest_canonical():
+    # c joins {a} and {b}; b's group root must end up under a, not the reverse
+    groups, owners = _group_duplicates([
+        ("a", ["phone:+1"]),
+        ("b", ["email:b@x.mx"]),
+        ("c", ["email:b@x.mx", "phone:+1"]),
+        ("d", ["email:b@x.mx"]),
+    ])
+    assert groups == [["a", "b", "c", "d"]]
+    assert set(owners.values()) == {"a"}
+
+
+def test_no_keys_and_no_duplicates_make_no_groups():
+    assert _group_duplicates([("a", []), ("b", ["phone:+1"]), ("c", [])]) == ([], {"phone:+1": "b"})
+
+
+class Snap:
+    def __init__(self, id, data):
+        self.id, self._data, self.exists = id, data, data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class Ref:
+    def __init__(self, path):
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+
+class Collection:
+    def __init__(self, db, path):
+        self.db, self.path = db, path
+        self.start, self._limit = 0, None
+
+    def document(self, id):
+        return Ref(f"{self.path}/{id}")
+
+    def select(self, fields):
+        return self
+
+    def order_by(self, field):
+        assert field == "__name__", "leads without the field would be skipped"
+        return self
+
+    def _page(self, start, limit):
+        page = Collection(self.db, self.path)
+        page.start, page._limit = start, limit
+        return page
+
+    def start_after(self, snap):
+        ids = sorted(self.db.leads)
+        return self._page(ids.index(snap.id) + 1, self._limit)
+
+    def limit(self, n):
+        return self._page(self.start, n)
+
+    def stream(self):
+        ids = sorted(self.db.leads)[self.start:self.start + self._limit]
+        return [Snap(id, self.db.leads[id]) for id in ids]
+
+
+class Writer:
+    def __init__(self, db):
+        self.db = db
+
+    def set(self, ref, data):
+        self.db.sets[ref.path] = data
+
+    def delete(self, ref):
+        self.db.deleted.append(ref.id)
+
+    def close(self):
+        pass
+
+
+class Tenant:
+    def __init__(self, db, id):
+        self.db, self.id = db, id
+
+    def collection(self, name):
+        return Collection(self.db, f"tenants/{self.id}/{name}")
+
+
+class DB:
+    def __init__(self, leads):
+        self.leads, self.sets, self.deleted = leads, {}, []
+
+    def collection(self, name):
+        assert name == "tenants"
+        return self
+
+    def document(self, id):
+        return Tenant(self, id)
+
+    def get_all(self, refs):
+        return [Snap(ref.id, self.leads.get(ref.id)) for ref in refs]
+
+    def bulk_writer(self):
+        return Writer(self)
+
+
+def test_backfill_pages_by_id_and_includes_leads_without_completed_at(monkeypatch):
+    monkeypatch.setattr(lead_identity, "PAGE_SIZE", 2)
+    leads = {
+        "l1": {"phone": "5511111111", "name": "Ana", "completed_at": datetime(2026, 3, 1)},
+        "l2": {"whatsapp": "5215511111111@s.whatsapp.net", "email": "ana@x.mx"},
+        "l3": {"email": "ANA@x.mx ", "completed_at": datetime(2026, 1, 1)},
+        "l4": {"phone": "5522222222", "completed_at": datetime(2026, 2, 1)},
+        "l5": {"email": "solo@x.mx"},
+    }
+    db = DB(leads)
+
+    stats = backfill_identities(db, "t1")
+
+    assert stats == {"scanned": 5, "groups": 1, "removed": 2, "identities": 4}
+    # l3 is the oldest dated lead of the group; l2 has no date and never wins
+    merged = db.sets["tenants/t1/leads/l3"]
+    assert merged["merged_ids"] == ["l1", "l2"]
+    assert merged["submissions"] == 3
+    assert merged["name"] == "Ana"
+    assert sorted(db.deleted) == ["l1", "l2"]
+    assert db.sets["tenants/t1/lead_identities/email:solo@x.mx"]["lead_id"] == "l5"
+    assert db.sets["tenants/t1/lead_identities/phone:+525511111111"]["lead_id"] == "l3"
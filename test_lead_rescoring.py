@@ -0,0 +1,57 @@
+import random
+
+from handlers.lead_bot import DEFAULT_LEAD_SCORING, calculate_lead_score, get_lead_priority, get_scoring_table
+from handlers.lead_rescoring import score_page
+
+LEADS = [
+    # Every top answer plus both contacts: capped at max_score
+    {"industry": "Salud y Bienestar", "company_size": "Mas de 200 empleados", "budget": "Mas de $2000/mes",
+     "email": "a@x.mx", "phone": "+525511111111"},
+    {"industry": "Tecnologia", "company_size": "11-50 empleados", "budget": "$500 - $2000/mes", "email": "b@x.mx"},
+    {"industry": "Otro", "company_size": "1-10 empleados", "budget": "Menos de $100/mes"},
+    # Unknown, missing and empty answers fall back; empty contacts earn nothing
+    {"industry": "Mineria", "budget": "", "email": "", "phone": None},
+    {},
+]
+
+# Pinned against the per-lead scorer as of the default table
+EXPECTED = [(100, "HOT"), (70, "WARM"), (20, "COLD"), (20, "COLD"), (20, "COLD")]
+
+
+def per_lead(leads, table):
+    scores = [calculate_lead_score(lead, table) for lead in leads]
+    return scores, [get_lead_priority(score, table) for score in scores]
+
+
+def test_score_page_matches_pinned_scores():
+    scores, priorities = score_page(LEADS, get_scoring_table())
+    assert list(zip(scores.tolist(), priorities.tolist())) == EXPECTED
+    assert per_lead(LEADS, DEFAULT_LEAD_SCORING) == ([s for s, _ in EXPECTED], [p for _, p in EXPECTED])
+
+
+def test_score_page_matches_calculate_lead_score_with_tenant_overrides():
+    table = get_scoring_table({"lead_scoring": {
+        "industry": {"Mineria": 40},
+        "fallback": {"budget": 0},
+        "contact_bonus": {"email": 10, "phone": 0},
+        "max_score": 90,
+        "priority_thresholds": {"HOT": 60, "WARM": 30},
+    }})
+    rng = random.Random(35)
+    answers = {field: list(table[field]) + ["desconocido", "", None] for field in ("industry", "company_size", "budget")}
+    leads = []
+    for _ in range(500):
+        lead = {field: rng.choice(options) for field, options in answers.items() if rng.random() < 0.9}
+        for contact in ("email", "phone"):
+            if rng.random() < 0.5:
+                lead[contact] = rng.choice(["x@y.mx", "+525511111111", ""])
+        leads.append(lead)
+
+    scores, priorities = score_page(leads, table)
+
+    assert (scores.tolist(), priorities.tolist()) == per_lead(leads, table)
+
+
+def test_empty_page():
+    scores, priorities = score_page([], get_scoring_table())
+    assert scores.tolist() == [] and priorities.tolist() == []
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from handlers.llm_admission import AdmissionRejected, LLMAdmission
+
+
+def test_tenant_limited_to_plan_slots():
+    async def run():
+        admission = LLMAdmission(capacity=4, max_wait=0.05)
+        assert await admission.acquire("a", plan="free") == 0.0
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("a", plan="free")
+        # Other tenants still get the free capacity
+        assert await admission.acquire("b", plan="free") == 0.0
+        assert admission.metrics()["rejected"] == 1
+
+    asyncio.run(run())
+
+
+def test_override_limit_beats_plan():
+    async def run():
+        admission = LLMAdmission(capacity=4, max_wait=0.05)
+        for _ in range(3):
+            await admission.acquire("a", plan="free", limit=3)
+        assert admission.in_flight == 3
+
+    asyncio.run(run())
+
+
+def test_backlogged_tenants_share_freed_slots_round_robin():
+    async def run():
+        admission = LLMAdmission(capacity=1, max_wait=5.0)
+        await admission.acquire("holder", plan="basic")
+        order = []
+
+        async def call(tenant_id):
+            # Quantum 1: one request per tenant per round
+            await admission.acquire(tenant_id, plan="basic")
+            order.append(tenant_id)
+            admission.release(tenant_id)
+
+        # A floods the queue before B's single request arrives
+        tasks = [asyncio.ensure_future(call("a")) for _ in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(call("b")))
+        await asyncio.sleep(0)
+        assert admission.queue_depth() == 5
+
+        admission.release("holder")
+        await asyncio.gather(*tasks)
+        return order, admission
+
+    order, admission = asyncio.run(run())
+    # FIFO would serve b last
+    assert order.index("b") == 1
+    assert admission.in_flight == 0
+    assert admission.queue_depth() == 0
+
+
+def test_cancelled_waiter_frees_its_place():
+    async def run():
+        admission = LLMAdmission(capacity=1, max_wait=5.0)
+        await admission.acquire("holder")
+        waiter = asyncio.ensure_future(admission.acquire("a"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        admission.release("holder")
+        assert admission.in_flight == 0
+        assert await admission.acquire("b") == 0.0
+
+    asyncio.run(run())
+
+
+def test_plan_metrics_report_backlog_and_deficits():
+    async def run():
+        admission = LLMAdmission(capacity=1, max_wait=5.0)
+        await admission.acquire("holder", plan="basic")
+        waiters = [asyncio.ensure_future(admission.acquire("a", plan="pro")) for _ in range(3)]
+        waiters.append(asyncio.ensure_future(admission.acquire("b", plan="free")))
+        await asyncio.sleep(0)
+        queued = admission.metrics()["plans"]
+
+        # The freed slot goes to a once its deficit covers the cost
+        admission.release("holder")
+        await asyncio.sleep(0)
+        served = admission.metrics()["plans"]
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return queued, served
+
+    queued, served = asyncio.run(run())
+    assert queued["basic"] == {"in_flight": 1, "queued": 0, "backlogged_tenants": 0, "deficit": 0.0}
+    assert queued["pro"]["queued"] == 3 and queued["free"]["queued"] == 1
+    assert served["basic"]["in_flight"] == 0
+    assert served["pro"] == {"in_flight": 1, "queued": 2, "backlogged_tenants": 1, "deficit": 1.0}
+    assert served["free"] == {"in_flight": 0, "queued": 1, "backlogged_tenants": 1, "deficit": 1.0}
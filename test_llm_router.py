@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from handlers.llm_router import CIRCUIT_FAILURES, ProviderError, ProviderRouter
+
+MESSAGES = [{"role": "user", "content": "hola"}]
+
+
+def reply(text):
+    return {"choices": [{"message": {"content": text}}], "usage": {"total_tokens": 3}}
+
+
+class Transport:
+    """Answers per provider from `responses`: a dict is returned, an exception raised"""
+
+    def __init__(self, responses, delays=None):
+        self.responses = responses
+        self.delays = delays or {}
+        self.calls = []
+
+    async def __call__(self, provider, model, messages, timeout, **params):
+        self.calls.append(provider.name)
+        await asyncio.sleep(self.delays.get(provider.name, 0))
+        response = self.responses[provider.name]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def complete(router, **kwargs):
+    return asyncio.run(router.complete(MESSAGES, preferred=["ark", "openai"], **kwargs))
+
+
+def test_error_fails_over_to_next_provider():
+    transport = Transport({"ark": RuntimeError("502"), "openai": reply("hola!")})
+    router = ProviderRouter(transport=transport)
+
+    completion = complete(router)
+
+    assert (completion.content, completion.provider) == ("hola!", "openai")
+    assert completion.failover and not completion.hedged
+    assert transport.calls == ["ark", "openai"]
+    assert router.stats["ark"].error_rate() == 1.0
+
+
+@pytest.mark.parametrize("malformed", [
+    {"choices": []},
+    {"choices": [{"message": {"content": None}}]},
+    ["not", "a", "completion"],
+    "upstream proxy error",
+])
+def test_malformed_response_is_a_provider_failure(malformed):
+    router = ProviderRouter(transport=Transport({"ark": malformed, "openai": reply("ok")}))
+    assert complete(router).provider == "openai"
+    assert router.consecutive_failures["ark"] == 1
+
+    router = ProviderRouter(transport=Transport({"ark": malformed, "openai": malformed}))
+    with pytest.raises(ProviderError, match="Malformed"):
+        complete(router)
+
+
+def test_slow_provider_is_hedged():
+    transport = Transport({"ark": reply("slow"), "openai": reply("fast")}, delays={"ark": 1.0})
+    router = ProviderRouter(transport=transport)
+    router.hedge_delay = lambda name: 0.05
+
+    completion = complete(router)
+
+    assert completion.provider == "openai" and completion.hedged
+
+
+def test_circuit_opens_after_consecutive_failures_and_closes_on_success():
+    transport = Transport({"ark": RuntimeError("down"), "openai": reply("ok")})
+    router = ProviderRouter(transport=transport)
+
+    for _ in range(CIRCUIT_FAILURES):
+        assert router.candidates(["ark", "openai"])[0] == "ark"
+        complete(router)
+    assert router.circuit_open("ark")
+
+    # Open: the healthy provider is tried first and ark is not called at all
+    transport.calls.clear()
+    assert router.candidates(["ark", "openai"]) == ["openai", "ark"]
+    assert complete(router).provider == "openai"
+    assert transport.calls == ["openai"]
+
+    # Still the last resort when everything else fails
+    transport.responses["openai"] = RuntimeError("down too")
+    transport.responses["ark"] = reply("back")
+    assert complete(router).provider == "ark"
+    assert not router.circuit_open("ark")
+    assert router.consecutive_failures["ark"] == 0
+
+
+def test_circuit_half_opens_after_cooldown():
+    router = ProviderRouter(transport=Transport({"ark": RuntimeError("down"), "openai": reply("ok")}))
+    for _ in range(CIRCUIT_FAILURES):
+        complete(router)
+    until = router.open_until["ark"]
+    assert router.circuit_open("ark", now=until - 0.1)
+    assert not router.circuit_open("ark", now=until)
+
+    # Cooldown over: ark is tried first again, and one more failure reopens it
+    router.open_until["ark"] = time.monotonic() - 1
+    assert router.candidates(["ark", "openai"])[0] == "ark"
+    complete(router)
+    assert router.circuit_open("ark")
@@ -0,0 +1,101 @@
+import pytest
+
+from handlers import load_shedder as bots_shedder
+from handlers.load_shedder import COOLDOWN_SECONDS, THRESHOLDS, LoadShedder
+from modal_backend.common.load_shedder import LoadShedder as ArkLoadShedder
+from shared.load_shedding import ShedSwitch
+
+
+class FakeProviders:
+    def __init__(self):
+        self.recent = []
+
+
+class FakeAdmission:
+    def __init__(self):
+        self.depth = 0
+
+    def queue_depth(self):
+        return self.depth
+
+
+@pytest.fixture
+def shedder(monkeypatch):
+    # No probes, so should_shed reflects the switch state
+    monkeypatch.setattr(bots_shedder, "PROBE_RATE", 0.0)
+    return LoadShedder(providers=FakeProviders(), admission=FakeAdmission())
+
+
+def test_switch_enters_at_enter_threshold_and_ignores_missing_signals():
+    switch = ShedSwitch({"depth": {"enter": 10, "exit": 2}}, cooldown=5.0)
+    assert not switch.update({}, 0.0)
+    assert not switch.update({"depth": 9}, 1.0)
+    assert switch.update({"depth": 10}, 2.0)
+    assert switch.reason == "depth"
+    assert switch.transitions == 1
+
+
+def test_shedding_enters_on_queue_depth(shedder):
+    assert not shedder.should_shed()
+    shedder.admission.depth = THRESHOLDS["queue_depth"]["enter"]
+    assert shedder.should_shed()
+    assert shedder.reason == "queue_depth"
+    assert shedder.metrics()["shed"] == 1
+
+
+def test_shedding_holds_between_thresholds_and_exits_after_cooldown(shedder):
+    shedder.admission.depth = THRESHOLDS["queue_depth"]["enter"]
+    shedder._update(100.0)
+    assert shedder.shedding
+
+    # Below enter but above exit: still shedding, however long it lasts
+    shedder.admission.depth = THRESHOLDS["queue_depth"]["exit"] + 1
+    shedder._update(100.0 + COOLDOWN_SECONDS * 2)
+    assert shedder.shedding
+
+    # At the exit threshold the cooldown starts; a relapse restarts it
+    shedder.admission.depth = THRESHOLDS["queue_depth"]["exit"]
+    shedder._update(200.0)
+    shedder.admission.depth = THRESHOLDS["queue_depth"]["exit"] + 1
+    shedder._update(210.0)
+    shedder.admission.depth = 0
+    shedder._update(220.0)
+    shedder._update(220.0 + COOLDOWN_SECONDS - 1)
+    assert shedder.shedding
+    shedder._update(220.0 + COOLDOWN_SECONDS)
+    assert not shedder.shedding
+    assert shedder.switch.transitions == 2
+
+
+def test_error_rate_needs_enough_samples(shedder):
+    shedder.providers.recent = [(100.0, 0.1, False)] * 5
+    shedder._update(100.0)
+    assert not shedder.shedding
+    shedder.providers.recent = [(100.0, 0.1, False)] * 10
+    shedder._update(100.0)
+    assert shedder.shedding
+    assert shedder.reason == "error_rate"
+
+
+def test_ark_shedder_tracks_in_flight_and_failures(monkeypatch):
+    monkeypatch.setattr("modal_backend.common.load_shedder.PROBE_RATE", 0.0)
+    shedder = ArkLoadShedder(thresholds={
+        "in_flight": {"enter": 2, "exit": 0},
+        "error_rate": {"enter": 0.5, "exit": 0.2},
+        "p95_ms": {"enter": 8000, "exit": 4000},
+    }, cooldown=1.0)
+
+    with shedder.track(), shedder.track():
+        assert shedder.signals()["in_flight"] == 2
+        assert shedder.should_shed(now=10.0)
+    assert shedder.in_flight == 0
+
+    with pytest.raises(RuntimeError):
+        with shedder.track():
+            raise RuntimeError("ark down")
+    assert shedder.recent[-1][2] is False
+
+    # Idle again: exits once the cooldown has passed
+    assert shedder.should_shed(now=11.0)
+    assert not shedder.should_shed(now=12.0)
+    assert shedder.metrics()["transitions"] == 2
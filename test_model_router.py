@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from handlers import llm_router, model_router
+from handlers.llm_router import ProviderError, ProviderRouter, StandInTransport
+from handlers.model_router import ModelRouter, Policy
+
+MINI = "gpt-4o-mini"
+GPT4O = "gpt-4o"
+DEEPSEEK = "deepseek-v3-2-251201"
+
+MESSAGES = [{"role": "user", "content": "hola"}]
+
+
+@pytest.fixture(autouse=True)
+def no_exploration(monkeypatch):
+    monkeypatch.setattr(model_router, "EXPLORE_RATE", 0.0)
+
+
+def make_routers(profiles):
+    """Provider and model routers over stand-in models: {model: (mean latency s, error rate)}"""
+    providers = ProviderRouter(transport=StandInTransport(profiles))
+    return providers, ModelRouter(providers=providers)
+
+
+def warm_up(providers, samples=25):
+    """Send enough stand-in traffic to every profiled model for its p95 to count"""
+    async def _one(model):
+        provider = model_router.MODELS[model].provider
+        try:
+            await providers.complete(MESSAGES, preferred=[provider], allowed=[provider],
+                                     models={provider: model}, hedge=False, timeout=2.0)
+        except ProviderError:
+            pass
+
+    async def _all():
+        await asyncio.gather(*(_one(model) for model in providers.transport.profiles for _ in range(samples)))
+
+    asyncio.run(_all())
+
+
+def test_cheapest_picks_cheapest_model_within_slo():
+    # deepseek is the cheapest per call but misses the SLO
+    providers, router = make_routers({MINI: (0.05, 0.0), GPT4O: (0.01, 0.0), DEEPSEEK: (0.4, 0.0)})
+    warm_up(providers)
+
+    decision = router.choose({"policy": Policy.CHEAPEST, "latency_slo_ms": 150}, default_model=MINI)
+
+    assert decision.model == MINI
+    assert decision.reason == "cheapest_within_slo"
+    assert list(decision.ranked) == [MINI, GPT4O, DEEPSEEK]
+
+
+def test_cheapest_falls_back_to_fastest_when_nothing_meets_slo():
+    providers, router = make_routers({MINI: (0.05, 0.0), GPT4O: (0.01, 0.0), DEEPSEEK: (0.4, 0.0)})
+    warm_up(providers)
+
+    decision = router.choose({"policy": Policy.CHEAPEST, "latency_slo_ms": 1}, default_model=MINI)
+
+    assert decision.model == GPT4O
+    assert decision.reason == "none_within_slo_fastest"
+
+
+def test_fastest_picks_lowest_p95():
+    providers, router = make_routers({MINI: (0.05, 0.0), GPT4O: (0.01, 0.0), DEEPSEEK: (0.4, 0.0)})
+    warm_up(providers)
+
+    decision = router.choose({"policy": Policy.FASTEST}, default_model=MINI)
+
+    assert decision.model == GPT4O
+    assert decision.reason == "lowest_p95"
+    assert decision.p95_ms < 50
+
+
+def test_fixed_keeps_configured_model_even_if_slow():
+    providers, router = make_routers({MINI: (0.01, 0.0), GPT4O: (0.01, 0.0), DEEPSEEK: (0.4, 0.0)})
+    warm_up(providers)
+
+    decision = router.choose({"policy": Policy.FIXED, "model": DEEPSEEK}, default_model=MINI)
+
+    assert decision.model == DEEPSEEK
+    assert decision.provider == "ark"
+    assert decision.reason == "fixed"
+    # The best model of the other provider backs it up
+    assert decision.provider_models() == {"ark": DEEPSEEK, "openai": MINI}
+
+
+def test_fixed_model_of_disallowed_provider_is_replaced():
+    providers, router = make_routers({MINI: (0.01, 0.0), GPT4O: (0.01, 0.0), DEEPSEEK: (0.01, 0.0)})
+
+    decision = router.choose({"policy": Policy.FIXED, "model": DEEPSEEK}, default_model=MINI, allowed=["openai"])
+
+    assert decision.reason == "fixed_unavailable"
+    assert decision.provider == "openai"
+    assert DEEPSEEK not in decision.ranked
+
+
+def test_error_rate_demotes_model():
+    # The fastest model fails every call
+    providers, router = make_routers({MINI: (0.05, 0.0), GPT4O: (0.01, 1.0), DEEPSEEK: (0.4, 0.0)})
+    warm_up(providers)
+
+    decision = router.choose({"policy": Policy.FASTEST}, default_model=MINI)
+
+    assert decision.model == MINI
+    assert list(decision.ranked)[-1] == GPT4O
+    assert providers.model_stats[GPT4O].error_rate() == 1.0
+
+
+def test_slow_provider_is_hedged(monkeypatch):
+    monkeypatch.setattr(llm_router, "DEFAULT_HEDGE_DELAY", 0.05)
+    providers = ProviderRouter(transport=StandInTransport({GPT4O: (0.5, 0.0), DEEPSEEK: (0.01, 0.0)}))
+
+    result = asyncio.run(providers.complete(
+        MESSAGES, preferred=["openai", "ark"], models={"openai": GPT4O, "ark": DEEPSEEK}, timeout=2.0
+    ))
+
+    assert result.provider == "ark"
+    assert result.hedged and not result.failover
+    # The losing attempt was cancelled, not counted as an error
+    assert providers.stats["openai"].error_rate() == 0.0
+
+
+def test_failing_provider_fails_over():
+    providers = ProviderRouter(transport=StandInTransport({GPT4O: (0.01, 1.0), DEEPSEEK: (0.01, 0.0)}))
+
+    result = asyncio.run(providers.complete(
+        MESSAGES, preferred=["openai", "ark"], models={"openai": GPT4O, "ark": DEEPSEEK}, timeout=2.0
+    ))
+
+    assert result.provider == "ark"
+    assert result.failover and not result.hedged
+    assert providers.stats["openai"].error_rate() == 1.0
+
+
+def test_every_provider_failing_raises():
+    providers = ProviderRouter(transport=StandInTransport(default=(0.01, 1.0)))
+
+    with pytest.raises(ProviderError):
+        asyncio.run(providers.complete(MESSAGES, timeout=2.0))
@@ -0,0 +1,102 @@
+import asyncio
+import os
+
+from handlers import outbound_queue
+from handlers.outbound_queue import OutboundQueue, TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeClient:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.posts = []
+
+    async def post(self, url, json=None, timeout=None):
+        self.posts.append((url, json))
+        return FakeResponse(self.status_code)
+
+    async def aclose(self):
+        pass
+
+
+def message(i, tenant="t1"):
+    return {"tenant_id": tenant, "to": f"+5210000000{i}", "text": f"recordatorio {i}"}
+
+
+def fast_queue(spool, **kwargs):
+    return OutboundQueue(spool_dir=str(spool), rate=1000, burst=100, jitter=0, gateway_rate=1000, **kwargs)
+
+
+async def drain(queue):
+    await asyncio.gather(*queue._workers.values())
+
+
+def test_token_bucket_spends_burst_then_paces():
+    bucket = TokenBucket(rate=2.0, burst=3)
+    assert [bucket.try_take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = bucket.try_take()
+    assert 0.4 < wait <= 0.5
+    # Half a second later one token has refilled
+    bucket.updated -= 0.5
+    assert bucket.try_take() == 0.0
+
+
+def test_each_message_is_claimed_by_one_consumer_and_removed_once_sent(tmp_path):
+    delivered = []
+
+    async def run():
+        first = fast_queue(tmp_path, on_delivered=delivered.append)
+        second = fast_queue(tmp_path)
+        first._client = second._client = FakeClient()
+        for i in range(3):
+            first.enqueue(message(i))
+        assert first.metrics()["spool"]["pending"] == 3
+        claimed = first.claim(), second.claim()
+        await drain(first)
+        return first, claimed
+
+    queue, claimed = asyncio.run(run())
+    assert claimed == (3, 0)
+    assert sorted(m["text"] for m in delivered) == ["recordatorio 0", "recordatorio 1", "recordatorio 2"]
+    assert queue.metrics()["spool"] == {"pending": 0, "claimed": 0, "dead": 0}
+    assert queue.counters["sent"] == 3
+
+
+def test_failing_message_is_dead_lettered_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbound_queue, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(outbound_queue, "RETRY_BACKOFF_SEC", 0.0)
+    dead = []
+
+    async def run():
+        queue = fast_queue(tmp_path, on_dead=dead.append)
+        queue._client = FakeClient(status_code=500)
+        queue.enqueue(message(0))
+        queue.claim()
+        await drain(queue)
+        return queue
+
+    queue = asyncio.run(run())
+    assert len(queue._client.posts) == 2
+    assert [m["text"] for m in dead] == ["recordatorio 0"]
+    assert queue.metrics()["spool"] == {"pending": 0, "claimed": 0, "dead": 1}
+    assert queue.counters["retried"] == 1 and queue.counters["dead"] == 1
+
+
+def test_claims_of_a_dead_consumer_return_to_pending(tmp_path):
+    crashed = fast_queue(tmp_path, worker_id="crashed")
+    record_id = crashed.enqueue(message(0))
+    crashed.heartbeat()
+    os.replace(os.path.join(crashed.pending_dir, f"{record_id}.json"), crashed._claimed_path(record_id))
+    survivor = fast_queue(tmp_path)
+    # Lease still fresh: nothing to reclaim
+    assert survivor.reclaim_stale() == 0
+    assert survivor.metrics()["spool"]["claimed"] == 1
+
+    crashed._write(os.path.join(crashed.claimed_dir, "lease"), {"worker": "crashed", "at": 0})
+    assert survivor.reclaim_stale() == 1
+    assert survivor.metrics()["spool"] == {"pending": 1, "claimed": 0, "dead": 0}
+    assert not os.path.exists(crashed.claimed_dir)
@@ -0,0 +1,151 @@
+import asyncio
+import sys
+import types
+from datetime import datetime, timedelta
+
+import pytest
+
+from handlers import platform_rollup
+from handlers.platform_rollup import run_platform_rollup, stale_days
+
+NOW = datetime(2026, 5, 20, 12, 0)
+UNTIL = NOW - platform_rollup.SETTLE_DELAY
+DELETE_FIELD = object()
+FAILED_PRECONDITION = 9
+
+
+@pytest.fixture(autouse=True)
+def firestore_modules(monkeypatch):
+    """The google modules the pruning imports, reduced to the names it uses"""
+    class FieldPath:
+        def __init__(self, *parts):
+            self.parts = parts
+
+        def to_api_repr(self):
+            return ".".join(f"`{part}`" if part[0].isdigit() else part for part in self.parts)
+
+    firestore = types.SimpleNamespace(DELETE_FIELD=DELETE_FIELD, FieldPath=FieldPath)
+    code_pb2 = types.SimpleNamespace(FAILED_PRECONDITION=FAILED_PRECONDITION)
+    monkeypatch.setitem(sys.modules, "google", types.SimpleNamespace())
+    monkeypatch.setitem(sys.modules, "google.cloud", types.SimpleNamespace(firestore=firestore))
+    monkeypatch.setitem(sys.modules, "google.rpc", types.SimpleNamespace(code_pb2=code_pb2))
+
+
+def test_stale_days_are_old_and_already_merged():
+    written = {
+        "20260501": UNTIL - timedelta(days=19),
+        # Old day flushed late, after this window: not merged yet, kept
+        "20260502": UNTIL + timedelta(seconds=1),
+        "20260512": UNTIL - timedelta(days=8),
+        "20260513": UNTIL - timedelta(days=7),
+        "20260520": UNTIL,
+    }
+    assert stale_days(written, UNTIL) == ["20260501", "20260512"]
+    assert stale_days(written, UNTIL, retention_days=30) == []
+
+
+class Snap:
+    def __init__(self, id, data):
+        self.id, self._data = id, data
+        self.reference = types.SimpleNamespace(path=f"analytics_activity/{id}")
+        self.update_time = f"t-{id}"
+        self.exists = True
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class Query:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def where(self, *args):
+        return self
+
+    def select(self, fields):
+        return self
+
+    def stream(self):
+        return iter(self.docs)
+
+
+class Writer:
+    def __init__(self):
+        self.updates = []
+
+    def on_write_error(self, callback):
+        self.on_error = callback
+
+    def update(self, ref, data, option=None):
+        self.updates.append((ref.path, data, option))
+
+    def close(self):
+        pass
+
+
+class DB:
+    def __init__(self, activity, watermark):
+        self.activity, self.watermark = activity, watermark
+        self.writer = Writer()
+        self.set_watermark = None
+
+    def collection(self, name):
+        if name == "analytics_activity":
+            return Query(self.activity)
+        return self
+
+    def document(self, name):
+        assert name == "_watermark"
+        return self
+
+    def get(self):
+        return Snap("_watermark", {"processed_until": self.watermark})
+
+    def set(self, data):
+        self.set_watermark = data
+
+    def bulk_writer(self):
+        return self.writer
+
+    def write_option(self, **kwargs):
+        return kwargs
+
+
+def test_rollup_prunes_merged_flags_outside_retention(monkeypatch):
+    merged = []
+    monkeypatch.setattr(platform_rollup, "rollup_tenant_day", lambda db, tenant, day: merged.append((tenant, day)) or True)
+    since = UNTIL - timedelta(minutes=10)
+    db = DB([
+        Snap("t1", {"tenant_id": "t1", "days": {
+            "20260401": since - timedelta(days=49), "20260520": UNTIL - timedelta(minutes=1)
+        }}),
+        Snap("t2", {"tenant_id": "t2", "days": {"20260519": UNTIL - timedelta(minutes=2)}}),
+    ], watermark=since)
+
+    stats = asyncio.run(run_platform_rollup(db, now=NOW))
+
+    assert sorted(merged) == [("t1", "20260520"), ("t2", "20260519")]
+    assert stats["pruned"] == 1
+    assert db.writer.updates == [
+        ("analytics_activity/t1", {"days.`20260401`": DELETE_FIELD}, {"last_update_time": "t-t1"})
+    ]
+    # Flagged again since the read: skipped, not retried; other failures are retried
+    assert not db.writer.on_error(types.SimpleNamespace(code=FAILED_PRECONDITION, attempts=1))
+    assert db.writer.on_error(types.SimpleNamespace(code=14, attempts=1))
+    assert not db.writer.on_error(types.SimpleNamespace(code=14, attempts=platform_rollup.WRITE_ATTEMPTS))
+
+
+def test_failed_merge_keeps_flags(monkeypatch):
+    def fail(db, tenant, day):
+        raise RuntimeError("unavailable")
+
+    monkeypatch.setattr(platform_rollup, "rollup_tenant_day", fail)
+    since = UNTIL - timedelta(minutes=10)
+    db = DB([Snap("t1", {"tenant_id": "t1", "days": {
+        "20260401": since - timedelta(days=49), "20260520": UNTIL - timedelta(minutes=1)
+    }})], watermark=since)
+
+    stats = asyncio.run(run_platform_rollup(db, now=NOW))
+
+    assert stats["errors"] == 1 and stats["pruned"] == 0
+    assert db.writer.updates == [] and db.set_watermark is None
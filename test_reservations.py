@@ -0,0 +1,152 @@
+import sys
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from handlers.reservations import (
+    ClaimStatus, _claim_ids, _is_taken, book_slot, cancel_appointment, hold_slot
+)
+
+SLOT = 30
+NOW = datetime(2026, 5, 4, 12, 0)
+
+
+@pytest.fixture(autouse=True)
+def firestore_module(monkeypatch):
+    """Transactions run the function once against the in-memory store"""
+    firestore = types.SimpleNamespace(transactional=lambda fn: fn)
+    monkeypatch.setitem(sys.modules, "google", types.SimpleNamespace())
+    monkeypatch.setitem(sys.modules, "google.cloud", types.SimpleNamespace(firestore=firestore))
+
+
+def test_claim_ids_cover_every_slot_of_the_duration():
+    assert _claim_ids("2026-05-04", "10:30", "Ana María", 45, SLOT) == [
+        "2026-05-04_ana-mar-a_1030", "2026-05-04_ana-mar-a_1100"
+    ]
+    assert _claim_ids("2026-05-04", "10:30", "!!", 1, SLOT) == ["2026-05-04_staff_1030"]
+
+
+def test_overlapping_bookings_share_a_claim_and_adjacent_ones_do_not():
+    long = set(_claim_ids("2026-05-04", "10:00", "Ana", 60, SLOT))
+    assert long & set(_claim_ids("2026-05-04", "10:30", "Ana", 30, SLOT))
+    assert not long & set(_claim_ids("2026-05-04", "11:00", "Ana", 30, SLOT))
+    assert not long & set(_claim_ids("2026-05-04", "10:00", "Luis", 60, SLOT))
+    assert not long & set(_claim_ids("2026-05-05", "10:00", "Ana", 60, SLOT))
+
+
+@pytest.mark.parametrize("claim, taken", [
+    (None, False),
+    ({"status": ClaimStatus.BOOKED, "holder": "+521"}, True),
+    ({"status": ClaimStatus.HELD, "holder": "+521", "expires_at": NOW + timedelta(minutes=5)}, False),
+    ({"status": ClaimStatus.HELD, "holder": "+522", "expires_at": NOW + timedelta(minutes=5)}, True),
+    # Expiry is exclusive: a hold expiring now no longer blocks
+    ({"status": ClaimStatus.HELD, "holder": "+522", "expires_at": NOW}, False),
+    ({"status": ClaimStatus.HELD, "holder": "+522", "expires_at": (NOW + timedelta(seconds=1)).replace(tzinfo=timezone.utc)}, True),
+    ({"status": ClaimStatus.HELD, "holder": "+522", "expires_at": None}, False),
+])
+def test_is_taken(claim, taken):
+    assert _is_taken(claim, "+521", NOW) is taken
+
+
+class Snap:
+    def __init__(self, ref, data):
+        self.reference, self.id = ref, ref.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class Ref:
+    def __init__(self, db, path):
+        self.db, self.path = db, path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return Ref(self.db, f"{self.path}/{name}")
+
+    def document(self, id=None):
+        self.db.ids += 1
+        return Ref(self.db, f"{self.path}/{id or f'auto{self.db.ids}'}")
+
+    def get(self, transaction=None):
+        return Snap(self, self.db.docs.get(self.path))
+
+
+class Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def set(self, ref, data):
+        self.db.docs[ref.path] = dict(data)
+
+    def update(self, ref, data):
+        self.db.docs[ref.path].update(data)
+
+    def delete(self, ref):
+        self.db.docs.pop(ref.path, None)
+
+
+class DB:
+    def __init__(self):
+        self.docs, self.ids = {}, 0
+
+    def collection(self, name):
+        return Ref(self, name)
+
+    def get_all(self, refs, transaction=None):
+        return [ref.get() for ref in refs]
+
+    def transaction(self):
+        return Transaction(self)
+
+    def claims(self):
+        return {path.rsplit("/", 1)[-1]: doc for path, doc in self.docs.items() if "/slot_claims/" in path}
+
+
+def slot(time="10:00", staff="Ana", duration=60):
+    return {"date": "2026-05-04", "time": time, "staff": staff, "duration_min": duration}
+
+
+def test_hold_blocks_overlaps_until_it_expires():
+    db = DB()
+    assert hold_slot(db, "t1", slot(), "+521", SLOT)
+    assert not hold_slot(db, "t1", slot("10:30", duration=30), "+522", SLOT)
+    # Refreshing one's own hold is fine; another staff is independent
+    assert hold_slot(db, "t1", slot(), "+521", SLOT)
+    assert hold_slot(db, "t1", slot(staff="Luis"), "+522", SLOT)
+
+    for claim in db.claims().values():
+        claim["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+    assert hold_slot(db, "t1", slot("10:30", duration=30), "+522", SLOT)
+
+
+def test_booking_needs_every_slot_and_blocks_the_holder_too():
+    db = DB()
+    assert hold_slot(db, "t1", slot("10:30", duration=30), "+522", SLOT)
+    assert book_slot(db, "t1", slot(), "+521", SLOT) is None
+
+    apt_id = book_slot(db, "t1", slot("11:00"), "+521", SLOT)
+    assert apt_id is not None
+    assert {claim["status"] for claim in db.claims().values() if claim["holder"] == "+521"} == {ClaimStatus.BOOKED}
+    assert not hold_slot(db, "t1", slot("11:30", duration=30), "+521", SLOT)
+
+
+def test_cancellation_releases_only_its_own_claims():
+    db = DB()
+    first = book_slot(db, "t1", slot(), "+521", SLOT)
+    assert cancel_appointment(db, "t1", first, SLOT)["time"] == "10:00"
+    assert db.claims() == {}
+    assert cancel_appointment(db, "t1", first, SLOT) is None
+
+    # The freed slot is rebooked; a stale cancellation of another appointment
+    # covering it must not free the new booking's claims
+    second = book_slot(db, "t1", slot("10:30", duration=30), "+522", SLOT)
+    stale = book_slot(db, "t1", slot("09:00", duration=30), "+523", SLOT)
+    db.docs[f"tenants/t1/appointments/{stale}"].update(time="10:00", duration_min=60)
+    cancel_appointment(db, "t1", stale, SLOT)
+    assert db.claims()["2026-05-04_ana_1030"]["appointment_id"] == second
+    assert not hold_slot(db, "t1", slot("10:30", duration=30), "+521", SLOT)
+    assert cancel_appointment(db, "t1", "missing", SLOT) is None
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from handlers.single_flight import SingleFlight, request_key
+
+
+def test_request_key_ignores_param_order():
+    messages = [{"role": "user", "content": "hola"}]
+    assert request_key("m", messages, temperature=0.7, max_tokens=300) == \
+        request_key("m", messages, max_tokens=300, temperature=0.7)
+    assert request_key("m", messages) != request_key("other", messages)
+
+
+def test_concurrent_callers_share_one_call():
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return "respuesta"
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        return flight, results
+
+    flight, results = asyncio.run(run())
+    assert calls == 1
+    assert [coalesced for _, coalesced in results].count(False) == 1
+    assert all(result == "respuesta" for result, _ in results)
+    assert flight.in_flight() == 0
+    assert flight.stats["coalesced"] == 4
+
+
+def test_error_is_shared_and_key_freed():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream")
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.in_flight() == 0
+
+
+def test_late_joiner_only_waits_for_remaining_deadline():
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def run():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("k", hang, timeout=0.1))
+        await asyncio.sleep(0.05)
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", hang, timeout=5.0)
+        waited = asyncio.get_running_loop().time() - started
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        return flight, waited
+
+    flight, waited = asyncio.run(run())
+    assert waited < 1.0
+    assert flight.in_flight() == 0
+    assert flight.stats["timeouts"] == 2
+
+
+def test_shared_call_cancelled_with_its_last_waiter():
+    async def run():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flight.do("k", slow)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        callers[0].cancel()
+        await asyncio.sleep(0.01)
+        # One caller is still waiting, so the call keeps running
+        assert not cancelled.is_set()
+        callers[1].cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1.0)
+        return flight
+
+    flight = asyncio.run(run())
+    assert flight.in_flight() == 0
+    assert flight.stats["cancelled"] == 1
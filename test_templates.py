@@ -0,0 +1,51 @@
+from string import Formatter
+
+from templates import MISSING_VALUE, TemplateSet, Templates, compile_template, format_template, get_templates, render_many
+
+
+def template_names():
+    return [name for name in vars(Templates) if name.isupper() and isinstance(getattr(Templates, name), str)]
+
+
+def sample_values(template):
+    return {field: f"<{field}>" for _, field, _, _ in Formatter().parse(template) if field}
+
+
+def test_compiled_templates_match_str_format():
+    for name in template_names():
+        template = getattr(Templates, name)
+        values = sample_values(template)
+        assert compile_template(template)(values) == template.format(**values), name
+
+
+def test_format_spec_is_applied():
+    assert format_template("Total: {amount:.2f}", amount=12.5) == "Total: 12.50"
+    # A spec that does not fit the value falls back to str()
+    assert format_template("Total: {amount:.2f}", amount="doce") == "Total: doce"
+
+
+def test_missing_fields_are_filled():
+    assert format_template("Hola {name}, tu cita es el {date}", name="Ana") == f"Hola Ana, tu cita es el {MISSING_VALUE}"
+
+
+def test_attribute_and_index_lookups_are_not_evaluated():
+    rendered = format_template("{name.__class__} {items[0]}", name="Ana", items=["x"])
+    assert rendered == f"{MISSING_VALUE} {MISSING_VALUE}"
+
+
+def test_render_many_matches_single_renders():
+    template = "Hola {name}, te esperamos a las {time}"
+    rows = [{"name": "Ana", "time": "10:00"}, {"name": "Luis"}]
+    assert render_many(template, rows) == [format_template(template, **row) for row in rows]
+
+
+def test_tenant_overrides_follow_version():
+    config = {"settings": {"templates": {"GOODBYE": "Chao {name}"}, "templates_version": 1}}
+    first = get_templates("t", "s", config)
+    assert first.render("GOODBYE", name="Ana") == "Chao Ana"
+    assert get_templates("t", "s", config) is first
+
+    config["settings"] = {"templates": {"GOODBYE": "Adios {name}"}, "templates_version": 2}
+    assert get_templates("t", "s", config).render("GOODBYE", name="Ana") == "Adios Ana"
+    # Templates not overridden come from the defaults
+    assert TemplateSet({"GOODBYE": "x"}).render("ERROR_GENERIC") == Templates.ERROR_GENERIC
@@ -0,0 +1,108 @@
+import asyncio
+
+from handlers import work_scheduler
+from handlers.runtime_metrics import interactive_load
+from handlers.work_scheduler import BulkGovernor, Tier, WorkScheduler
+
+
+def test_interactive_gets_weighted_share_under_contention():
+    async def run():
+        scheduler = WorkScheduler(capacity=1)
+        order = []
+        gate = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot(Tier.INTERACTIVE):
+                await gate.wait()
+
+        async def work(tier):
+            async with scheduler.slot(tier):
+                order.append(tier)
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        # Bulk queued first, yet interactive is served 8:1 once saturated
+        waiters = [asyncio.ensure_future(work(Tier.BULK)) for _ in range(4)]
+        waiters += [asyncio.ensure_future(work(Tier.INTERACTIVE)) for _ in range(16)]
+        await asyncio.sleep(0)
+        metrics = scheduler.metrics()
+        gate.set()
+        await asyncio.gather(holder, *waiters)
+        return order, metrics
+
+    order, metrics = asyncio.run(run())
+    assert metrics["tiers"][Tier.BULK]["queued"] == 4
+    assert metrics["tiers"][Tier.INTERACTIVE]["queued"] == 16
+    assert order[:9].count(Tier.BULK) == 1
+    # Bulk is slowed, not starved
+    assert order.index(Tier.BULK) < 9
+    assert order.count(Tier.BULK) == 4
+
+
+def test_bulk_uses_idle_capacity():
+    async def run():
+        scheduler = WorkScheduler(capacity=3)
+        running = peak = 0
+
+        async def work():
+            nonlocal running, peak
+            async with scheduler.slot(Tier.BULK):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(work() for _ in range(6)))
+        return scheduler, peak
+
+    scheduler, peak = asyncio.run(run())
+    assert peak == 3
+    assert scheduler.metrics()["tiers"][Tier.BULK]["completed"] == 6
+
+
+def test_governor_shrinks_bulk_while_interactive_is_busy(monkeypatch):
+    monkeypatch.setattr(work_scheduler, "BULK_YIELD_PAUSE", 0.0)
+    load = {"value": 0.9}
+    scheduler = WorkScheduler(capacity=16)
+    governor = BulkGovernor(lambda: load["value"], scheduler=scheduler, capacity=4, refresh=0.0)
+    assert scheduler.capacity == 4
+
+    governor.pace()
+    assert governor.yielding
+    assert scheduler.capacity == 1
+
+    load["value"] = 0.2
+    governor.pace()
+    assert not governor.yielding
+    assert scheduler.capacity == 4
+
+
+def test_governor_keeps_last_decision_when_load_is_unknown(monkeypatch):
+    monkeypatch.setattr(work_scheduler, "BULK_YIELD_PAUSE", 0.0)
+    readings = iter([0.9])
+
+    def load():
+        return next(readings)
+
+    scheduler = WorkScheduler()
+    governor = BulkGovernor(load, scheduler=scheduler, capacity=4, refresh=0.0)
+
+    async def run():
+        async with governor.slot() as waited:
+            assert waited >= 0
+        async with governor.slot():
+            pass
+
+    asyncio.run(run())
+    assert governor.yielding
+    assert scheduler.capacity == 1
+    assert scheduler.metrics()["tiers"][Tier.BULK]["completed"] == 2
+
+
+def test_interactive_load_is_busiest_container():
+    def snapshot(in_flight, queued, capacity=16):
+        return {"scheduler": {"capacity": capacity, "tiers": {Tier.INTERACTIVE: {"in_flight": in_flight, "queued": queued}}}}
+
+    assert interactive_load([]) == 0.0
+    assert interactive_load([snapshot(4, 0), snapshot(16, 8)]) == 1.5
+    assert interactive_load([snapshot(2, 0, capacity=4), {}]) == 0.5